@@ -4,10 +4,55 @@ Create minimal eval (60) and train (200-1k) datasets from Luanti collection
 Uses the collected ContentDB data to generate realistic Luanti coding tasks
 """
 
+import argparse
+import gzip
+import hashlib
+import io
 import json
+import os
 import random
+import time
+from multiprocessing import Pool
 from pathlib import Path
-from typing import List, Dict
+from typing import Dict, Iterator, List
+
+PACKAGE_FIELDS = ('package', 'description', 'title')  # all the generators read from a package
+
+def iter_json_array(path: str, chunk_size: int = 1 << 16) -> Iterator:
+    """
+    Stream the elements of a top-level JSON array without loading the file
+
+    Decodes one element at a time from a sliding text buffer, so memory is
+    bounded by the largest element rather than the whole document.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        buf = f.read(chunk_size).lstrip()
+        if not buf.startswith('['):
+            raise ValueError(f"{path} is not a JSON array")
+        buf, pos, eof = buf[1:], 0, False
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buf) and buf[pos] == ']':
+                return
+            try:
+                element, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+            # A number cut off at the buffer edge decodes "successfully"; make sure it ended
+            if end == len(buf) and not eof:
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+            yield element
+            pos = end
 
 class LuantiDatasetBuilder:
     def __init__(self, luanti_data_path: str):
@@ -21,17 +66,23 @@ class LuantiDatasetBuilder:
         self.packages = self.load_luanti_data()
         
     def load_luanti_data(self) -> List[Dict]:
-        """Load the collected Luanti package data"""
+        """
+        Stream the collected Luanti package data
+        
+        Only the fields the generators read are kept per package, so the
+        full ContentDB records are never held in memory at once.
+        """
         if not self.data_path.exists():
             raise FileNotFoundError(f"Luanti data not found at {self.data_path}")
-            
-        with open(self.data_path, 'r') as f:
-            return json.load(f)
+        
+        return [{k: pkg[k] for k in PACKAGE_FIELDS if k in pkg} for pkg in iter_json_array(self.data_path)]
     
     def create_scaffold_items(self, count: int) -> List[Dict]:
         """Create scaffold (node registration) items"""
-        items = []
-        
+        return list(self.iter_scaffold_items(count))
+    
+    def iter_scaffold_items(self, count: int, rng=random) -> Iterator[Dict]:
+        """Yield scaffold (node registration) items"""
         scaffold_templates = [
             {
                 "instruction": "Register a basic node called '{name}' with description '{desc}'",
@@ -51,8 +102,8 @@ class LuantiDatasetBuilder:
         ]
         
         for i in range(count):
-            pkg = random.choice(self.packages)
-            template = random.choice(scaffold_templates)
+            pkg = rng.choice(self.packages)
+            template = rng.choice(scaffold_templates)
             
             # Extract clean name and description
             pkg_name = pkg.get('package', '').split('/')[-1]
@@ -63,7 +114,7 @@ class LuantiDatasetBuilder:
                 output = template['output'].format(
                     node_name=f"mymod:{clean_name}",
                     description=desc,
-                    light_level=random.choice([3, 7, 11, 14])
+                    light_level=rng.choice([3, 7, 11, 14])
                 )
             else:
                 output = template['output'].format(
@@ -73,23 +124,23 @@ class LuantiDatasetBuilder:
                     name=clean_name
                 )
             
-            items.append({
+            yield {
                 "instruction": template['instruction'].format(
                     name=clean_name,
                     desc=desc,
-                    light=random.choice([3, 7, 11, 14])
+                    light=rng.choice([3, 7, 11, 14])
                 ),
                 "input": template['input'],
                 "output": output,
                 "family": "scaffold"
-            })
-        
-        return items
+            }
     
     def create_repair_items(self, count: int) -> List[Dict]:
         """Create repair (unified diff) items"""
-        items = []
-        
+        return list(self.iter_repair_items(count))
+    
+    def iter_repair_items(self, count: int, rng=random) -> Iterator[Dict]:
+        """Yield repair (unified diff) items"""
         repair_templates = [
             {
                 "instruction": "Fix the missing tiles field in this node registration",
@@ -109,20 +160,20 @@ class LuantiDatasetBuilder:
         ]
         
         for i in range(count):
-            template = random.choice(repair_templates)
-            items.append({
+            template = rng.choice(repair_templates)
+            yield {
                 "instruction": template['instruction'],
                 "input": template['input'],
                 "output": template['output'],
                 "family": "repair"
-            })
-        
-        return items
+            }
     
     def create_doc_items(self, count: int) -> List[Dict]:
         """Create doc-grounded (API usage) items"""
-        items = []
-        
+        return list(self.iter_doc_items(count))
+    
+    def iter_doc_items(self, count: int, rng=random) -> Iterator[Dict]:
+        """Yield doc-grounded (API usage) items"""
         doc_templates = [
             {
                 "instruction": "Using the provided API documentation, write code to register a node",
@@ -142,15 +193,35 @@ class LuantiDatasetBuilder:
         ]
         
         for i in range(count):
-            template = random.choice(doc_templates)
-            items.append({
+            template = rng.choice(doc_templates)
+            yield {
                 "instruction": template['instruction'],
                 "input": template['input'],
                 "output": template['output'],
                 "family": "doc"
-            })
+            }
+    
+    def iter_shard_items(self, size: int, rng=random) -> Iterator[Dict]:
+        """Yield one shuffled shard with the training family mix (40% scaffold, 40% doc, 20% repair)"""
+        scaffold_count = int(size * 0.4)
+        doc_count = int(size * 0.4)
+        repair_count = size - scaffold_count - doc_count
         
-        return items
+        items = list(self.iter_scaffold_items(scaffold_count, rng))
+        items.extend(self.iter_doc_items(doc_count, rng))
+        items.extend(self.iter_repair_items(repair_count, rng))
+        rng.shuffle(items)
+        yield from items
+    
+    def iter_dataset(self, size: int, shard_size: int = 10_000, seed: int = 42) -> Iterator[Dict]:
+        """
+        Yield a training set of any size shard by shard
+        
+        Memory is bounded by shard_size; the stream is identical to the
+        concatenated shards of build_sharded_dataset with the same arguments.
+        """
+        for shard in range(num_shards(size, shard_size)):
+            yield from self.iter_shard_items(shard_length(size, shard_size, shard), shard_rng(seed, shard))
     
     def create_eval_dataset(self, output_path: str) -> None:
         """Create the 60-item evaluation dataset"""
@@ -208,13 +279,267 @@ class LuantiDatasetBuilder:
         
         print(f"   Family distribution: {families}")
 
+COMPRESSION_SUFFIX = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+def num_shards(size: int, shard_size: int) -> int:
+    return (size + shard_size - 1) // shard_size
+
+def shard_length(size: int, shard_size: int, shard: int) -> int:
+    return min(shard_size, size - shard * shard_size)
+
+def shard_rng(seed: int, shard: int) -> random.Random:
+    """Per-shard RNG: shard contents depend only on (seed, shard), not on worker count or order"""
+    return random.Random(f"{seed}/{shard}")
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("zstd shards need the zstandard package (pip install zstandard)") from e
+    return zstandard
+
+class _HashingFile:
+    """Binary file wrapper that tracks the sha256 and size of everything written"""
+    
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+    
+    def write(self, data) -> int:
+        self.sha256.update(data)
+        self.bytes += len(data)
+        return self.file.write(data)
+    
+    def flush(self):
+        self.file.flush()
+    
+    def close(self):
+        self.file.close()
+
+def _compressed_writer(raw: _HashingFile, compression: str):
+    """Binary writer over raw; closing it flushes the compressor but leaves raw open"""
+    if compression == "gzip":
+        return gzip.GzipFile(filename='', mode='wb', fileobj=raw, mtime=0)  # mtime=0 keeps bytes reproducible
+    return _zstd().ZstdCompressor().stream_writer(raw, closefd=False)
+
+def open_shard(path: str):
+    """Open a (possibly compressed) JSONL shard for streaming text reads"""
+    path = str(path)
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith(".zst"):
+        return io.TextIOWrapper(_zstd().ZstdDecompressor().stream_reader(open(path, 'rb')), encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+_worker_builder = None
+
+def _init_worker(luanti_data_path: str):
+    global _worker_builder
+    _worker_builder = LuantiDatasetBuilder(luanti_data_path)
+
+def _write_shard(task) -> Dict:
+    """Pool worker: generate one shard and stream it to disk; returns its manifest entry"""
+    out_dir, prefix, shard, length, seed, compression = task
+    name = f"{prefix}-{shard:05d}.jsonl{COMPRESSION_SUFFIX[compression]}"
+    tmp = Path(out_dir) / (name + ".tmp")
+    
+    families = {}
+    raw = _HashingFile(tmp)
+    try:
+        sink = raw if compression == "none" else _compressed_writer(raw, compression)
+        buffer = []
+        for item in _worker_builder.iter_shard_items(length, shard_rng(seed, shard)):
+            families[item['family']] = families.get(item['family'], 0) + 1
+            buffer.append(json.dumps(item))
+            if len(buffer) == 1024:
+                sink.write(('\n'.join(buffer) + '\n').encode('utf-8'))
+                buffer = []
+        if buffer:
+            sink.write(('\n'.join(buffer) + '\n').encode('utf-8'))
+        if sink is not raw:
+            sink.close()
+    finally:
+        raw.close()
+    os.replace(tmp, Path(out_dir) / name)
+    return {"file": name, "items": length, "bytes": raw.bytes,
+            "sha256": raw.sha256.hexdigest(), "families": families}
+
+def build_sharded_dataset(luanti_data_path: str, out_dir: str, size: int, shard_size: int = 10_000,
+                          workers: int = 1, seed: int = 42, compression: str = "none",
+                          prefix: str = "luanti_train") -> Path:
+    """
+    Generate a training set as sharded JSONL plus a manifest
+    
+    Shards are generated in parallel with per-shard seeds, so the output is
+    byte-identical for any worker count. The manifest is written last; a
+    directory without one is an incomplete build.
+    
+    Returns:
+        Path to <prefix>.manifest.json
+    """
+    if compression not in COMPRESSION_SUFFIX:
+        raise ValueError(f"Unknown compression {compression!r}; expected one of {list(COMPRESSION_SUFFIX)}")
+    if compression == "zstd":
+        _zstd()  # fail before starting workers
+    
+    out_path = Path(out_dir)
+    out_path.mkdir(parents=True, exist_ok=True)
+    tasks = [(str(out_path), prefix, shard, shard_length(size, shard_size, shard), seed, compression)
+             for shard in range(num_shards(size, shard_size))]
+    
+    if workers > 1:
+        with Pool(workers, initializer=_init_worker, initargs=(str(luanti_data_path),)) as pool:
+            shards = pool.map(_write_shard, tasks, chunksize=1)
+    else:
+        _init_worker(str(luanti_data_path))
+        shards = [_write_shard(task) for task in tasks]
+    
+    families = {}
+    for shard in shards:
+        for family, count in shard["families"].items():
+            families[family] = families.get(family, 0) + count
+    
+    manifest = {
+        "format": "jsonl",
+        "compression": compression,
+        "seed": seed,
+        "shard_size": shard_size,
+        "total_items": size,
+        "families": families,
+        "shards": shards,
+    }
+    manifest_file = out_path / f"{prefix}.manifest.json"
+    tmp = manifest_file.with_suffix(".json.tmp")
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_file)
+    return manifest_file
+
+def iter_sharded_dataset(manifest_path: str) -> Iterator[Dict]:
+    """Stream the items of a sharded dataset in shard order"""
+    manifest_path = Path(manifest_path)
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+    for shard in manifest["shards"]:
+        with open_shard(manifest_path.parent / shard["file"]) as f:
+            for line in f:
+                yield json.loads(line)
+
+def _write_fake_packages(path: str, count: int):
+    """Synthetic luanti_github_links.json with the ContentDB fields the builder reads"""
+    rng = random.Random(0)
+    packages = [{"package": f"author{i % 97}/mod-{i}", "title": f"Mod {i}",
+                 "description": f"Adds {rng.choice(['lamps', 'tools', 'ores', 'mobs'])} number {i}",
+                 "github": f"https://github.com/author{i % 97}/mod-{i}", "score": rng.random() * 100,
+                 "tags": ["building", "tools"][:i % 3]} for i in range(count)]
+    with open(path, 'w') as f:
+        json.dump(packages, f, indent=1)
+
+def test_create_datasets():
+    """Streaming parser, per-shard seeding and compressed shards"""
+    import tempfile
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = f"{tmp}/luanti_github_links.json"
+        _write_fake_packages(data_path, 500)
+        with open(data_path, 'r') as f:
+            packages = json.load(f)
+        for chunk_size in (7, 64, 1 << 16):
+            assert list(iter_json_array(data_path, chunk_size)) == packages, f"Stream differs (chunk {chunk_size})"
+        with open(f"{tmp}/numbers.json", 'w') as f:
+            f.write("[1, 22, 333 ,4444,\n{\"a\": [5]}, \"x,]\"]")
+        assert list(iter_json_array(f"{tmp}/numbers.json", 2)) == [1, 22, 333, 4444, {"a": [5]}, "x,]"]
+        
+        # Slim package records give the same items as full ones under the global seed
+        builder = LuantiDatasetBuilder(data_path)
+        random.seed(42)
+        slim = builder.create_scaffold_items(50)
+        builder.packages = packages
+        random.seed(42)
+        assert builder.create_scaffold_items(50) == slim, "Slim package records changed the output"
+        
+        serial = build_sharded_dataset(data_path, f"{tmp}/serial", size=250, shard_size=100, workers=1)
+        parallel = build_sharded_dataset(data_path, f"{tmp}/parallel", size=250, shard_size=100, workers=2)
+        gzipped = build_sharded_dataset(data_path, f"{tmp}/gzip", size=250, shard_size=100, compression="gzip")
+        
+        with open(serial) as f, open(parallel) as g:
+            manifest = json.load(f)
+            assert manifest == json.load(g), "Shards depend on the worker count"
+        assert [s["items"] for s in manifest["shards"]] == [100, 100, 50]
+        assert manifest["families"] == {"scaffold": 100, "doc": 100, "repair": 50}
+        
+        items = list(iter_sharded_dataset(serial))
+        assert items == list(iter_sharded_dataset(gzipped)), "gzip shards differ"
+        assert items == list(LuantiDatasetBuilder(data_path).iter_dataset(250, shard_size=100)), \
+            "iter_dataset differs from the written shards"
+        assert len({json.dumps(i) for i in items[:100]}) > 1
+    
+    print("✅ Dataset builder tests passed")
+
+def bench_create_datasets(packages: int = 50_000, size: int = 200_000, shard_size: int = 20_000):
+    """Package loading memory and monolithic vs sharded generation"""
+    import tempfile
+    import tracemalloc
+    
+    def measure(fn):
+        """(seconds, peak traced MB); timed untraced since tracemalloc slows allocation-heavy code"""
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+        return elapsed, peak
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        data_path = f"{tmp}/luanti_github_links.json"
+        _write_fake_packages(data_path, packages)
+        mb = os.path.getsize(data_path) / 1e6
+        
+        def load_whole():
+            with open(data_path, 'r') as f:
+                return json.load(f)
+        
+        for label, load in (("json.load", load_whole), ("streaming", lambda: LuantiDatasetBuilder(data_path))):
+            elapsed, peak = measure(load)
+            print(f"📦 {label:>9} {packages} packages ({mb:.1f} MB): {elapsed:.2f}s, peak {peak:.1f} MB")
+        
+        builder = LuantiDatasetBuilder(data_path)
+        elapsed, peak = measure(lambda: builder.create_train_dataset(f"{tmp}/monolithic.jsonl", size=size))
+        print(f"⏱️  monolithic {size} items: {elapsed:.2f}s ({size / elapsed:,.0f} items/s), peak {peak:.1f} MB")
+        
+        for workers in sorted({1, os.cpu_count()}):
+            for compression in ("none", "gzip"):
+                out_dir = f"{tmp}/{workers}-{compression}"
+                elapsed, peak = measure(lambda: build_sharded_dataset(
+                    data_path, out_dir, size, shard_size, workers, compression=compression))
+                with open(Path(out_dir) / "luanti_train.manifest.json", 'r') as f:
+                    total_mb = sum(s["bytes"] for s in json.load(f)["shards"]) / 1e6
+                print(f"⏱️  sharded {size} items, {workers} workers, {compression:>4}: {elapsed:.2f}s "
+                      f"({size / elapsed:,.0f} items/s, {total_mb:.1f} MB on disk), peak {peak:.1f} MB")
+
 def main():
-    """Create both datasets"""
+    """Create both datasets, or a sharded training set with --sharded_out"""
+    parser = argparse.ArgumentParser(description="Create Luanti eval/train datasets")
+    parser.add_argument("--luanti_data", default="/Users/tdeshane/luanti_fine_tune/data/luanti_github_links.json",
+                        help="Path to luanti_github_links.json")
+    parser.add_argument("--sharded_out", default=None,
+                        help="Write a sharded training set to this directory instead of the default datasets")
+    parser.add_argument("--size", type=int, default=600, help="Training items")
+    parser.add_argument("--shard_size", type=int, default=10_000, help="Items per shard")
+    parser.add_argument("--workers", type=int, default=1, help="Generator processes for sharded output")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--compression", choices=list(COMPRESSION_SUFFIX), default="none",
+                        help="Shard compression")
+    args = parser.parse_args()
+    
     # Set random seed for reproducibility
-    random.seed(42)
+    random.seed(args.seed)
     
     # Path to collected Luanti data  
-    luanti_data_path = "/Users/tdeshane/luanti_fine_tune/data/luanti_github_links.json"
+    luanti_data_path = args.luanti_data
     
     # Check if data exists
     if not Path(luanti_data_path).exists():
@@ -222,15 +547,30 @@ def main():
         print("   Please ensure the Luanti collection is complete")
         return
     
+    if args.sharded_out:
+        start = time.perf_counter()
+        manifest_file = build_sharded_dataset(luanti_data_path, args.sharded_out, args.size, args.shard_size,
+                                              args.workers, args.seed, args.compression)
+        print(f"✅ Sharded train dataset: {args.size} items in {num_shards(args.size, args.shard_size)} shards "
+              f"({time.perf_counter() - start:.1f}s)")
+        print(f"💾 Manifest: {manifest_file}")
+        return
+    
     # Create builder
     builder = LuantiDatasetBuilder(luanti_data_path)
     
     # Create datasets
     builder.create_eval_dataset("data/eval/luanti_eval.jsonl") 
-    builder.create_train_dataset("data/train/luanti_train.jsonl", size=600)
+    builder.create_train_dataset("data/train/luanti_train.jsonl", size=args.size)
     
     print("\n🎯 Datasets created successfully!")
     print("📋 Next: Run validation to ensure JSONL format is correct")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import sys
+    if "--self_test" in sys.argv:
+        test_create_datasets()
+    elif "--bench" in sys.argv:
+        bench_create_datasets()
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate detection for generated Luanti datasets
+MinHash signatures + LSH banding over normalized instruction/input/output
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+sys.path.append(os.path.dirname(__file__))
+from create_datasets import iter_sharded_dataset
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_TOKEN_RE = re.compile(r'\w+|[^\w\s]')
+
+def normalize(item: Dict) -> str:
+    """Lowercased, whitespace-collapsed instruction + input + output"""
+    text = '\n'.join((item.get("instruction", ""), item.get("input", ""), item.get("output", "")))
+    return ' '.join(text.lower().split())
+
+def shingles(text: str, size: int = 3) -> List[str]:
+    """Overlapping token n-grams (the whole text if it is shorter than one n-gram)"""
+    tokens = _TOKEN_RE.findall(text)
+    if len(tokens) <= size:
+        return [' '.join(tokens)]
+    return [' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)]
+
+class MinHasher:
+    """MinHash signatures from num_perm universal hash permutations of 32-bit shingle hashes"""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.randint(1, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        # crc32 rather than hash(): str hashes are salted per process
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in set(shingles(text, self.shingle_size))),
+                             dtype=np.uint64)
+        permuted = (hashes[:, None] * self.a + self.b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+def similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.count_nonzero(sig_a == sig_b)) / len(sig_a)
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """(bands, rows) whose S-curve midpoint (1/bands)^(1/rows) is closest to threshold"""
+    return min(((num_perm // rows, rows) for rows in range(1, num_perm + 1)),
+               key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - threshold))
+
+class LSHIndex:
+    """
+    Banded LSH index over MinHash signatures
+
+    Signatures that agree on every row of any band share a bucket; only
+    those candidates are compared, so indexing and querying stay linear
+    in the number of items for a fixed number of bands.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128):
+        self.threshold = threshold
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self.buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self.signatures: Dict[int, np.ndarray] = {}
+
+    def _keys(self, sig: np.ndarray) -> Iterable[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            yield band, sig[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key: int, sig: np.ndarray) -> None:
+        self.signatures[key] = sig
+        for band, bucket_key in self._keys(sig):
+            self.buckets[band].setdefault(bucket_key, []).append(key)
+
+    def query(self, sig: np.ndarray) -> List[Tuple[int, float]]:
+        """Indexed keys whose estimated similarity to sig reaches the threshold"""
+        candidates = set()
+        for band, bucket_key in self._keys(sig):
+            candidates.update(self.buckets[band].get(bucket_key, ()))
+        matches = [(key, similarity(sig, self.signatures[key])) for key in candidates]
+        return sorted((m for m in matches if m[1] >= self.threshold), key=lambda m: (-m[1], m[0]))
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x: int, y: int) -> None:
+        rx, ry = self.find(x), self.find(y)
+        if rx != ry:
+            self.parent[max(rx, ry)] = min(rx, ry)
+
+def find_duplicate_clusters(items: List[Dict], threshold: float = 0.8, num_perm: int = 128,
+                            hasher: MinHasher = None) -> List[List[int]]:
+    """
+    Group items into near-duplicate clusters
+
+    Exact duplicates (after normalization) are merged before hashing, so
+    each distinct text is signed once. Within an LSH bucket every member
+    is verified against the bucket's first member only, which keeps the
+    work linear per bucket even when templates make buckets huge; the
+    union-find closure then joins clusters that share any verified edge.
+
+    Returns:
+        Clusters of item indices with at least two members, each sorted,
+        ordered by first member
+    """
+    hasher = hasher or MinHasher(num_perm)
+    first_of: Dict[str, int] = {}
+    texts: List[str] = []
+    text_of = []
+    for item in items:
+        text = normalize(item)
+        if text not in first_of:
+            first_of[text] = len(texts)
+            texts.append(text)
+        text_of.append(first_of[text])
+
+    signatures = [hasher.signature(text) for text in texts]
+    uf = _UnionFind(len(texts))
+    bands, rows = lsh_params(threshold, hasher.num_perm)
+    for band in range(bands):
+        heads: Dict[bytes, int] = {}
+        for t, sig in enumerate(signatures):
+            head = heads.setdefault(sig[band * rows:(band + 1) * rows].tobytes(), t)
+            if head != t and similarity(sig, signatures[head]) >= threshold:
+                uf.union(head, t)
+
+    clusters: Dict[int, List[int]] = {}
+    for i, t in enumerate(text_of):
+        clusters.setdefault(uf.find(t), []).append(i)
+    return sorted((c for c in clusters.values() if len(c) > 1), key=lambda c: c[0])
+
+def find_overlap(train_items: List[Dict], eval_items: List[Dict], threshold: float = 0.8,
+                 num_perm: int = 128) -> List[Dict]:
+    """
+    Train items that near-duplicate any eval item
+
+    Returns:
+        [{"train", "eval" (best match), "similarity", "eval_matches" (all matches)}]
+    """
+    hasher = MinHasher(num_perm)
+    index = LSHIndex(threshold, num_perm)
+    for j, item in enumerate(eval_items):
+        index.add(j, hasher.signature(normalize(item)))
+
+    overlap = []
+    cache: Dict[str, List[Tuple[int, float]]] = {}
+    for i, item in enumerate(train_items):
+        text = normalize(item)
+        if text not in cache:
+            cache[text] = index.query(hasher.signature(text))
+        if cache[text]:
+            j, sim = cache[text][0]
+            overlap.append({"train": i, "eval": j, "similarity": sim,
+                            "eval_matches": [m[0] for m in cache[text]]})
+    return overlap
+
+def dedup(items: List[Dict], max_per_cluster: int = 1, threshold: float = 0.8, num_perm: int = 128,
+          eval_items: List[Dict] = None, drop_eval_overlap: bool = False) -> Tuple[List[int], Dict]:
+    """
+    Apply a max-duplicates-per-cluster policy and report what was found
+
+    The first max_per_cluster members of each cluster (in dataset order)
+    are kept. With eval_items, train/eval overlap is reported and, with
+    drop_eval_overlap, removed.
+
+    Returns:
+        (indices of kept items in order, report dict)
+    """
+    clusters = find_duplicate_clusters(items, threshold, num_perm)
+    drop = {i for cluster in clusters for i in cluster[max_per_cluster:]}
+
+    report = {
+        "items": len(items),
+        "threshold": threshold,
+        "num_perm": num_perm,
+        "max_per_cluster": max_per_cluster,
+        "clusters": len(clusters),
+        "clustered_items": sum(len(c) for c in clusters),
+        "cluster_sizes": sorted((len(c) for c in clusters), reverse=True),
+        "largest_clusters": [
+            {"size": len(c), "family": items[c[0]].get("family"), "members": c[:20],
+             "example": items[c[0]].get("instruction", "")[:120]}
+            for c in sorted(clusters, key=len, reverse=True)[:10]
+        ],
+    }
+
+    if eval_items is not None:
+        overlap = find_overlap(items, eval_items, threshold, num_perm)
+        report["eval_overlap"] = {
+            "train_items": len(overlap),
+            "eval_items_hit": len({j for o in overlap for j in o["eval_matches"]}),
+            "eval_total": len(eval_items),
+            "pairs": overlap[:100],
+        }
+        if drop_eval_overlap:
+            drop.update(o["train"] for o in overlap)
+
+    kept = [i for i in range(len(items)) if i not in drop]
+    report["kept"] = len(kept)
+    report["removed"] = len(items) - len(kept)
+    return kept, report
+
+def load_items(path: str) -> List[Dict]:
+    """Items from a JSONL file or a sharded dataset manifest"""
+    if str(path).endswith(".manifest.json"):
+        return list(iter_sharded_dataset(path))
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def test_dedup():
+    """Signatures track Jaccard; clusters, policy and overlap on the shipped datasets"""
+    a = "minetest.register_node('mymod:lamp', {description = 'lamp', tiles = {'a.png'}, light_source = 3})"
+    b = a.replace("light_source = 3", "light_source = 14")
+    hasher = MinHasher(256)
+    true_jaccard = len(set(shingles(a)) & set(shingles(b))) / len(set(shingles(a)) | set(shingles(b)))
+    assert abs(similarity(hasher.signature(a), hasher.signature(b)) - true_jaccard) < 0.1
+    assert similarity(hasher.signature(a), hasher.signature(a)) == 1.0
+    assert similarity(hasher.signature(a), hasher.signature("local x = 1")) < 0.2
+
+    items = [{"instruction": "Make a lamp", "output": a}, {"instruction": "Make a lamp", "output": b},
+             {"instruction": "make  a LAMP", "output": a}, {"instruction": "Add a craft", "output": "x = 1"}]
+    assert find_duplicate_clusters(items, threshold=0.5) == [[0, 1, 2]]
+    kept, report = dedup(items, max_per_cluster=2, threshold=0.5)
+    assert kept == [0, 1, 3] and report["removed"] == 1
+
+    data_dir = Path(__file__).parent
+    train = load_items(data_dir / "train/luanti_train.jsonl")
+    eval_items = load_items(data_dir / "eval/luanti_eval.jsonl")
+    exact_train = {normalize(item) for item in train}
+    exact_hits = sum(normalize(item) in exact_train for item in eval_items)
+
+    kept, report = dedup(train, max_per_cluster=1, eval_items=eval_items, drop_eval_overlap=True)
+    assert report["clusters"] > 0 and report["kept"] < len({normalize(i) for i in train})
+    assert report["eval_overlap"]["eval_items_hit"] >= exact_hits, "Exact train/eval overlap missed"
+    kept_texts = [normalize(train[i]) for i in kept]
+    assert len(kept_texts) == len(set(kept_texts)), "Exact duplicates survived max_per_cluster=1"
+    assert not find_overlap([train[i] for i in kept], eval_items), "Eval overlap survived"
+
+    print("✅ Dedup tests passed")
+
+def _brute_force_clusters(items: List[Dict], threshold: float, hasher: MinHasher) -> int:
+    """All-pairs signature comparison (quadratic), for the benchmark"""
+    sigs = np.stack([hasher.signature(normalize(item)) for item in items])
+    uf = _UnionFind(len(items))
+    for i in range(len(items)):
+        for j in np.nonzero((sigs[i + 1:] == sigs[i]).mean(axis=1) >= threshold)[0]:
+            uf.union(i, i + 1 + int(j))
+    return len({uf.find(i) for i in range(len(items))})
+
+def bench_dedup(sizes=(2_000, 10_000, 50_000)):
+    """LSH clustering time vs dataset size, and against all-pairs on the smallest size"""
+    import random
+    import tempfile
+    from create_datasets import LuantiDatasetBuilder, _write_fake_packages
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _write_fake_packages(f"{tmp}/packages.json", 5_000)
+        builder = LuantiDatasetBuilder(f"{tmp}/packages.json")
+    rng = random.Random(0)
+    words = [f"w{i}" for i in range(5_000)]
+
+    print("⏱️  Near-duplicate clustering (template items + random suffixes, mostly distinct texts)")
+    for size in sizes:
+        items = list(builder.iter_dataset(size, shard_size=size, seed=0))
+        for item in items:
+            if rng.random() < 0.7:  # ~70% get enough extra words to leave their cluster
+                item["output"] += "\n-- " + ' '.join(rng.choices(words, k=40))
+
+        start = time.perf_counter()
+        clusters = find_duplicate_clusters(items)
+        elapsed = time.perf_counter() - start
+        line = (f"   {size:>6} items: LSH {elapsed:6.2f}s ({size / elapsed:,.0f} items/s), "
+                f"{len(clusters)} clusters")
+        if size == sizes[0]:
+            start = time.perf_counter()
+            _brute_force_clusters(items, 0.8, MinHasher())
+            line += f", all-pairs {time.perf_counter() - start:.2f}s"
+        print(line)
+
+def main():
+    """Deduplicate a dataset and report clusters and train/eval overlap"""
+    parser = argparse.ArgumentParser(description="MinHash/LSH near-duplicate detection for Luanti datasets")
+    parser.add_argument("--input", default="data/train/luanti_train.jsonl",
+                        help="Train JSONL or sharded dataset manifest")
+    parser.add_argument("--eval", default="data/eval/luanti_eval.jsonl", help="Eval JSONL for overlap checks")
+    parser.add_argument("--output", default=None, help="Write kept items to this JSONL")
+    parser.add_argument("--report", default=None, help="Write the JSON report here")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Estimated Jaccard similarity threshold")
+    parser.add_argument("--num_perm", type=int, default=128, help="MinHash permutations")
+    parser.add_argument("--max_per_cluster", type=int, default=1, help="Items kept per duplicate cluster")
+    parser.add_argument("--drop_eval_overlap", action="store_true", help="Also drop train items that match eval")
+    args = parser.parse_args()
+
+    items = load_items(args.input)
+    eval_items = load_items(args.eval) if args.eval and Path(args.eval).exists() else None
+
+    start = time.perf_counter()
+    kept, report = dedup(items, args.max_per_cluster, args.threshold, args.num_perm,
+                         eval_items, args.drop_eval_overlap)
+    elapsed = time.perf_counter() - start
+
+    print(f"🔍 {report['items']} items, {report['clusters']} duplicate clusters "
+          f"covering {report['clustered_items']} items ({elapsed:.2f}s)")
+    for cluster in report["largest_clusters"][:5]:
+        print(f"   {cluster['size']:>5} × [{cluster['family']}] {cluster['example']}")
+    if "eval_overlap" in report:
+        overlap = report["eval_overlap"]
+        print(f"⚠️  Train/eval overlap: {overlap['train_items']} train items match "
+              f"{overlap['eval_items_hit']}/{overlap['eval_total']} eval items")
+    print(f"📊 Kept {report['kept']}, removed {report['removed']} "
+          f"(max {args.max_per_cluster} per cluster{', eval overlap dropped' if args.drop_eval_overlap else ''})")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            for i in kept:
+                f.write(json.dumps(items[i]) + '\n')
+        print(f"💾 Deduplicated dataset: {args.output}")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report: {args.report}")
+
+if __name__ == "__main__":
+    if "--self_test" in sys.argv:
+        test_dedup()
+    elif "--bench" in sys.argv:
+        bench_dedup()
+    else:
+        main()
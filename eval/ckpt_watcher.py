@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+Checkpoint watcher - evaluates every finished training checkpoint
+inotify wakes the watcher when checkpoints appear (polling where it is
+unavailable); checkpoints wait in a persistent priority queue, each is
+evaluated on its own across scales (Gate D) and the Gate E comparison is
+updated incrementally
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import heapq
+import json
+import os
+import re
+import select
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+sys.path.append(os.path.dirname(__file__))
+
+CHECKPOINT_PREFIXES = ("checkpoint-", "ckpt-")
+# HF Trainer writes trainer_state.json after the adapter, optimizer and RNG state
+REQUIRED_FILES = ("adapter_config.json", "trainer_state.json")
+WEIGHT_FILES = ("adapter_model.safetensors", "adapter_model.bin")
+
+def checkpoint_step(path) -> int:
+    """Training step from a checkpoint-<step> / ckpt-<step> name (0 if none)"""
+    match = re.search(r"(\d+)$", Path(path).name)
+    return int(match.group(1)) if match else 0
+
+def newest_mtime(ckpt_dir: Path) -> float:
+    return max((f.stat().st_mtime for f in ckpt_dir.iterdir()), default=ckpt_dir.stat().st_mtime)
+
+def is_complete(ckpt_dir: Path, settle: float = 10.0, required=REQUIRED_FILES) -> bool:
+    """
+    Checkpoint has its marker files, adapter weights, and no writes for settle seconds
+
+    The settle window guards against writers that do not finish with
+    trainer_state.json (or copy checkpoints in non-atomically).
+    """
+    try:
+        names = {f.name for f in ckpt_dir.iterdir()}
+        if not all(r in names for r in required) or not any(w in names for w in WEIGHT_FILES):
+            return False
+        return time.time() - newest_mtime(ckpt_dir) >= settle
+    except FileNotFoundError:  # deleted mid-scan (save_total_limit rotation)
+        return False
+
+class CheckpointQueue:
+    """
+    Persistent priority queue of checkpoints, one JSON state file
+
+    Every checkpoint ever seen keeps an entry (queued, running, done or
+    failed), so a restarted watcher neither skips nor repeats work.
+    Entries left "running" by a crash are queued again on load. Newest
+    checkpoints come first by default; nothing is dropped, older ones
+    wait their turn. The file is rewritten atomically after each change.
+    """
+
+    def __init__(self, path: str, newest_first: bool = True, max_attempts: int = 2):
+        self.path = Path(path)
+        self.newest_first = newest_first
+        self.max_attempts = max_attempts
+        self.state = {"checkpoints": {}, "gate_e": None}
+        if self.path.exists():
+            with open(self.path, 'r') as f:
+                self.state = json.load(f)
+        self.heap = []
+        for name, entry in self.checkpoints.items():
+            if entry["status"] == "running":
+                entry["status"] = "queued"
+            if entry["status"] == "queued":
+                self._heappush(name)
+        self._save()
+
+    @property
+    def checkpoints(self) -> Dict[str, Dict]:
+        return self.state["checkpoints"]
+
+    def _heappush(self, name: str):
+        step = self.checkpoints[name]["step"]
+        heapq.heappush(self.heap, (-step if self.newest_first else step, name))
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f".tmp{os.getpid()}")
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.checkpoints
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def push(self, ckpt_dir: Path) -> bool:
+        """Enqueue a checkpoint; False if it was seen before"""
+        name = ckpt_dir.name
+        if name in self.checkpoints:
+            return False
+        self.checkpoints[name] = {"path": str(ckpt_dir), "step": checkpoint_step(ckpt_dir), "status": "queued",
+                                  "attempts": 0, "enqueued": time.time(), "results": []}
+        self._heappush(name)
+        self._save()
+        return True
+
+    def pop(self) -> Optional[Dict]:
+        """Highest-priority queued checkpoint, marked running (None if empty)"""
+        if not self.heap:
+            return None
+        _, name = heapq.heappop(self.heap)
+        entry = self.checkpoints[name]
+        entry.update(status="running", started=time.time())
+        entry["attempts"] += 1
+        self._save()
+        return {"name": name, **entry}
+
+    def finish(self, name: str, results: List[str]):
+        self.checkpoints[name].update(status="done", finished=time.time(), results=results, error=None)
+        self._save()
+
+    def fail(self, name: str, error: str):
+        """Record a failed evaluation; requeued until max_attempts is reached"""
+        entry = self.checkpoints[name]
+        entry.update(error=error, finished=time.time())
+        if entry["attempts"] < self.max_attempts:
+            entry["status"] = "queued"
+            self._heappush(name)
+        else:
+            entry["status"] = "failed"
+        self._save()
+
+    def set_gate_e(self, comparison: Dict):
+        self.state["gate_e"] = comparison
+        self._save()
+
+class _Inotify:
+    """Minimal Linux inotify binding over ctypes; wait() returns once anything changed"""
+
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watched = set()
+
+    def watch(self, path: Path):
+        if str(path) in self.watched:
+            return
+        if self.libc.inotify_add_watch(self.fd, os.fsencode(str(path)), self.MASK) < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self.watched.add(str(path))
+
+    def wait(self, timeout: float) -> bool:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 65536):  # drain; the watcher rescans instead of parsing events
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+class CheckpointWatcher:
+    """
+    Enqueue complete checkpoints from watch_dir and evaluate them one at a time
+
+    evaluate_fn(ckpt_path) returns the checkpoint's result files and
+    raises on failure; gate_fn(result_files, queue) runs the incremental
+    comparison. With inotify the watcher sleeps until the directory
+    changes; poll_interval bounds the sleep either way.
+    """
+
+    def __init__(self, watch_dir: str, queue: CheckpointQueue, evaluate_fn: Callable[[str], List[str]],
+                 gate_fn: Callable = None, settle: float = 10.0, poll_interval: float = 30.0,
+                 use_inotify: bool = True):
+        self.watch_dir = Path(watch_dir)
+        self.queue = queue
+        self.evaluate_fn = evaluate_fn
+        self.gate_fn = gate_fn
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.waiting = {}  # incomplete checkpoint dirs seen in the last scan -> newest mtime
+        self.inotify = None
+        if use_inotify:
+            try:
+                self.inotify = _Inotify()
+            except (OSError, AttributeError) as e:  # not Linux, or out of watches
+                print(f"⚠️  inotify unavailable ({e}); polling every {poll_interval:.0f}s")
+
+    def scan(self) -> List[str]:
+        """Enqueue newly complete checkpoints; returns their names"""
+        added = []
+        self.waiting = {}
+        if not self.watch_dir.exists():
+            return added
+        if self.inotify is not None:
+            self.inotify.watch(self.watch_dir)
+        for ckpt_dir in sorted(self.watch_dir.iterdir(), key=checkpoint_step):
+            if not ckpt_dir.is_dir() or not ckpt_dir.name.startswith(CHECKPOINT_PREFIXES) or ckpt_dir.name in self.queue:
+                continue
+            if is_complete(ckpt_dir, self.settle):
+                self.queue.push(ckpt_dir)
+                added.append(ckpt_dir.name)
+                print(f"📥 Queued {ckpt_dir.name} ({len(self.queue)} waiting)")
+                continue
+            try:
+                self.waiting[ckpt_dir] = newest_mtime(ckpt_dir)
+                if self.inotify is not None:
+                    self.inotify.watch(ckpt_dir)
+            except OSError:  # vanished between listing and watching
+                self.waiting.pop(ckpt_dir, None)
+        return added
+
+    def evaluate_next(self) -> bool:
+        """Evaluate the highest-priority queued checkpoint; False if none is queued"""
+        entry = self.queue.pop()
+        if entry is None:
+            return False
+        name = entry["name"]
+        print(f"🧪 Evaluating {name} (attempt {entry['attempts']}, {len(self.queue)} more queued)")
+        try:
+            results = self.evaluate_fn(entry["path"])
+        except Exception as e:
+            print(f"❌ {name} failed: {e}")
+            self.queue.fail(name, str(e))
+            return True
+        self.queue.finish(name, results)
+        print(f"✅ {name}: {len(results)} result files")
+        if self.gate_fn is not None and results:
+            try:
+                self.gate_fn(results, self.queue)
+            except Exception as e:
+                print(f"⚠️  Gate E comparison failed after {name}: {e}")
+        return True
+
+    def wait(self):
+        """Sleep until the watch dir changes, a waiting checkpoint may have settled, or poll_interval"""
+        timeout = self.poll_interval
+        if self.waiting:
+            settle_left = min(mtime + self.settle - time.time() for mtime in self.waiting.values())
+            timeout = min(timeout, max(settle_left, 0.0) + 0.05)
+        if self.inotify is not None:
+            self.inotify.wait(timeout)
+        else:
+            time.sleep(timeout)
+
+    def run(self, max_evaluations: int = None, stop: Callable[[], bool] = None):
+        """Watch until stop() is true or max_evaluations checkpoints were evaluated"""
+        evaluated = 0
+        print(f"👀 Watching {self.watch_dir} ({'inotify' if self.inotify else 'polling'})")
+        try:
+            while not (stop and stop()) and (max_evaluations is None or evaluated < max_evaluations):
+                self.scan()
+                if self.evaluate_next():
+                    evaluated += 1
+                    continue  # rescan before the next pick, a newer checkpoint may have landed
+                self.wait()
+        finally:
+            if self.inotify is not None:
+                self.inotify.close()
+                self.inotify = None
+        return evaluated
+
+def test_adapter_runner(out_dir: str, test_adapter_args: List[str], python: str = sys.executable,
+                        log_file: str = None) -> Callable[[str], List[str]]:
+    """evaluate_fn running test_adapter.py on one checkpoint across its scales, in a subprocess"""
+    script = str(Path(__file__).parent / "test_adapter.py")
+
+    def evaluate(ckpt_path: str) -> List[str]:
+        cmd = [python, "-u", script, "--adapter", ckpt_path, "--out_dir", out_dir, *test_adapter_args]
+        print(">>", " ".join(cmd))
+        with open(log_file or os.devnull, 'a') as log:
+            process = subprocess.run(cmd, stdout=log if log_file else None, stderr=subprocess.STDOUT)
+        if process.returncode != 0:
+            raise RuntimeError(f"test_adapter exited with {process.returncode}")
+        return sorted(str(p) for p in Path(out_dir).glob(f"{Path(ckpt_path).name}__scale-*.json"))
+
+    return evaluate
+
+def incremental_gate_e(baseline_file: str, out_dir: str) -> Callable:
+    """
+    gate_fn comparing only the best result so far plus the new checkpoint's files
+
+    Writes comparison_results.json like compare.py and keeps the best file
+    in the queue state, so each update reads a handful of files.
+    """
+    from compare import compare_to_baseline
+
+    def gate(result_files: List[str], queue: CheckpointQueue) -> Dict:
+        if not Path(baseline_file).exists():
+            print(f"⚠️  Baseline {baseline_file} not found; skipping Gate E")
+            return None
+        previous = queue.state["gate_e"]
+        candidates = list(result_files)
+        if previous and Path(previous["best_adapter_metrics"]["adapter_file"]).exists():
+            candidates.insert(0, previous["best_adapter_metrics"]["adapter_file"])
+        comparison = compare_to_baseline(baseline_file, out_dir, candidates)
+        with open(Path(out_dir) / "comparison_results.json", 'w') as f:
+            json.dump(comparison, f, indent=2)
+        queue.set_gate_e(comparison)
+        return comparison
+
+    return gate
+
+def _write_fake_checkpoint(ckpt_dir: Path, complete: bool = True):
+    """Checkpoint directory with the files the completeness check looks for"""
+    ckpt_dir.mkdir(parents=True, exist_ok=True)
+    (ckpt_dir / "adapter_config.json").write_text("{}")
+    (ckpt_dir / "adapter_model.safetensors").write_bytes(b"\0" * 16)
+    if complete:
+        (ckpt_dir / "trainer_state.json").write_text("{}")
+
+def _fake_results(pass_at_k: float) -> Dict:
+    items = [{"instruction": f"item {i}", "pass_at_1": pass_at_k, "pass_at_k": pass_at_k} for i in range(4)]
+    families = {f: {"pass_at_1": pass_at_k, "pass_at_k": pass_at_k, "count": 4} for f in ("scaffold", "repair", "doc")}
+    return {"overall_metrics": {"pass_at_1": pass_at_k, "pass_at_k": pass_at_k},
+            "family_metrics": families, "detailed_results": items}
+
+def test_ckpt_watcher():
+    """Fake checkpoints dropped into a temp dir are each evaluated once, newest first"""
+    import tempfile
+    import threading
+
+    with tempfile.TemporaryDirectory() as tmp:
+        watch_dir, out_dir = Path(tmp) / "outputs", Path(tmp) / "results"
+        watch_dir.mkdir()
+        out_dir.mkdir()
+        with open(out_dir / "baseline.json", 'w') as f:
+            json.dump(_fake_results(0.5), f)
+
+        evaluated = []
+        scores = {500: 0.6, 1000: 0.9, 1500: 0.7, 2000: 0.8}
+
+        def fake_evaluate(ckpt_path):
+            name = Path(ckpt_path).name
+            evaluated.append(name)
+            if name == "checkpoint-9999":
+                raise RuntimeError("CUDA out of memory")
+            files = []
+            for scale in (0.5, 1.0):
+                path = out_dir / f"{name}__scale-{scale}.json"
+                with open(path, 'w') as f:
+                    json.dump({"adapter_path": ckpt_path, "scale": scale,
+                               **_fake_results(scores[checkpoint_step(name)] * scale)}, f)
+                files.append(str(path))
+            return files
+
+        for use_inotify in (False, True):
+            evaluated.clear()
+            for p in list(watch_dir.iterdir()) + list(out_dir.glob("*__scale-*")):
+                if p.is_dir():
+                    for f in p.iterdir():
+                        f.unlink()
+                    p.rmdir()
+                else:
+                    p.unlink()
+            state = Path(tmp) / f"queue-{use_inotify}.json"
+
+            def make_watcher(poll_interval=0.05):
+                return CheckpointWatcher(watch_dir, CheckpointQueue(state), fake_evaluate,
+                                         incremental_gate_e(str(out_dir / "baseline.json"), str(out_dir)),
+                                         settle=0.2, poll_interval=poll_interval, use_inotify=use_inotify)
+
+            # Two finished checkpoints and one still being written: both finished ones, newest first
+            _write_fake_checkpoint(watch_dir / "checkpoint-500")
+            _write_fake_checkpoint(watch_dir / "checkpoint-1000")
+            _write_fake_checkpoint(watch_dir / "checkpoint-1500", complete=False)
+            (watch_dir / "runs").mkdir()  # not a checkpoint
+            time.sleep(0.25)
+            assert make_watcher().run(max_evaluations=2) == 2
+            assert evaluated == ["checkpoint-1000", "checkpoint-500"], evaluated
+
+            # The partial checkpoint finishes while the watcher sleeps (long poll: only inotify/settle wake it)
+            def finish_later():
+                time.sleep(0.3)
+                (watch_dir / "checkpoint-1500" / "trainer_state.json").write_text("{}")
+                _write_fake_checkpoint(watch_dir / "checkpoint-2000")
+
+            threading.Thread(target=finish_later).start()
+            start = time.time()
+            assert make_watcher(poll_interval=30.0 if use_inotify else 0.05).run(max_evaluations=2) == 2
+            assert time.time() - start < 5, "Watcher did not wake up for new checkpoints"
+            assert evaluated[2:] == ["checkpoint-2000", "checkpoint-1500"], evaluated
+
+            # Restart: nothing is evaluated twice; a crash mid-evaluation is retried, then given up
+            watcher = make_watcher()
+            _write_fake_checkpoint(watch_dir / "checkpoint-9999")
+            time.sleep(0.25)
+            watcher.scan()
+            assert watcher.queue.pop()["name"] == "checkpoint-9999"  # "crash" while running
+            assert make_watcher().run(max_evaluations=1) == 1
+            queue = CheckpointQueue(state)
+            assert queue.checkpoints["checkpoint-9999"]["status"] == "failed", queue.checkpoints["checkpoint-9999"]
+            assert evaluated.count("checkpoint-9999") == 1 and len(queue) == 0
+            assert all(queue.checkpoints[f"checkpoint-{s}"]["status"] == "done" for s in scores)
+
+            # Gate E tracked the best result across incremental updates
+            gate_e = queue.state["gate_e"]
+            assert Path(gate_e["best_adapter_metrics"]["adapter_file"]).name == "checkpoint-1000__scale-1.0.json"
+            assert gate_e["decision"] == "PROCEED"
+            with open(out_dir / "comparison_results.json") as f:
+                assert json.load(f) == gate_e
+
+    print("✅ Checkpoint watcher tests passed")
+
+def main(argv: List[str] = None):
+    """Watch a training output dir and evaluate each new checkpoint (extra args go to test_adapter.py)"""
+    parser = argparse.ArgumentParser(description="Evaluate each new checkpoint as training writes it",
+                                     epilog="Unrecognised arguments are passed to test_adapter.py "
+                                            "(--base, --eval, --template, --scales, --k, ...)")
+    parser.add_argument("--watch_dir", required=True, help="Training output directory with checkpoint-* dirs")
+    parser.add_argument("--out_dir", required=True, help="Results directory (test_adapter.py --out_dir)")
+    parser.add_argument("--baseline", default=None, help="Baseline results JSON for Gate E (skipped if unset)")
+    parser.add_argument("--state", default=None, help="Queue state file (default: <out_dir>/.ckpt_queue.json)")
+    parser.add_argument("--python", default=sys.executable, help="Interpreter for test_adapter.py")
+    parser.add_argument("--log", default=None, help="Append test_adapter.py output to this file")
+    parser.add_argument("--settle", type=float, default=10.0, help="Seconds without writes before a checkpoint counts")
+    parser.add_argument("--poll_interval", type=float, default=30.0, help="Rescan at least this often (seconds)")
+    parser.add_argument("--oldest_first", action="store_true", help="Evaluate queued checkpoints oldest first")
+    parser.add_argument("--max_attempts", type=int, default=2, help="Evaluation attempts per checkpoint")
+    parser.add_argument("--no_inotify", action="store_true", help="Poll even where inotify is available")
+    parser.add_argument("--once", action="store_true", help="Evaluate what is queued or complete now, then exit")
+    args, test_adapter_args = parser.parse_known_args(argv)
+
+    Path(args.out_dir).mkdir(parents=True, exist_ok=True)
+    queue = CheckpointQueue(args.state or Path(args.out_dir) / ".ckpt_queue.json",
+                            newest_first=not args.oldest_first, max_attempts=args.max_attempts)
+    watcher = CheckpointWatcher(
+        args.watch_dir, queue,
+        test_adapter_runner(args.out_dir, test_adapter_args, args.python, args.log),
+        incremental_gate_e(args.baseline, args.out_dir) if args.baseline else None,
+        settle=args.settle, poll_interval=args.poll_interval, use_inotify=not args.no_inotify)
+
+    if args.once:
+        watcher.scan()
+        while watcher.evaluate_next():
+            pass
+    else:
+        watcher.run()
+
+if __name__ == "__main__":
+    if "--self_test" in sys.argv:
+        test_ckpt_watcher()
+    else:
+        main()
@@ -6,19 +6,32 @@ Implements exact +15pp decision rule
 
 import json
 import argparse
+import os
+import sys
 from pathlib import Path
 from typing import Dict, List
 
+import numpy as np
+
+sys.path.append(os.path.dirname(__file__))
+from scoring import bootstrap_ci, format_metric
+
 def load_results(file_path: str) -> Dict:
     """Load results JSON file"""
     with open(file_path, 'r') as f:
         return json.load(f)
 
-def find_best_adapter(results_dir: str) -> Dict:
-    """Find the best performing adapter across all checkpoints and scales"""
+def find_best_adapter(results_dir: str, result_files: List[str] = None) -> Dict:
+    """
+    Find the best performing adapter across all checkpoints and scales
+    
+    result_files restricts the search (e.g. the best so far plus a new
+    checkpoint's files, for incremental comparison).
+    """
     
-    results_path = Path(results_dir)
-    result_files = list(results_path.glob("ckpt-*__scale-*.json"))
+    if result_files is None:
+        result_files = list(Path(results_dir).glob("*__scale-*.json"))
+    result_files = [Path(f) for f in result_files]
     
     if not result_files:
         raise FileNotFoundError(f"No adapter result files found in {results_dir}")
@@ -51,9 +64,29 @@ def find_best_adapter(results_dir: str) -> Dict:
     
     return best_adapter
 
-def compare_to_baseline(baseline_file: str, results_dir: str) -> Dict:
+def paired_delta_ci(baseline: Dict, adapter: Dict, metric: str = "pass_at_k") -> List[float]:
+    """
+    Bootstrap CI of the adapter-minus-baseline delta over paired items
+    
+    Items are paired by position; returns None when the two runs were not
+    on the same eval items.
+    """
+    base_items = baseline.get("detailed_results", [])
+    adapter_items = adapter.get("detailed_results", [])
+    if not base_items or len(base_items) != len(adapter_items):
+        return None
+    if any(b["instruction"] != a["instruction"] for b, a in zip(base_items, adapter_items)):
+        return None
+    
+    deltas = np.array([a[metric] for a in adapter_items], dtype=np.float64) - \
+             np.array([b[metric] for b in base_items], dtype=np.float64)
+    return bootstrap_ci(deltas)
+
+def compare_to_baseline(baseline_file: str, results_dir: str, result_files: List[str] = None) -> Dict:
     """
     Compare adapter results to baseline and apply +15pp decision rule
+    
+    With result_files, only those adapter results are considered.
     """
     
     print("📊 Loading baseline results...")
@@ -62,11 +95,11 @@ def compare_to_baseline(baseline_file: str, results_dir: str) -> Dict:
     baseline_pass_k = baseline["overall_metrics"]["pass_at_k"]
     
     print(f"📊 Baseline performance:")
-    print(f"   pass@1: {baseline_pass_1:.2%}")
-    print(f"   pass@k: {baseline_pass_k:.2%}")
+    print(f"   pass@1: {format_metric(baseline['overall_metrics'], 'pass_at_1')}")
+    print(f"   pass@k: {format_metric(baseline['overall_metrics'], 'pass_at_k')}")
     
     # Find best adapter
-    best_adapter = find_best_adapter(results_dir)
+    best_adapter = find_best_adapter(results_dir, result_files)
     
     if not best_adapter:
         return {"decision": "FAIL", "reason": "No valid adapter results found"}
@@ -78,10 +111,13 @@ def compare_to_baseline(baseline_file: str, results_dir: str) -> Dict:
     
     delta_pass_1 = adapter_pass_1 - baseline_pass_1
     delta_pass_k = adapter_pass_k - baseline_pass_k
+    delta_ci = paired_delta_ci(baseline, adapter_results)
     
     print(f"\n🎯 Best adapter performance:")
-    print(f"   pass@1: {adapter_pass_1:.2%} (Δ{delta_pass_1:+.1%})")
-    print(f"   pass@k: {adapter_pass_k:.2%} (Δ{delta_pass_k:+.1%})")
+    print(f"   pass@1: {format_metric(adapter_results['overall_metrics'], 'pass_at_1')} (Δ{delta_pass_1:+.1%})")
+    print(f"   pass@k: {format_metric(adapter_results['overall_metrics'], 'pass_at_k')} (Δ{delta_pass_k:+.1%})")
+    if delta_ci is not None:
+        print(f"   Δpass@k 95% CI (paired bootstrap): {delta_ci[0]:+.1%} to {delta_ci[1]:+.1%}")
     
     # Per-family comparison
     family_deltas = {}
@@ -109,6 +145,8 @@ def compare_to_baseline(baseline_file: str, results_dir: str) -> Dict:
     
     print(f"\n🚦 DECISION: {decision}")
     print(f"   Reason: {reason}")
+    if delta_ci is not None and decision == "PROCEED" and delta_ci[0] < SUCCESS_THRESHOLD:
+        print(f"   ⚠️ CI lower bound {delta_ci[0]:+.1%} is below +15pp - consider more samples (--n_samples)")
     
     if decision == "ADJUST":
         # Provide specific recommendations
@@ -132,7 +170,8 @@ def compare_to_baseline(baseline_file: str, results_dir: str) -> Dict:
         },
         "deltas": {
             "pass_at_1": delta_pass_1,
-            "pass_at_k": delta_pass_k
+            "pass_at_k": delta_pass_k,
+            "pass_at_k_ci": delta_ci
         },
         "family_deltas": family_deltas,
         "threshold_met": delta_pass_k >= SUCCESS_THRESHOLD
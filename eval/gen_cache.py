@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Content-addressed on-disk cache of generated candidates
+Skips regeneration for checkpoints/scales/prompts that were already evaluated
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from journal import capture_rng_state, restore_rng_state
+
+_adapter_hashes: Dict[tuple, str] = {}
+
+def adapter_content_hash(adapter_path: str) -> str:
+    """
+    sha256 over the adapter config and weight files of a checkpoint
+
+    Optimizer/scheduler state and trainer logs are ignored, so a checkpoint
+    hashes the same wherever it is copied.
+    """
+    root = Path(adapter_path)
+    files = sorted(p for p in root.iterdir()
+                   if p.is_file() and (p.name == "adapter_config.json" or p.name.startswith("adapter_model")))
+    if not files:
+        raise FileNotFoundError(f"No adapter_config.json / adapter_model.* in {adapter_path}")
+
+    stamp = tuple((p.name, p.stat().st_size, p.stat().st_mtime_ns) for p in files)
+    if (str(root.resolve()), stamp) in _adapter_hashes:
+        return _adapter_hashes[(str(root.resolve()), stamp)]
+
+    digest = hashlib.sha256()
+    for p in files:
+        digest.update(p.name.encode())
+        with open(p, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    _adapter_hashes[(str(root.resolve()), stamp)] = digest.hexdigest()
+    return digest.hexdigest()
+
+class GenerationCache:
+    """
+    Cache of generated candidates, one JSON file per generate call
+
+    The key covers the run context (base model, adapter hash, scale, seed),
+    the formatted prompts, k, the generation kwargs and the RNG state right
+    before sampling. Each entry also stores the RNG state after sampling,
+    which is restored on a hit, so a cached run replays exactly the same
+    RNG stream as an uncached one. Least recently used entries are evicted
+    once the cache exceeds max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, context: Dict, max_bytes: int = 2 * 1024**3):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.context = context
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.size_bytes = 0
+
+    def set_context(self, context: Dict):
+        """Switch the run context (e.g. next checkpoint/scale) keeping the statistics"""
+        self.context = context
+
+    def key(self, mode: str, prompts: List[str], k: int, gen_params: Dict) -> str:
+        payload = {
+            "context": self.context,
+            "mode": mode,
+            "prompts": prompts,
+            "k": k,
+            "generation_params": gen_params,
+            "rng": capture_rng_state(),
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get_or_generate(self, mode: str, prompts: List[str], k: int, gen_params: Dict,
+                        generate_fn: Callable[[], List[List[str]]]) -> List[List[str]]:
+        """
+        Return cached candidates for prompts, or call generate_fn and store them
+
+        Args:
+            mode: Generation path tag ("item" or "batch"), part of the key
+            prompts: Formatted prompts passed to the generate call
+            k: Candidates per prompt
+            gen_params: Sampling kwargs (temperature, top_p, ...)
+            generate_fn: Produces one list of k candidates per prompt
+
+        Returns:
+            One list of k candidates per prompt
+        """
+        path = self._path(self.key(mode, prompts, k, gen_params))
+
+        if path.exists():
+            try:
+                with open(path, 'r') as f:
+                    entry = json.load(f)
+                restore_rng_state(entry["rng_after"])
+                os.utime(path)  # mark as recently used
+                self.hits += len(prompts)
+                return entry["candidates"]
+            except (json.JSONDecodeError, KeyError):
+                path.unlink()
+
+        candidates = generate_fn()
+        self.misses += len(prompts)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".tmp{os.getpid()}")
+        with open(tmp, 'w') as f:
+            json.dump({"candidates": candidates, "rng_after": capture_rng_state()}, f)
+        os.replace(tmp, path)
+
+        return candidates
+
+    def evict(self) -> int:
+        """Delete least recently used entries until the cache fits max_bytes"""
+        entries = []
+        total = 0
+        for p in self.cache_dir.glob("*/*.json"):
+            st = p.stat()
+            entries.append((st.st_mtime, st.st_size, p))
+            total += st.st_size
+
+        entries.sort()
+        removed = 0
+        for _, size, p in entries:
+            if total <= self.max_bytes:
+                break
+            p.unlink()
+            total -= size
+            removed += 1
+        self.evicted += removed
+        self.size_bytes = total
+        return removed
+
+    def report(self) -> Dict:
+        """Evict down to the size bound and print hit/miss statistics"""
+        self.evict()
+        lookups = self.hits + self.misses
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evicted": self.evicted,
+            "size_mb": self.size_bytes / 1024**2,
+        }
+        print(f"🗄️  Generation cache {self.cache_dir}: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.0%} hit rate), {stats['evicted']} evicted, {stats['size_mb']:.1f} MB")
+        return stats
+
+def test_generation_cache():
+    """Hits replay the same candidates and RNG stream; LRU eviction respects the bound"""
+    import tempfile
+    import time
+    import torch
+
+    def fake_generate():
+        return [[str(torch.rand(1).item()) for _ in range(2)]]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = GenerationCache(tmp, {"base_model": "tiny", "scale": 1.0})
+
+        torch.manual_seed(3407)
+        first = cache.get_or_generate("item", ["p"], 2, {}, fake_generate)
+        after_first = torch.rand(1)
+
+        torch.manual_seed(3407)
+        second = cache.get_or_generate("item", ["p"], 2, {}, fake_generate)
+        assert second == first, "Cache hit returned different candidates"
+        assert torch.equal(torch.rand(1), after_first), "RNG not restored on hit"
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        # Different scale -> different key
+        other = GenerationCache(tmp, {"base_model": "tiny", "scale": 0.5})
+        torch.manual_seed(3407)
+        other.get_or_generate("item", ["p"], 2, {}, fake_generate)
+        assert other.misses == 1, "Context not part of the key"
+
+        # Bound to a single entry: the least recently used one goes
+        time.sleep(0.01)
+        torch.manual_seed(3407)
+        cache.get_or_generate("item", ["p"], 2, {}, fake_generate)  # touch the first entry
+        cache.max_bytes = max(p.stat().st_size for p in Path(tmp).glob("*/*.json"))
+        assert cache.evict() == 1, "Expected one eviction"
+        torch.manual_seed(3407)
+        cache.get_or_generate("item", ["p"], 2, {}, fake_generate)
+        assert cache.hits == 3, "Most recently used entry was evicted"
+
+        cache.report()
+
+    print("✅ Generation cache tests passed")
+
+if __name__ == "__main__":
+    test_generation_cache()
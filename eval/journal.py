@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Append-only evaluation journal - one JSON line per finished item
+Lets a crashed evaluation resume where it stopped
+"""
+
+import base64
+import json
+import os
+import random
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import torch
+
+def capture_rng_state() -> Dict:
+    """Snapshot Python and torch RNG state as JSON-safe strings"""
+    state = {
+        "python": base64.b64encode(json.dumps(random.getstate()).encode()).decode(),
+        "torch": base64.b64encode(torch.get_rng_state().numpy().tobytes()).decode(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = [base64.b64encode(s.numpy().tobytes()).decode() for s in torch.cuda.get_rng_state_all()]
+    return state
+
+def restore_rng_state(state: Dict) -> None:
+    """Restore a snapshot taken by capture_rng_state"""
+    version, internal, gauss = json.loads(base64.b64decode(state["python"]))
+    random.setstate((version, tuple(internal), gauss))
+    torch.set_rng_state(torch.frombuffer(bytearray(base64.b64decode(state["torch"])), dtype=torch.uint8))
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all([
+            torch.frombuffer(bytearray(base64.b64decode(s)), dtype=torch.uint8) for s in state["cuda"]
+        ])
+
+class EvalJournal:
+    """
+    JSONL journal of per-item evaluation results
+
+    Line 1 is a header with the run configuration; every following line is
+    {"index", "result", "rng", "time", "timing"} for one finished item, or
+    {"session": time} where a run or resume started evaluating. A
+    truncated last line (crash mid-write) is ignored on load.
+    """
+
+    def __init__(self, path: str, config: Dict, fresh: bool = False):
+        self.path = Path(path)
+        self.config = json.loads(json.dumps(config))  # compare in JSON form
+        self.results: Dict[int, Dict] = {}
+        self.timings: Dict[int, Dict] = {}
+        self.sessions: List[List[float]] = []  # [start, last finished item] wall-clock times
+        self.last_rng = None
+
+        if fresh and self.path.exists():
+            self.path.unlink()
+
+        if self.path.exists():
+            self._load()
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._write({"header": config})
+
+    def _load(self):
+        with open(self.path, 'r') as f:
+            lines = f.read().split('\n')
+
+        records = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Only the final line can be partial; anything after it is lost anyway
+                break
+
+        if not records or "header" not in records[0]:
+            raise ValueError(f"Journal {self.path} has no header; delete it or pass --fresh")
+        if records[0]["header"] != self.config:
+            raise ValueError(f"Journal {self.path} was written for a different run configuration; "
+                             f"delete it or pass --fresh")
+
+        for record in records[1:]:
+            if "session" in record:
+                self.sessions.append([record["session"], record["session"]])
+                continue
+            self.results[record["index"]] = record["result"]
+            self.last_rng = record["rng"]
+            if "timing" in record:
+                self.timings[record["index"]] = record["timing"]
+            if "time" in record and self.sessions:
+                self.sessions[-1][1] = record["time"]
+
+        # Drop any partial trailing line so appends start on a clean line
+        with open(self.path, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+
+    def _write(self, record: Dict):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def done(self) -> set:
+        """Indices of items already evaluated"""
+        return set(self.results)
+
+    def is_complete(self, total_items: int) -> bool:
+        return len(self.results) >= total_items
+
+    def start_session(self):
+        """Mark the start of evaluation (first run or resume) for wall-time accounting"""
+        now = time.time()
+        self.sessions.append([now, now])
+        self._write({"session": now})
+
+    def append(self, index: int, result: Dict, rng: Dict = None, timing: Dict = None):
+        """
+        Record one finished item together with the RNG state after it
+
+        rng defaults to the current state; pass the state captured right
+        after the item's generation when scoring finishes later. timing is
+        the item's timing record (see timing.item_timing).
+        """
+        now = time.time()
+        self.results[index] = result
+        record = {"index": index, "result": result, "rng": rng or capture_rng_state(), "time": now}
+        if timing is not None:
+            self.timings[index] = timing
+            record["timing"] = timing
+        if self.sessions:
+            self.sessions[-1][1] = now
+        self._write(record)
+
+    def wall_seconds(self) -> float:
+        """Time spent evaluating, summed over sessions (excludes downtime before a resume)"""
+        return sum(end - start for start, end in self.sessions)
+
+    def restore_rng(self) -> bool:
+        """Restore the RNG state recorded after the last finished item"""
+        if self.last_rng is None:
+            return False
+        restore_rng_state(self.last_rng)
+        return True
+
+    def ordered_results(self, total_items: int) -> List[Dict]:
+        """All item results in eval-file order"""
+        missing = [i for i in range(total_items) if i not in self.results]
+        if missing:
+            raise ValueError(f"Journal {self.path} is missing {len(missing)} items")
+        return [self.results[i] for i in range(total_items)]
+
+def journal_path_for(output_file: str) -> str:
+    """Journal file that sits next to a results JSON"""
+    return str(output_file) + ".journal.jsonl"
+
+def test_journal():
+    """Resume skips finished items, restores RNG, and survives a torn last line"""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "run.json.journal.jsonl")
+        config = {"k": 2, "seed": 3407}
+
+        torch.manual_seed(3407)
+        journal = EvalJournal(path, config)
+        journal.start_session()
+        journal.append(0, {"pass_at_1": 1}, timing={"validation_s": 0.5})
+        expected_next = torch.rand(3)
+
+        # Simulate a crash in the middle of writing item 1
+        with open(path, 'a') as f:
+            f.write('{"index": 1, "resu')
+
+        torch.manual_seed(0)
+        resumed = EvalJournal(path, config)
+        assert resumed.done() == {0}, "Finished items not restored"
+        assert resumed.timings == {0: {"validation_s": 0.5}} and len(resumed.sessions) == 1
+        assert resumed.restore_rng(), "RNG state not restored"
+        assert torch.equal(torch.rand(3), expected_next), "RNG stream differs after resume"
+
+        resumed.start_session()
+        resumed.append(1, {"pass_at_1": 0})
+        reloaded = EvalJournal(path, config)
+        assert reloaded.ordered_results(2) == [{"pass_at_1": 1}, {"pass_at_1": 0}]
+        assert len(reloaded.sessions) == 2 and reloaded.wall_seconds() == resumed.wall_seconds()
+
+        try:
+            EvalJournal(path, {"k": 5, "seed": 3407})
+            raise AssertionError("Config mismatch not detected")
+        except ValueError:
+            pass
+
+    print("✅ Journal tests passed")
+
+if __name__ == "__main__":
+    test_journal()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Non-destructive LoRA scaling
+Scales are applied through each LoRA layer's scaling factor, never by rewriting weights
+"""
+
+import json
+import shutil
+from pathlib import Path
+from typing import Dict
+
+# What save_pretrained writes for an adapter, plus the tokenizer a trainer checkpoint carries;
+# optimizer/scheduler/RNG/trainer state stay behind
+ADAPTER_FILES = ("adapter_config.json", "adapter_model.*", "tokenizer*", "special_tokens_map.json",
+                 "added_tokens.json", "vocab.*", "merges.txt", "chat_template.*")
+
+def set_lora_scale(model, scale: float, adapter_name: str = None) -> int:
+    """
+    Set the LoRA scale of one adapter in place
+
+    Each LoRA layer computes base(x) + lora_B(lora_A(x)) * scaling, with
+    scaling = alpha/r at load time. This sets scaling = scale * alpha/r, so
+    switching scales is O(#layers) and no weight copies are kept.
+
+    Args:
+        model: PeftModel with the adapter loaded
+        scale: Multiplier relative to the adapter's trained scaling
+        adapter_name: Adapter to scale (default: the active adapter)
+
+    Returns:
+        Number of LoRA layers updated
+    """
+    if adapter_name is None:
+        adapter_name = model.active_adapter
+
+    n = 0
+    for module in model.modules():
+        if hasattr(module, 'lora_B') and adapter_name in module.lora_B:
+            module.set_scale(adapter_name, scale)
+            n += 1
+    return n
+
+def write_scaled_adapter(adapter_dir: str, scale: float, out_dir: str) -> Dict:
+    """
+    Copy an adapter checkpoint with its scale baked into lora_alpha
+
+    Scaling is linear in lora_alpha, so multiplying alpha (and any
+    alpha_pattern overrides) by scale is equivalent to multiplying every
+    lora_B by scale - without loading the base model or touching weights.
+
+    Only the adapter and tokenizer files are copied (ADAPTER_FILES), not
+    the optimizer and trainer state of a training checkpoint.
+
+    Returns:
+        The rewritten adapter_config.json contents
+    """
+    out_path = Path(out_dir)
+    out_path.mkdir(parents=True, exist_ok=True)
+    for pattern in ADAPTER_FILES:
+        for f in Path(adapter_dir).glob(pattern):
+            if f.is_file():
+                shutil.copy2(f, out_path / f.name)
+
+    config_file = out_path / "adapter_config.json"
+    config = json.loads(config_file.read_text())
+    config["lora_alpha"] = config["lora_alpha"] * scale
+    if config.get("alpha_pattern"):
+        config["alpha_pattern"] = {k: v * scale for k, v in config["alpha_pattern"].items()}
+    config_file.write_text(json.dumps(config, indent=2))
+
+    return config
+
+def _scale_lora_B_weights(model, scale: float):
+    """Reference for the old approach: rewrite every lora_B weight (test only)"""
+    for module in model.modules():
+        if hasattr(module, 'lora_B'):
+            for adapter_name in module.lora_B:
+                module.lora_B[adapter_name].weight.data = module.lora_B[adapter_name].weight.data * scale
+
+def test_lora_scale():
+    """CPU check: scaling factors and baked alpha match the weight-rewrite approach"""
+    import sys
+    import tempfile
+    import torch
+    from peft import LoraConfig, PeftModel, get_peft_model
+    sys.path.append(str(Path(__file__).parent))
+    from tiny_lm import make_tiny_tokenizer, make_tiny_model
+
+    tokenizer = make_tiny_tokenizer()
+    ids = tokenizer("minetest.register_node('mymod:lamp', {", return_tensors="pt")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = LoraConfig(r=4, lora_alpha=8, target_modules=["q_proj", "k_proj", "v_proj", "o_proj"],
+                            init_lora_weights=False)
+        torch.manual_seed(0)
+        get_peft_model(make_tiny_model(tokenizer), config).save_pretrained(f"{tmp}/ckpt")
+        tokenizer.save_pretrained(f"{tmp}/ckpt")
+        for name in ("optimizer.pt", "scheduler.pt", "rng_state.pth", "trainer_state.json"):
+            Path(f"{tmp}/ckpt/{name}").write_bytes(b"training state")
+
+        scaled = PeftModel.from_pretrained(make_tiny_model(tokenizer), f"{tmp}/ckpt").eval()
+        weight_before = next(m.lora_B["default"].weight.clone() for m in scaled.modules() if hasattr(m, 'lora_B'))
+
+        for scale in (0.25, 0.5, 1.0, 0.25):
+            reference = PeftModel.from_pretrained(make_tiny_model(tokenizer), f"{tmp}/ckpt").eval()
+            _scale_lora_B_weights(reference, scale)
+
+            assert set_lora_scale(scaled, scale) > 0, "No LoRA layers found"
+
+            write_scaled_adapter(f"{tmp}/ckpt", scale, f"{tmp}/baked")
+            baked = PeftModel.from_pretrained(make_tiny_model(tokenizer), f"{tmp}/baked").eval()
+
+            with torch.no_grad():
+                expected = reference(**ids).logits
+                assert torch.allclose(scaled(**ids).logits, expected, atol=1e-5), f"Scaling factor mismatch at {scale}"
+                assert torch.allclose(baked(**ids).logits, expected, atol=1e-5), f"Baked alpha mismatch at {scale}"
+
+        baked_files = {f.name for f in Path(f"{tmp}/baked").iterdir()}
+        assert {"adapter_config.json", "adapter_model.safetensors", "tokenizer.json"} <= baked_files, baked_files
+        assert not baked_files & {"optimizer.pt", "scheduler.pt", "rng_state.pth", "trainer_state.json"}, \
+            "Training state copied with the adapter"
+
+        # Weights were never touched
+        weight_after = next(m.lora_B["default"].weight for m in scaled.modules() if hasattr(m, 'lora_B'))
+        assert torch.equal(weight_before, weight_after), "set_lora_scale modified weights"
+
+    print("✅ LoRA scaling tests passed")
+
+if __name__ == "__main__":
+    test_lora_scale()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Single-pass Lua lexer and structural summary
+One linear scan feeds every rubric check instead of a regex pass per check
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Iterator, List, NamedTuple, Set
+
+# Long brackets match only their opener; the scanner finds the close with str.find,
+# so an unterminated one costs a single scan to EOF instead of a rescan per opener.
+_TOKEN_RE = re.compile(r'''
+    (?P<ws>[ \t\r\f\v]+)
+  | (?P<nl>\n)
+  | (?P<long_comment>--\[=*\[)
+  | (?P<comment>--[^\n]*)
+  | (?P<long_string>\[=*\[)
+  | (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<number>0[xX][0-9a-fA-F]+|\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<op>\.\.\.|\.\.|==|~=|<=|>=|::|[-+*/%^#<>=(){}\[\];:,.])
+  | (?P<error>.)
+''', re.VERBOSE | re.DOTALL)
+
+# Body of a short string up to where an unterminated one fails (bare newline or EOF)
+_STRING_BODY_RE = {q: re.compile(r'%s(?:[^%s\\\n]|\\.)*' % (q, q), re.DOTALL) for q in '"\''}
+_OPAQUE = frozenset(('comment', 'long_comment', 'string', 'long_string'))
+_CLOSERS = {')': '(', '}': '{', ']': '['}
+
+class Token(NamedTuple):
+    kind: str   # ws, nl, comment, long_comment, string, long_string, number, name, op, error
+    text: str
+    line: int
+
+@dataclass
+class LuaSummary:
+    """Structural facts about a Lua chunk, gathered from one lexing pass"""
+    registrations: List[str] = field(default_factory=list)  # e.g. "register_node", in call order
+    api_calls: List[str] = field(default_factory=list)      # every minetest.X / core.X member used
+    table_keys: Set[str] = field(default_factory=set)       # NAME keys of table constructors
+    balanced: bool = True                                   # ()[]{} balanced outside strings/comments
+    error_pairs: int = 0                                    # "{ ,", ", }", "= ,", ",,"
+    assignments: int = 0
+    opaque: int = 0                                         # strings + comments
+    lines: int = 1
+    indented_lines: int = 0
+
+def tokenize(code: str) -> Iterator[Token]:
+    """Yield Lua tokens (including whitespace and comments) in source order"""
+    line = 1
+    pos = 0
+    size = len(code)
+    match = _TOKEN_RE.match
+    # An unterminated quote lexes as an error token. Every later quote of the same kind
+    # before the point where its scan failed is escaped on that scan's path, so it fails
+    # at the same point; skipping those keeps lines like "\"\"\"... linear.
+    unterminated = {'"': 0, "'": 0}
+    while pos < size:
+        quote = code[pos]
+        if (quote == '"' or quote == "'") and pos < unterminated[quote]:
+            yield Token('error', quote, line)
+            pos += 1
+            continue
+        m = match(code, pos)
+        kind = m.lastgroup
+        end = m.end()
+        if kind == 'long_comment' or kind == 'long_string':
+            level = end - pos - (4 if kind == 'long_comment' else 2)
+            close = code.find(']' + '=' * level + ']', end)
+            end = size if close < 0 else close + level + 2
+        elif kind == 'error' and (quote == '"' or quote == "'"):
+            unterminated[quote] = _STRING_BODY_RE[quote].match(code, pos).end()
+        text = code[pos:end]
+        yield Token(kind, text, line)
+        if kind == 'nl':
+            line += 1
+        elif kind in _OPAQUE:
+            line += text.count('\n')
+        pos = end
+
+def _long_bracket_closed(text: str) -> bool:
+    """Long string/comment token ends with the closer matching its opener"""
+    first = text.index('[')
+    opener_end = text.index('[', first + 1) + 1
+    level = opener_end - first - 2
+    return len(text) >= opener_end + level + 2 and text.endswith(']' + '=' * level + ']')
+
+def analyze_lua(code: str) -> LuaSummary:
+    """
+    Lex code once and collect the summary every rubric check consumes
+
+    Every check reads the same token stream, so brackets, keys and calls
+    inside strings and comments are ignored; brackets are matched with a
+    stack. Linear in len(code).
+    """
+    summary = LuaSummary(lines=code.count('\n') + 1)
+    api_calls, registrations, table_keys = summary.api_calls, summary.registrations, summary.table_keys
+    stack = []
+    balanced = True
+    # State carried between significant tokens (whitespace and newlines are skipped)
+    prev = None          # previous significant op text, for error pairs
+    key_ready = False    # after "{" or "," (and diff "+"/"-"): a NAME here may be a table key
+    key_name = None      # NAME seen where a key may start, waiting for "="
+    api_stage = 0        # 1 after minetest/core, 2 after the ".", 3 after the member name
+    member = None
+    line_start = True
+
+    for kind, text, _ in tokenize(code):
+        if kind == 'ws':
+            if line_start and text.startswith(('    ', '\t')):
+                summary.indented_lines += 1
+            line_start = False
+            continue
+        if kind == 'nl':
+            line_start = True
+            continue
+        line_start = False
+
+        if api_stage == 3:
+            if kind == 'op' and (text == '(' or text == '{') and member.startswith('register_'):
+                registrations.append(member)
+            api_stage = 0
+        if kind == 'name':
+            if api_stage == 2:
+                member = text
+                api_calls.append(member)
+                api_stage = 3
+            else:
+                api_stage = 1 if text == 'minetest' or text == 'core' else 0
+        else:
+            api_stage = 2 if api_stage == 1 and kind == 'op' and text == '.' else 0
+
+        if key_name is not None:
+            if kind == 'op' and text == '=':
+                table_keys.add(key_name)
+            key_name = None
+        elif key_ready and kind == 'name':
+            key_name = text
+        key_ready = kind == 'op' and (text in '{,' or (key_ready and text in '+-'))
+
+        if kind == 'op':
+            if prev is not None and (text == ',' or text == '}'):
+                if not (prev == '{' and text == '}'):
+                    summary.error_pairs += 1
+                prev = None
+            else:
+                prev = text if text in '{,=' else None
+            if text == '=':
+                summary.assignments += 1
+            elif text in '({[':
+                stack.append(text)
+            elif text in _CLOSERS:
+                if not stack or stack.pop() != _CLOSERS[text]:
+                    balanced = False
+        else:
+            prev = None
+            if kind in _OPAQUE:
+                summary.opaque += 1
+                if kind != 'string' and kind != 'comment' and not _long_bracket_closed(text):
+                    balanced = False  # truncated inside a long string/comment
+
+    summary.balanced = balanced and not stack
+    return summary
+
+def test_lua_lexer():
+    """Strings and comments do not count as structure"""
+    code = '''-- minetest.register_tool("fake", {
+minetest.register_node("mymod:lamp", {
+    description = "Lamp (bright",
+    tiles = {"lamp.png"},
+    light_source = 10,
+    groups = {cracky = 3},
+})
+--[==[ unbalanced { in a long comment ]==]
+core.register_craft{output = "mymod:lamp", recipe = {{"default:torch"}}}
+local s = [[ also { ignored ]]
+'''
+    summary = analyze_lua(code)
+    assert summary.registrations == ["register_node", "register_craft"], summary.registrations
+    assert summary.api_calls == ["register_node", "register_craft"], "Call inside a comment counted"
+    assert summary.balanced, "Brackets inside strings/comments were counted"
+    assert {"description", "tiles", "light_source", "groups", "cracky", "output", "recipe"} <= summary.table_keys
+    assert "s" not in summary.table_keys, "Local assignment counted as a table key"
+    assert summary.opaque == 8, "Expected 6 strings + 2 comments"
+    assert summary.error_pairs == 1, "Trailing comma before } not flagged"
+    assert summary.indented_lines == 4 and summary.lines == 11
+
+    assert not analyze_lua("minetest.register_node('a', {").balanced
+    assert not analyze_lua("f(])").balanced
+    assert not analyze_lua("s = [==[ truncated ]=]").balanced
+    assert analyze_lua("s = [[]] --[[]]").balanced
+    assert analyze_lua("d = 'it's', t = {1}").table_keys == {"t"}, "Lexing did not resume after a stray quote"
+    assert analyze_lua("x = {1,,2}").error_pairs == 1
+    assert analyze_lua('s = "a,,b"').error_pairs == 0
+    assert analyze_lua('t = {}').error_pairs == 0
+    assert analyze_lua("+ minetest.register_node('a', {\n+    tiles = {}\n+ })").table_keys == {"tiles"}
+
+    tokens = list(tokenize('x = "a\\"b" .. [=[\n]]\n]=]'))
+    assert [t.kind for t in tokens if t.kind != 'ws'] == ['name', 'op', 'string', 'op', 'long_string']
+
+    print("✅ Lua lexer tests passed")
+
+def _legacy_scans(code: str) -> tuple:
+    """The per-check regex/char scans LuantiRubric ran before analyze_lua"""
+    pairs = {'(': ')', '{': '}', '[': ']'}
+    stack = []
+    balanced = True
+    for char in code:
+        if char in pairs:
+            stack.append(pairs[char])
+        elif char in pairs.values():
+            if not stack or stack.pop() != char:
+                balanced = False
+                break
+    return (
+        bool(re.search(r'minetest\.(register_\w+|\w+)', code)),
+        balanced and not stack,
+        not any(re.search(err, code) for err in [r'\{\s*,', r',\s*}', r'=\s*,', r',,']),
+        bool(re.search(r'minetest\.register_(node|tool|craftitem|entity|craft)\s*\(', code)),
+        sum(1 for prop in ["description", "tiles", "groups", "light_source", "drop", "sounds", "paramtype"]
+            if prop in code) >= 2,
+        bool(re.search(r'\{[^{}]*description\s*=.*?\}', code, re.DOTALL)),
+        len(code.split('\n')) > 1 and '=' in code,
+        '    ' in code or '\t' in code,
+    )
+
+def bench_lua_lexer(sizes=(1_000, 10_000, 100_000), repeat: int = 5):
+    """Time analyze_lua against the old per-check scans on growing responses"""
+    import time
+
+    unit = '''minetest.register_node("mymod:block_%d", {
+    description = "Block %d",
+    tiles = {"block.png"},
+    groups = {cracky = 3, oddly_breakable_by_hand = 1},
+    light_source = 4,
+})
+'''
+    print("⏱️  Rubric structure scan (old multi-pass vs single-pass lexer)")
+    for size in sizes:
+        code = ""
+        n = 0
+        while len(code) < size:
+            code += unit % (n, n)
+            n += 1
+        # Complete responses, and truncated ones as when max_new_tokens runs out
+        for label, text in (("complete", code), ("truncated", code[:size])):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                _legacy_scans(text)
+            legacy = (time.perf_counter() - start) / repeat
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                analyze_lua(text)
+            lexer = (time.perf_counter() - start) / repeat
+
+            print(f"   {len(text):>7} chars {label:>9}: old {legacy * 1000:7.2f} ms, "
+                  f"lexer {lexer * 1000:6.2f} ms ({legacy / lexer:.1f}x)")
+
+    # Inputs that made earlier versions superlinear: deep nesting, unterminated openers
+    for label, text in (("nested", "x = " + "{" * 40000 + "}" * 40000), ("long open", "[[ a " * 16000),
+                        ("quote open", '"\\' * 40000)):
+        start = time.perf_counter()
+        analyze_lua(text)
+        print(f"   {len(text):>7} chars {label:>10}: lexer {(time.perf_counter() - start) * 1000:6.2f} ms")
+
+if __name__ == "__main__":
+    import sys
+    if "--bench" in sys.argv:
+        bench_lua_lexer()
+    else:
+        test_lua_lexer()
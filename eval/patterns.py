@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Central registry of precompiled validation patterns
+Shared by the static checks and the verifiers rubric
+"""
+
+import re
+import sys
+from typing import Dict, Iterable, Tuple
+
+_REGEX_META = set('.^$*+?{}[]()|\\')
+
+def literal_of(pattern: str):
+    """
+    Plain string a pattern matches, or None if it uses any regex syntax
+
+    Escaped punctuation (e.g. "minetest\\.register_node") counts as literal.
+    """
+    out = []
+    chars = iter(pattern)
+    for ch in chars:
+        if ch == '\\':
+            nxt = next(chars, None)
+            if nxt is None or nxt.isalnum() or nxt == '_':
+                return None  # \s, \d, \b, \1 ... are not literals
+            out.append(nxt)
+        elif ch in _REGEX_META:
+            return None
+        else:
+            out.append(ch)
+    return ''.join(out)
+
+class PatternSet:
+    """
+    Required/forbidden patterns compiled for single-pass checking
+
+    Literal required patterns become substring tests and are tried first;
+    the remaining required patterns are compiled once. All forbidden
+    patterns are joined into one alternation, so a text is scanned for
+    them in a single pass.
+    """
+
+    __slots__ = ("required_literals", "required", "forbidden")
+
+    def __init__(self, required: Iterable[str] = (), forbidden: Iterable[str] = (),
+                 flags: int = re.MULTILINE):
+        literals, regexes = [], []
+        for pattern in required:
+            literal = None if flags & re.IGNORECASE else literal_of(pattern)
+            if literal is not None:
+                literals.append(literal)
+            else:
+                regexes.append(compile_pattern(pattern, flags))
+        self.required_literals: Tuple[str, ...] = tuple(literals)
+        self.required: Tuple[re.Pattern, ...] = tuple(regexes)
+
+        forbidden = list(forbidden)
+        self.forbidden = (compile_pattern('|'.join(f'(?:{p})' for p in forbidden), flags)
+                          if forbidden else None)
+
+    def has_required(self, text: str) -> bool:
+        return (all(lit in text for lit in self.required_literals) and
+                all(p.search(text) for p in self.required))
+
+    def has_forbidden(self, text: str) -> bool:
+        return self.forbidden is not None and self.forbidden.search(text) is not None
+
+    def matches(self, text: str) -> bool:
+        """All required patterns present and no forbidden pattern present"""
+        return self.has_required(text) and not self.has_forbidden(text)
+
+_compiled: Dict[Tuple[str, int], re.Pattern] = {}
+_sets: Dict[str, PatternSet] = {}
+
+def compile_pattern(pattern: str, flags: int = 0) -> re.Pattern:
+    """re.compile with an unbounded process-wide cache (re's own cache holds 512)"""
+    key = (pattern, flags)
+    compiled = _compiled.get(key)
+    if compiled is None:
+        compiled = _compiled[key] = re.compile(pattern, flags)
+    return compiled
+
+def register(name: str, required: Iterable[str] = (), forbidden: Iterable[str] = (),
+             flags: int = re.MULTILINE) -> PatternSet:
+    """Compile and register a named pattern set"""
+    _sets[name] = PatternSet(required, forbidden, flags)
+    return _sets[name]
+
+def get(name: str) -> PatternSet:
+    """Registered pattern set by name (KeyError if unknown)"""
+    return _sets[name]
+
+_interned: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+_compiled_tuples: Dict[Tuple[Tuple[str, ...], int], Tuple[re.Pattern, ...]] = {}
+
+def intern_patterns(patterns: Iterable[str]) -> Tuple[str, ...]:
+    """
+    Canonical shared tuple for a pattern list
+
+    Equal lists map to the same tuple object (of interned strings), so a
+    large task pool holds one copy per distinct list instead of one per task.
+    """
+    key = tuple(sys.intern(p) for p in patterns or ())
+    return _interned.setdefault(key, key)
+
+def compile_all(patterns: Tuple[str, ...], flags: int = 0) -> Tuple[re.Pattern, ...]:
+    """Compiled regexes for a pattern tuple, shared by every task holding it"""
+    key = (patterns, flags)
+    compiled = _compiled_tuples.get(key)
+    if compiled is None:
+        compiled = _compiled_tuples[key] = tuple(compile_pattern(p, flags) for p in patterns)
+    return compiled
+
+def test_patterns():
+    """Compiled sets give the same verdicts as per-pattern re.search"""
+    assert literal_of(r'minetest\.register_node') == 'minetest.register_node'
+    assert literal_of(r'tiles\s*=') is None
+    assert literal_of('TODO') == 'TODO'
+
+    required = [r'minetest\.register_node', r'tiles\s*=\s*\{']
+    forbidden = [r'nil\s', 'TODO', r'register_node\s*\([^\'"]']
+    pattern_set = PatternSet(required, forbidden)
+    texts = [
+        "minetest.register_node('a:b', {tiles = {'x.png'}})",
+        "minetest.register_node('a:b', {tiles = {'x.png'}}) -- TODO",
+        "minetest.register_node(name, {tiles = {}})",
+        "tiles = {}",
+        "local x = nil \nminetest.register_node('a:b', {tiles = {}})",
+    ]
+    for text in texts:
+        expected = (all(re.search(p, text, re.MULTILINE) for p in required) and
+                    not any(re.search(p, text, re.MULTILINE) for p in forbidden))
+        assert pattern_set.matches(text) == expected, f"Verdict mismatch: {text!r}"
+
+    assert compile_pattern('a+') is compile_pattern('a+'), "Pattern compiled twice"
+
+    shared = intern_patterns(['light_source', r'minetest\.register_node'])
+    assert intern_patterns(['light_source', r'minetest\.register_node']) is shared, "Pattern tuple not shared"
+    assert intern_patterns(None) == ()
+    assert compile_all(shared, re.IGNORECASE) is compile_all(shared, re.IGNORECASE)
+
+    print("✅ Pattern registry tests passed")
+
+if __name__ == "__main__":
+    test_patterns()
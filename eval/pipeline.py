@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Pipelined candidate validation
+Scores item N in worker processes while the GPU generates item N+1
+"""
+
+import functools
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List
+
+sys.path.append(os.path.dirname(__file__))
+from scoring import score_candidates
+from timing import item_timing
+
+class ValidationPipeline:
+    """
+    Process pool for score_candidates with in-order result delivery
+
+    submit() returns immediately; ready() yields finished items strictly in
+    submission order, so results and journal records keep item order even
+    when workers finish out of order. score_fn takes a timings list like
+    score_candidates; validation time is measured in the worker.
+    """
+
+    def __init__(self, workers: int = None, score_fn: Callable = score_candidates):
+        self.executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+        self.score_fn = score_fn
+        self.pending = deque()
+
+    def submit(self, index: int, item: Dict, candidates: List[str], k: int = None, rng: Dict = None,
+               generation: Dict = None):
+        """
+        Queue one item for scoring
+
+        rng is the RNG state to journal with it; generation is its
+        GenerationTimer report, combined with validation time on delivery.
+        """
+        future = self.executor.submit(_score_timed, self.score_fn, item, candidates, k)
+        self.pending.append((index, future, rng, generation))
+
+    def ready(self, wait: bool = False):
+        """
+        Yield (index, result, rng, timing) for finished items at the head of the queue
+
+        With wait=True, block until every submitted item is delivered.
+        """
+        while self.pending and (wait or self.pending[0][1].done()):
+            index, future, rng, generation = self.pending.popleft()
+            result, validation = future.result()
+            yield index, result, rng, item_timing(generation, validation)
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _score_timed(score_fn: Callable, item: Dict, candidates: List[str], k: int = None):
+    """Worker side of submit(): (result, validation seconds per candidate)"""
+    timings = []
+    return score_fn(item, candidates, k, timings), timings
+
+def _slow_score(latency: float, item: Dict, candidates: List[str], k: int = None, timings: List[float] = None) -> Dict:
+    """score_candidates plus a fixed delay, to emulate expensive validation"""
+    time.sleep(latency)
+    return score_candidates(item, candidates, k, timings)
+
+class FakeGenerator:
+    """
+    Stand-in for a causal LM: sleeps, then appends a fixed Lua snippet
+
+    Only implements what generate_candidates touches (device, generate).
+    """
+
+    def __init__(self, tokenizer, latency: float = 0.05):
+        import torch
+        self.device = "cpu"
+        self.latency = latency
+        self.snippet = torch.tensor(tokenizer(
+            "minetest.register_node('mymod:lamp', {\n    description = 'Lamp',\n"
+            "    tiles = {'default_torch.png'}\n})")["input_ids"])
+
+    def generate(self, input_ids, num_return_sequences: int = 1, **kwargs):
+        import torch
+        time.sleep(self.latency)
+        rows = input_ids.repeat_interleave(num_return_sequences, dim=0)
+        return torch.cat([rows, self.snippet.repeat(rows.shape[0], 1)], dim=1)
+
+def bench_pipeline(items: int = 30, k: int = 5, gen_latency: float = 0.05,
+                   val_latency: float = 0.05, workers: int = 2):
+    """
+    Compare serial vs pipelined evaluation with a fake generator
+
+    Serial cost is roughly items * (gen + val); pipelined approaches
+    items * max(gen, val) once validation overlaps generation.
+    """
+    import json
+    from pathlib import Path
+    from run_eval import evaluate_items, generate_item
+    from tiny_lm import make_tiny_tokenizer
+
+    tokenizer = make_tiny_tokenizer()
+    model = FakeGenerator(tokenizer, gen_latency)
+    eval_file = Path(__file__).parent.parent / "data/eval/luanti_eval.jsonl"
+    with open(eval_file, 'r') as f:
+        eval_items = [json.loads(line) for line in f][:items]
+
+    score_fn = functools.partial(_slow_score, val_latency)
+    report = {}
+
+    start = time.perf_counter()
+    serial = [score_fn(item, generate_item(item, model, tokenizer, k), k) for item in eval_items]
+    report["serial"] = time.perf_counter() - start
+
+    with ValidationPipeline(workers, score_fn) as pipeline:
+        pipeline.submit(-1, eval_items[0], [""])  # warm up the pool outside the timing
+        list(pipeline.ready(wait=True))
+        start = time.perf_counter()
+        pipelined = evaluate_items(eval_items, model, tokenizer, k, pipeline=pipeline)
+        report["pipelined"] = time.perf_counter() - start
+
+    assert pipelined == serial, "Pipelined results differ from serial scoring"
+
+    report["ideal"] = len(eval_items) * max(gen_latency, val_latency)
+    print(f"⏱️  Pipeline benchmark: {len(eval_items)} items, gen {gen_latency*1000:.0f}ms, "
+          f"val {val_latency*1000:.0f}ms, {workers} workers")
+    print(f"   serial:    {report['serial']:.2f}s")
+    print(f"   pipelined: {report['pipelined']:.2f}s (ideal overlap {report['ideal']:.2f}s)")
+    print(f"   speedup:   {report['serial'] / report['pipelined']:.2f}x")
+    return report
+
+if __name__ == "__main__":
+    bench_pipeline()
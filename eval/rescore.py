@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Re-score saved evaluation results without a model
+Re-runs validation on detailed_results[].candidates[].output across all CPU cores
+"""
+
+import json
+import argparse
+import os
+import sys
+import time
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.append(os.path.dirname(__file__))
+from scoring import score_candidates, compute_metrics
+
+def _rescore_item(task: Tuple[int, int, Dict, int]) -> Tuple[int, int, Dict]:
+    """Pool worker: re-score one saved item, keeping any extra saved fields"""
+    file_idx, item_idx, saved, k = task
+    outputs = [c["output"] for c in saved["candidates"]]
+    rescored = score_candidates(saved, outputs, k)
+    rescored["candidates"] = [{**old, **new} for old, new in zip(saved["candidates"], rescored["candidates"])]
+    return file_idx, item_idx, {**saved, **rescored}
+
+def rescore_files(result_files: List[str], out_dir: str, workers: int = None) -> List[Dict]:
+    """
+    Re-score result JSONs and write updated copies to out_dir
+
+    Files without detailed_results (e.g. hand-written summaries) are skipped.
+
+    Returns:
+        One summary dict per re-scored file with before/after metrics
+    """
+    out_path = Path(out_dir)
+    out_path.mkdir(parents=True, exist_ok=True)
+
+    documents = []
+    for result_file in result_files:
+        with open(result_file, 'r') as f:
+            doc = json.load(f)
+        if not doc.get("detailed_results"):
+            print(f"   ⚠️ Skipping {result_file}: no detailed_results")
+            continue
+        documents.append((result_file, doc))
+
+    tasks = [(f, i, item, doc.get("k")) for f, (_, doc) in enumerate(documents)
+             for i, item in enumerate(doc["detailed_results"])]
+
+    workers = workers or os.cpu_count()
+    with Pool(workers) as pool:
+        rescored = pool.map(_rescore_item, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+
+    for file_idx, item_idx, result in rescored:
+        documents[file_idx][1]["detailed_results"][item_idx] = result
+
+    summaries = []
+    for result_file, doc in documents:
+        before = dict(doc.get("overall_metrics", {}))
+        doc["overall_metrics"], doc["family_metrics"] = compute_metrics(doc["detailed_results"])
+
+        output_file = out_path / Path(result_file).name
+        with open(output_file, 'w') as f:
+            json.dump(doc, f, indent=2)
+
+        summaries.append({
+            "file": str(output_file),
+            "source": str(result_file),
+            "before": {"pass_at_1": before.get("pass_at_1"), "pass_at_k": before.get("pass_at_k")},
+            "after": {"pass_at_1": doc["overall_metrics"]["pass_at_1"],
+                      "pass_at_k": doc["overall_metrics"]["pass_at_k"]},
+        })
+
+    return summaries
+
+def test_rescore():
+    """Saved candidates re-score to the same verdicts as live scoring"""
+    import tempfile
+
+    eval_file = Path(__file__).parent.parent / "data/eval/luanti_eval.jsonl"
+    with open(eval_file, 'r') as f:
+        items = [json.loads(line) for line in f]
+
+    # Reference outputs as candidates, plus an obviously broken one
+    results = [score_candidates(item, [item["output"], "not code"]) for item in items]
+    overall, family = compute_metrics(results)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stale = [dict(r, candidates=[dict(c, valid=not c["valid"]) for c in r["candidates"]]) for r in results]
+        with open(f"{tmp}/ckpt-1__scale-1.0.json", 'w') as f:
+            json.dump({"k": 2, "overall_metrics": {}, "detailed_results": stale}, f)
+
+        summary = rescore_files([f"{tmp}/ckpt-1__scale-1.0.json"], f"{tmp}/out", workers=2)
+        with open(summary[0]["file"], 'r') as f:
+            doc = json.load(f)
+
+    assert doc["detailed_results"] == results, "Re-scored verdicts differ from live scoring"
+    assert doc["overall_metrics"] == overall and doc["family_metrics"] == family
+
+    print("✅ Rescore tests passed")
+
+def bench_rescore(files: int = 9, k: int = 5, workers: int = None):
+    """Time a synthetic sweep of result files built from the eval set"""
+    import tempfile
+
+    eval_file = Path(__file__).parent.parent / "data/eval/luanti_eval.jsonl"
+    with open(eval_file, 'r') as f:
+        items = [json.loads(line) for line in f]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for n in range(files):
+            detailed = [{"instruction": item["instruction"], "input": item.get("input", ""),
+                         "family": item["family"],
+                         "candidates": [{"candidate_id": c, "output": item["output"], "valid": False} for c in range(k)],
+                         "pass_at_1": 0, "pass_at_k": 0} for item in items]
+            path = f"{tmp}/ckpt-{n}__scale-1.0.json"
+            with open(path, 'w') as f:
+                json.dump({"k": k, "overall_metrics": {}, "detailed_results": detailed}, f)
+            paths.append(path)
+
+        start = time.perf_counter()
+        rescore_files(paths, f"{tmp}/out", workers=workers)
+        elapsed = time.perf_counter() - start
+
+    candidates = files * len(items) * k
+    print(f"⏱️  Re-scored {files} files / {candidates} candidates in {elapsed:.2f}s "
+          f"({candidates / elapsed:.0f} candidates/s, {workers or os.cpu_count()} workers)")
+
+def main():
+    """Re-score result JSONs and write updated metrics"""
+    parser = argparse.ArgumentParser(description="Re-score saved evaluation results without a model")
+    parser.add_argument("--results", nargs="+", required=True, help="Result JSON files to re-score")
+    parser.add_argument("--out_dir", required=True, help="Directory for re-scored result JSONs")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summaries = rescore_files(args.results, args.out_dir, args.workers)
+
+    print(f"📊 Re-scored {len(summaries)} files in {time.perf_counter() - start:.2f}s")
+    for s in summaries:
+        b, a = s["before"], s["after"]
+        b1 = f"{b['pass_at_1']:.2%}" if b["pass_at_1"] is not None else "n/a"
+        bk = f"{b['pass_at_k']:.2%}" if b["pass_at_k"] is not None else "n/a"
+        print(f"   {Path(s['file']).name}: pass@1 {b1} → {a['pass_at_1']:.2%}, "
+              f"pass@k {bk} → {a['pass_at_k']:.2%}")
+
+    summary_file = Path(args.out_dir) / "rescore_summary.json"
+    with open(summary_file, 'w') as f:
+        json.dump(summaries, f, indent=2)
+    print(f"💾 Summary saved to: {summary_file}")
+
+if __name__ == "__main__":
+    if "--self_test" in sys.argv:
+        test_rescore()
+    elif "--bench" in sys.argv:
+        bench_rescore()
+    else:
+        main()
@@ -17,9 +17,13 @@ import os
 sys.path.append(os.path.dirname(__file__))
 sys.path.append(os.path.join(os.path.dirname(__file__), '../prompts'))
 
-from static_checks import validate_family
-from apply_patch import apply_patch
-from formatter import format_for_inference
+from scoring import score_candidates, compute_metrics, format_metric
+from formatter import format_batch, format_for_inference
+from scheduler import iter_scheduled
+from journal import EvalJournal, journal_path_for, capture_rng_state
+from pipeline import ValidationPipeline
+from gen_cache import GenerationCache
+from timing import GenerationTimer, merge_reports, item_timing, summarize_timing, print_timing
 
 def load_model_and_tokenizer(model_name: str):
     """
@@ -51,86 +55,228 @@ def load_model_and_tokenizer(model_name: str):
         print("CRITICAL: This evaluation must run on Linux RTX 3090 with Unsloth")
         raise
 
+def sample_sequences(model, tokenizer, inputs, k: int = 5, batched: bool = True, 
+                     temperature: float = 0.2, top_p: float = 0.9, 
+                     max_new_tokens: int = 300, timers: List[GenerationTimer] = None) -> List[torch.Tensor]:
+    """
+    Sample k token sequences (prompt + continuation) for tokenized inputs
+    
+    With batched=True all k sequences come from one generate() call
+    (num_return_sequences=k): the prompt is prefilled once as a batch and
+    k continuations are sampled together. batched=False keeps the original
+    k sequential calls. Both are reproducible under torch.manual_seed, but
+    they consume the RNG differently, so their samples are not identical.
+    
+    With a timers list, a GenerationTimer is appended for each generate() call.
+    """
+    gen_kwargs = dict(
+        max_new_tokens=max_new_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        do_sample=True,
+        pad_token_id=tokenizer.eos_token_id,
+    )
+    
+    def streamer():
+        if timers is None:
+            return None
+        timers.append(GenerationTimer(tokenizer.eos_token_id))
+        return timers[-1]
+    
+    with torch.no_grad():
+        if batched:
+            return list(model.generate(**inputs, num_return_sequences=k, streamer=streamer(), **gen_kwargs))
+        return [model.generate(**inputs, streamer=streamer(), **gen_kwargs)[0] for i in range(k)]
+
 def generate_candidates(model, tokenizer, prompt: str, k: int = 5, 
                        temperature: float = 0.2, top_p: float = 0.9, 
-                       max_new_tokens: int = 300) -> List[str]:
+                       max_new_tokens: int = 300, batched: bool = True, timing: Dict = None) -> List[str]:
     """
     Generate k candidates using exact specified parameters
+    
+    With a timing dict, it is filled with the prefill/decode report of the
+    generate() call(s).
     """
     candidates = []
     
     # Tokenize input
     inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
     
-    for i in range(k):
-        with torch.no_grad():
-            outputs = model.generate(
-                **inputs,
-                max_new_tokens=max_new_tokens,
-                temperature=temperature,
-                top_p=top_p,
-                do_sample=True,
-                pad_token_id=tokenizer.eos_token_id,
-            )
-        
+    timers = [] if timing is not None else None
+    sequences = sample_sequences(model, tokenizer, inputs, k, batched,
+                                 temperature=temperature, top_p=top_p,
+                                 max_new_tokens=max_new_tokens, timers=timers)
+    if timers:
+        timing.update(merge_reports([timer.report() for timer in timers]))
+    
+    for sequence in sequences:
         # Decode and extract response
-        full_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
+        full_text = tokenizer.decode(sequence, skip_special_tokens=True)
         response = full_text[len(prompt):].strip()
         candidates.append(response)
     
     return candidates
 
-def evaluate_item(item: Dict, model, tokenizer, k: int = 5, **gen_kwargs) -> Dict:
+def count_generated_tokens(tokenizer, sequences, prompt_length: int) -> int:
+    """Count sampled tokens up to and including each row's first EOS"""
+    total = 0
+    for row in sequences:
+        new_tokens = row[prompt_length:].tolist()
+        if tokenizer.eos_token_id in new_tokens:
+            new_tokens = new_tokens[:new_tokens.index(tokenizer.eos_token_id) + 1]
+        total += len(new_tokens)
+    return total
+
+def benchmark_generation(model, tokenizer, prompts: List[str], k: int = 5, 
+                         seed: int = 3407, **gen_kwargs) -> Dict:
+    """
+    Measure generated tokens/sec for sequential vs batched k-candidate sampling
+    """
+    import time
+    
+    report = {}
+    for mode, batched in (("sequential", False), ("batched", True)):
+        torch.manual_seed(seed)
+        tokens = 0
+        start = time.perf_counter()
+        for prompt in prompts:
+            inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+            sequences = sample_sequences(model, tokenizer, inputs, k, batched, **gen_kwargs)
+            tokens += count_generated_tokens(tokenizer, sequences, inputs["input_ids"].shape[1])
+        elapsed = time.perf_counter() - start
+        report[mode] = {
+            "tokens": tokens,
+            "seconds": elapsed,
+            "tokens_per_sec": tokens / max(elapsed, 1e-9)
+        }
+    
+    report["speedup"] = report["batched"]["tokens_per_sec"] / max(report["sequential"]["tokens_per_sec"], 1e-9)
+    
+    print(f"⏱️  Generation benchmark ({len(prompts)} prompts, k={k})")
+    for mode in ("sequential", "batched"):
+        print(f"   {mode}: {report[mode]['tokens_per_sec']:.1f} tokens/s "
+              f"({report[mode]['tokens']} tokens in {report[mode]['seconds']:.2f}s)")
+    print(f"   speedup: {report['speedup']:.2f}x")
+    return report
+
+def generate_item(item: Dict, model, tokenizer, k: int = 5, batched: bool = True, 
+                  cache: GenerationCache = None, timing: Dict = None, **gen_kwargs) -> List[str]:
     """
-    Evaluate a single item with k candidates
+    Generate k candidates for one item (or replay them from the generation cache)
+    
+    A timing dict is filled as in generate_candidates; it stays empty on a cache hit.
     """
     # Format prompt for inference using exact IIR template
     prompt = format_for_inference(item["instruction"], item.get("input", ""))
     
-    # Generate candidates
-    candidates = generate_candidates(model, tokenizer, prompt, k, **gen_kwargs)
+    if cache is None:
+        return generate_candidates(model, tokenizer, prompt, k, batched=batched, timing=timing, **gen_kwargs)
+    return cache.get_or_generate(
+        "item", [prompt], k, dict(gen_kwargs, batched=batched),
+        lambda: [generate_candidates(model, tokenizer, prompt, k, batched=batched, timing=timing, **gen_kwargs)])[0]
+
+def evaluate_item(item: Dict, model, tokenizer, k: int = 5, batched: bool = True, 
+                  cache: GenerationCache = None, n_samples: int = None, **gen_kwargs) -> Dict:
+    """
+    Evaluate a single item with k candidates (or n_samples >= k for unbiased pass@k)
+    """
+    candidates = generate_item(item, model, tokenizer, n_samples or k, batched=batched, cache=cache, **gen_kwargs)
+    return score_candidates(item, candidates, k)
+
+def evaluate_items(eval_items: List[Dict], model, tokenizer, k: int = 5, batched: bool = True,
+                   token_budget: int = None, journal: EvalJournal = None, 
+                   cache: GenerationCache = None, pipeline: ValidationPipeline = None,
+                   n_samples: int = None, **gen_kwargs) -> List[Dict]:
+    """
+    Evaluate all items, one at a time or via the cross-item batch scheduler
+    
+    With token_budget set, prompts from different items are length-bucketed
+    into left-padded batches of at most token_budget padded tokens; results
+    come back in item order with the same per-item structure.
     
-    # Evaluate each candidate
-    results = []
-    for i, candidate in enumerate(candidates):
-        
-        if item["family"] == "repair":
-            # For repair: apply patch to input, then validate
-            base_code = item.get("input", "")
-            patched_code = apply_patch(base_code, candidate)
+    With a journal, each finished item is appended to it as soon as it is
+    scored, items already in the journal are skipped, and the RNG state
+    recorded after the last finished item is restored before continuing.
+    
+    With a GenerationCache, generate calls seen before are replayed from disk.
+    
+    With a ValidationPipeline, scoring runs in worker processes while the
+    next item/batch is generated; results are still recorded in order.
+    
+    With n_samples > k, n_samples candidates are generated per item and
+    pass@1/pass@k are the unbiased estimates over all of them.
+    
+    Each item's prefill/decode time, tokens per candidate and validation
+    time (timing.item_timing) go to the journal next to its result; the
+    returned results carry no timing.
+    """
+    n = n_samples or k
+    if n < k:
+        raise ValueError(f"n_samples ({n}) must be >= k ({k})")
+    
+    results = {}
+    if journal is not None:
+        results.update(journal.results)
+        if results:
+            journal.restore_rng()
+            print(f"   Resuming from {journal.path}: {len(results)}/{len(eval_items)} items done")
+    
+    def record(i, result, rng=None, timing=None):
+        results[i] = result
+        if journal is not None:
+            journal.append(i, result, rng, timing)
+    
+    def finish(i, candidates, generation):
+        if pipeline is None:
+            validation = []
+            result = score_candidates(eval_items[i], candidates, k, validation)
+            record(i, result, None, item_timing(generation, validation))
+            return
+        # Journal the RNG state as of this item's generation, not of its (later) scoring
+        pipeline.submit(i, eval_items[i], candidates, k, capture_rng_state() if journal is not None else None,
+                        generation)
+        for done in pipeline.ready():
+            record(*done)
+    
+    pending = [i for i in range(len(eval_items)) if i not in results]
+    if journal is not None and pending:
+        journal.start_session()
+    
+    if token_budget:
+        prompts = format_batch([eval_items[i] for i in pending], for_inference=True)
+        for batch, outputs, timings in iter_scheduled(model, tokenizer, prompts, n, token_budget, cache=cache,
+                                                      **gen_kwargs):
+            for p, candidates, generation in zip(batch, outputs, timings):
+                finish(pending[p], candidates, generation)
+    else:
+        for i in pending:
+            item = eval_items[i]
+            print(f"   Evaluating {i+1}/{len(eval_items)}: {item['family']}")
             
-            if patched_code.startswith("ERROR:"):
-                valid = False
-            else:
-                # Check if patched code is valid Lua and has required patterns
-                valid = validate_family(patched_code, "scaffold")  # Check as node registration
-        else:
-            # For scaffold/doc: validate output directly
-            valid = validate_family(candidate, item["family"])
-        
-        results.append({
-            "candidate_id": i,
-            "output": candidate,
-            "valid": valid
-        })
-    
-    # Calculate pass@k metrics
-    pass_at_1 = 1 if len(results) > 0 and results[0]["valid"] else 0
-    pass_at_k = 1 if any(r["valid"] for r in results) else 0
-    
-    return {
-        "instruction": item["instruction"],
-        "input": item.get("input", ""),
-        "family": item["family"],
-        "candidates": results,
-        "pass_at_1": pass_at_1,
-        "pass_at_k": pass_at_k
-    }
+            generation = {}
+            candidates = generate_item(item, model, tokenizer, n, batched=batched, cache=cache,
+                                       timing=generation, **gen_kwargs)
+            finish(i, candidates, generation)
+    
+    if pipeline is not None:
+        for done in pipeline.ready(wait=True):
+            record(*done)
+    
+    return [results[i] for i in range(len(eval_items))]
 
 def run_evaluation(model_name: str, eval_file: str, template_file: str, 
-                  output_file: str, k: int = 5, seed: int = 3407, **gen_kwargs) -> None:
+                  output_file: str, k: int = 5, seed: int = 3407, 
+                  batched: bool = True, token_budget: int = None, fresh: bool = False,
+                  cache_dir: str = None, cache_max_mb: int = 2048, validation_workers: int = 0,
+                  n_samples: int = None, **gen_kwargs) -> None:
     """
     Run baseline evaluation with exact parameters as specified
+    
+    Item results are streamed to <output_file>.journal.jsonl; rerunning the
+    same command resumes from it (fresh=True starts over). With cache_dir,
+    generated candidates are also stored in a content-addressed cache.
+    validation_workers > 0 overlaps candidate validation with generation.
+    n_samples > k samples more candidates for the unbiased pass@k estimate.
     """
     # Set random seed
     random.seed(seed)
@@ -139,12 +285,9 @@ def run_evaluation(model_name: str, eval_file: str, template_file: str,
     print(f"🎯 Starting baseline evaluation")
     print(f"   Model: {model_name}")
     print(f"   Eval file: {eval_file}")
-    print(f"   k: {k}, seed: {seed}")
+    print(f"   k: {k}, n: {n_samples or k}, seed: {seed}, batched candidates: {batched}, token budget: {token_budget}")
     print(f"   Generation params: {gen_kwargs}")
     
-    # Load model
-    model, tokenizer = load_model_and_tokenizer(model_name)
-    
     # Load evaluation data
     eval_items = []
     with open(eval_file, 'r') as f:
@@ -159,31 +302,35 @@ def run_evaluation(model_name: str, eval_file: str, template_file: str,
         family_counts[item['family']] = family_counts.get(item['family'], 0) + 1
     print(f"   Family distribution: {family_counts}")
     
-    # Evaluate each item
-    results = []
-    for i, item in enumerate(eval_items):
-        print(f"   Evaluating {i+1}/{len(eval_items)}: {item['family']}")
-        
-        result = evaluate_item(item, model, tokenizer, k, **gen_kwargs)
-        results.append(result)
-    
-    # Calculate overall metrics
-    total_items = len(results)
-    pass_at_1_total = sum(r["pass_at_1"] for r in results)
-    pass_at_k_total = sum(r["pass_at_k"] for r in results)
-    
-    # Per-family metrics
-    family_metrics = {}
-    for family in ['scaffold', 'repair', 'doc']:
-        family_results = [r for r in results if r['family'] == family]
-        if family_results:
-            family_pass_1 = sum(r["pass_at_1"] for r in family_results)
-            family_pass_k = sum(r["pass_at_k"] for r in family_results)
-            family_metrics[family] = {
-                "count": len(family_results),
-                "pass_at_1": family_pass_1 / len(family_results),
-                "pass_at_k": family_pass_k / len(family_results)
-            }
+    journal = EvalJournal(journal_path_for(output_file), {
+        "model_name": model_name, "eval_file": eval_file, "k": k, "n_samples": n_samples, "seed": seed,
+        "batched": batched, "token_budget": token_budget, "generation_params": gen_kwargs
+    }, fresh=fresh)
+    
+    cache = None
+    if cache_dir:
+        cache = GenerationCache(cache_dir, {"base_model": model_name, "adapter": None, "scale": None, "seed": seed},
+                                max_bytes=cache_max_mb * 1024**2)
+    
+    # Evaluate each item (no model load needed if the journal is already complete)
+    if not journal.is_complete(len(eval_items)):
+        model, tokenizer = load_model_and_tokenizer(model_name)
+        pipeline = ValidationPipeline(validation_workers) if validation_workers else None
+        try:
+            evaluate_items(eval_items, model, tokenizer, k, batched=batched, token_budget=token_budget,
+                           journal=journal, cache=cache, pipeline=pipeline, n_samples=n_samples,
+                           **gen_kwargs)
+        finally:
+            if pipeline is not None:
+                pipeline.close()
+    
+    if cache is not None:
+        cache.report()
+    
+    # Aggregate from the journal
+    results = journal.ordered_results(len(eval_items))
+    
+    overall_metrics, family_metrics = compute_metrics(results)
     
     # Create final results
     final_results = {
@@ -192,13 +339,11 @@ def run_evaluation(model_name: str, eval_file: str, template_file: str,
         "generation_params": gen_kwargs,
         "seed": seed,
         "k": k,
+        "n_samples": n_samples or k,
         "timestamp": "",  # Will be filled by caller
-        "overall_metrics": {
-            "total_items": total_items,
-            "pass_at_1": pass_at_1_total / total_items,
-            "pass_at_k": pass_at_k_total / total_items
-        },
+        "overall_metrics": overall_metrics,
         "family_metrics": family_metrics,
+        "timing": summarize_timing(journal, len(eval_items)),
         "detailed_results": results
     }
     
@@ -208,15 +353,15 @@ def run_evaluation(model_name: str, eval_file: str, template_file: str,
     
     # Print summary
     print(f"\n📊 BASELINE EVALUATION COMPLETE")
-    print(f"   Overall pass@1: {pass_at_1_total}/{total_items} = {pass_at_1_total/total_items:.2%}")
-    print(f"   Overall pass@{k}: {pass_at_k_total}/{total_items} = {pass_at_k_total/total_items:.2%}")
+    print(f"   Overall pass@1: {format_metric(overall_metrics, 'pass_at_1')}")
+    print(f"   Overall pass@{k}: {format_metric(overall_metrics, 'pass_at_k')}")
     
     for family, metrics in family_metrics.items():
         count = metrics['count']
         p1 = metrics['pass_at_1'] 
-        pk = metrics['pass_at_k']
-        print(f"   {family}: pass@1={p1:.2%}, pass@{k}={pk:.2%} (n={count})")
+        print(f"   {family}: pass@1={p1:.2%}, pass@{k}={format_metric(metrics, 'pass_at_k')} (n={count})")
     
+    print_timing(final_results["timing"])
     print(f"💾 Results saved to: {output_file}")
 
 def main():
@@ -231,6 +376,19 @@ def main():
     parser.add_argument("--top_p", type=float, default=0.9, help="Top-p sampling")
     parser.add_argument("--max_new_tokens", type=int, default=300, help="Max new tokens")
     parser.add_argument("--seed", type=int, default=3407, help="Random seed")
+    parser.add_argument("--sequential_candidates", action="store_true", 
+                       help="Generate the k candidates with k separate generate() calls")
+    parser.add_argument("--token_budget", type=int, default=None, 
+                       help="Batch prompts across items up to this many padded tokens per generate() call")
+    parser.add_argument("--fresh", action="store_true", 
+                       help="Discard any existing journal for --out and start over")
+    parser.add_argument("--cache_dir", default=None, 
+                       help="Directory for the generated-candidate cache (disabled if unset)")
+    parser.add_argument("--cache_max_mb", type=int, default=2048, help="Size bound for --cache_dir")
+    parser.add_argument("--validation_workers", type=int, default=0, 
+                       help="Validate candidates in this many worker processes while generating (0 = inline)")
+    parser.add_argument("--n_samples", type=int, default=None, 
+                       help="Candidates sampled per item for unbiased pass@k (default: k)")
     
     args = parser.parse_args()
     
@@ -245,10 +403,168 @@ def main():
         output_file=args.out,
         k=args.k,
         seed=args.seed,
+        batched=not args.sequential_candidates,
+        token_budget=args.token_budget,
+        fresh=args.fresh,
+        cache_dir=args.cache_dir,
+        cache_max_mb=args.cache_max_mb,
+        validation_workers=args.validation_workers,
+        n_samples=args.n_samples,
         temperature=args.temperature,
         top_p=args.top_p,
         max_new_tokens=args.max_new_tokens
     )
 
+def test_generate_candidates():
+    """CPU check with a tiny causal LM - batched sampling is seed-reproducible"""
+    from tiny_lm import make_tiny_model_and_tokenizer
+    
+    model, tokenizer = make_tiny_model_and_tokenizer()
+    prompt = format_for_inference("Register a simple node in Luanti")
+    
+    for batched in (True, False):
+        torch.manual_seed(3407)
+        first = generate_candidates(model, tokenizer, prompt, k=4, max_new_tokens=16, batched=batched)
+        torch.manual_seed(3407)
+        second = generate_candidates(model, tokenizer, prompt, k=4, max_new_tokens=16, batched=batched)
+        assert len(first) == 4, "Expected k candidates"
+        assert first == second, f"Candidates not reproducible under fixed seed (batched={batched})"
+    
+    print("✅ generate_candidates tests passed")
+
+def test_evaluate_items_scheduled():
+    """Cross-item batches fan back into the same per-item results as the item loop"""
+    from tiny_lm import make_tiny_model_and_tokenizer
+    
+    model, tokenizer = make_tiny_model_and_tokenizer()
+    eval_file = Path(__file__).parent.parent / "data/eval/luanti_eval.jsonl"
+    with open(eval_file, 'r') as f:
+        items = [json.loads(line) for line in f][:6]
+    
+    # top_p this small keeps only the argmax token, so both paths are deterministic
+    gen_kwargs = dict(k=2, top_p=1e-6, max_new_tokens=12)
+    per_item = evaluate_items(items, model, tokenizer, **gen_kwargs)
+    scheduled = evaluate_items(items, model, tokenizer, token_budget=2000, **gen_kwargs)
+    
+    assert len(per_item) == len(scheduled) == len(items)
+    for a, b in zip(per_item, scheduled):
+        assert list(a.keys()) == list(b.keys()), "Result schema changed"
+        assert a["instruction"] == b["instruction"], "Results out of item order"
+        assert [c["output"] for c in a["candidates"]] == [c["output"] for c in b["candidates"]]
+    
+    # Validation in worker processes keeps results identical and in item order
+    with ValidationPipeline(2) as pipeline:
+        assert evaluate_items(items, model, tokenizer, pipeline=pipeline, **gen_kwargs) == per_item
+        assert evaluate_items(items, model, tokenizer, token_budget=2000, pipeline=pipeline, **gen_kwargs) == scheduled
+    
+    # n > k samples: every candidate is kept and pass@k becomes a fraction
+    sampled = evaluate_items(items, model, tokenizer, n_samples=4, token_budget=2000, **gen_kwargs)
+    for r in sampled:
+        assert len(r["candidates"]) == 4
+        assert 0.0 <= r["pass_at_1"] <= r["pass_at_k"] <= 1.0
+    
+    print("✅ Scheduled evaluation tests passed")
+
+def test_resume_from_journal():
+    """A run interrupted after 2 items and resumed matches an uninterrupted run"""
+    import tempfile
+    from tiny_lm import make_tiny_model_and_tokenizer
+    
+    model, tokenizer = make_tiny_model_and_tokenizer()
+    eval_file = Path(__file__).parent.parent / "data/eval/luanti_eval.jsonl"
+    with open(eval_file, 'r') as f:
+        items = [json.loads(line) for line in f][:4]
+    gen_kwargs = dict(k=2, temperature=1.0, max_new_tokens=8)
+    config = {"seed": 3407}
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        torch.manual_seed(3407)
+        full = evaluate_items(items, model, tokenizer, journal=EvalJournal(f"{tmp}/a.jsonl", config), **gen_kwargs)
+        
+        # "Crash" after the first two items, then resume with a clobbered RNG
+        torch.manual_seed(3407)
+        evaluate_items(items[:2], model, tokenizer, journal=EvalJournal(f"{tmp}/b.jsonl", config), **gen_kwargs)
+        torch.manual_seed(0)
+        resumed = evaluate_items(items, model, tokenizer, journal=EvalJournal(f"{tmp}/b.jsonl", config), **gen_kwargs)
+        
+        assert resumed == full, "Resumed run differs from uninterrupted run"
+        assert EvalJournal(f"{tmp}/b.jsonl", config).ordered_results(len(items)) == full
+    
+    print("✅ Journal resume tests passed")
+
+def test_generation_cache_replay():
+    """A cached rerun hits on every item and reproduces the uncached results"""
+    import tempfile
+    from tiny_lm import make_tiny_model_and_tokenizer
+    
+    model, tokenizer = make_tiny_model_and_tokenizer()
+    eval_file = Path(__file__).parent.parent / "data/eval/luanti_eval.jsonl"
+    with open(eval_file, 'r') as f:
+        items = [json.loads(line) for line in f][:4]
+    gen_kwargs = dict(k=2, temperature=1.0, max_new_tokens=8)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        for token_budget in (None, 1500):
+            runs = []
+            for _ in range(2):
+                cache = GenerationCache(tmp, {"base_model": "tiny", "seed": 3407})
+                torch.manual_seed(3407)
+                runs.append(evaluate_items(items, model, tokenizer, token_budget=token_budget, cache=cache, **gen_kwargs))
+            assert runs[0] == runs[1], "Cached rerun differs"
+            assert cache.misses == 0 and cache.hits == len(items), f"Expected all hits, got {cache.report()}"
+    
+    print("✅ Generation cache replay tests passed")
+
+def test_timing_journaled():
+    """Every path journals per-item timing; cache replays are marked cached"""
+    import tempfile
+    from tiny_lm import make_tiny_model_and_tokenizer
+    
+    model, tokenizer = make_tiny_model_and_tokenizer()
+    eval_file = Path(__file__).parent.parent / "data/eval/luanti_eval.jsonl"
+    with open(eval_file, 'r') as f:
+        items = [json.loads(line) for line in f][:4]
+    gen_kwargs = dict(k=2, temperature=1.0, max_new_tokens=8)
+    
+    with tempfile.TemporaryDirectory() as tmp, ValidationPipeline(2) as pipeline:
+        cache = GenerationCache(f"{tmp}/cache", {"base_model": "tiny", "seed": 3407})
+        runs = [("loop", {}), ("sequential", dict(batched=False)), ("scheduled", dict(token_budget=1500)),
+                ("pipelined", dict(pipeline=pipeline)), ("cache-miss", dict(cache=cache)), ("cache-hit", dict(cache=cache))]
+        for name, kwargs in runs:
+            journal = EvalJournal(f"{tmp}/{name}.jsonl", {"run": name})
+            torch.manual_seed(3407)  # the cache key includes the RNG state
+            evaluate_items(items, model, tokenizer, journal=journal, **kwargs, **gen_kwargs)
+            timing = summarize_timing(EvalJournal(f"{tmp}/{name}.jsonl", {"run": name}), len(items))
+            assert timing["items_timed"] == len(items) and timing["wall_seconds"] > 0, name
+            for t in timing["items"]:
+                assert len(t["candidates"]) == 2 and t["validation_s"] > 0, name
+                assert t["cached"] == (name == "cache-hit"), name
+                if not t["cached"]:
+                    assert t["prefill_s"] > 0 and t["decode_s"] > 0, name
+                    assert t["generated_tokens"] == sum(c["tokens"] for c in t["candidates"]) > 0, name
+            assert (timing["decode_tokens_per_sec"] is None) == (name == "cache-hit"), name
+    
+    print("✅ Evaluation timing tests passed")
+
+def bench_tiny_model(k: int = 5, max_new_tokens: int = 64):
+    """Run benchmark_generation on CPU with the tiny LM over the bundled eval prompts"""
+    from tiny_lm import make_tiny_model_and_tokenizer
+    
+    model, tokenizer = make_tiny_model_and_tokenizer()
+    eval_file = Path(__file__).parent.parent / "data/eval/luanti_eval.jsonl"
+    with open(eval_file, 'r') as f:
+        items = [json.loads(line) for line in f][:10]
+    prompts = format_batch(items, for_inference=True)
+    return benchmark_generation(model, tokenizer, prompts, k=k, max_new_tokens=max_new_tokens)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "--self_test" in sys.argv:
+        test_generate_candidates()
+        test_evaluate_items_scheduled()
+        test_resume_from_journal()
+        test_generation_cache_replay()
+        test_timing_journaled()
+    elif "--bench" in sys.argv:
+        bench_tiny_model()
+    else:
+        main()
\ No newline at end of file
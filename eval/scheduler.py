@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Cross-item batching scheduler for evaluation generation
+Groups prompts of similar tokenized length into left-padded batches
+"""
+
+from typing import Dict, List
+import torch
+
+from timing import GenerationTimer, split_batch_report
+
+def plan_batches(prompt_lengths: List[int], k: int, max_new_tokens: int,
+                 token_budget: int) -> List[List[int]]:
+    """
+    Bucket prompt indices into batches that fit a token budget
+
+    Prompts are sorted by tokenized length (longest first) and packed
+    greedily. A batch costs rows * (longest prompt + max_new_tokens), where
+    rows = prompts * k. A prompt that alone exceeds the budget still gets
+    its own batch.
+
+    Args:
+        prompt_lengths: Tokenized length of each prompt
+        k: Candidates sampled per prompt
+        max_new_tokens: Generation length per candidate
+        token_budget: Maximum padded tokens per generate() call
+
+    Returns:
+        List of batches, each a list of prompt indices
+    """
+    order = sorted(range(len(prompt_lengths)), key=lambda i: (-prompt_lengths[i], i))
+
+    batches = []
+    current = []
+    current_len = 0
+    for idx in order:
+        longest = max(current_len, prompt_lengths[idx])
+        cost = (len(current) + 1) * k * (longest + max_new_tokens)
+        if current and cost > token_budget:
+            batches.append(current)
+            current = []
+            longest = prompt_lengths[idx]
+        current.append(idx)
+        current_len = longest
+    if current:
+        batches.append(current)
+
+    return batches
+
+def generate_batch(model, tokenizer, prompts: List[str], k: int = 5,
+                   temperature: float = 0.2, top_p: float = 0.9,
+                   max_new_tokens: int = 300, timing: Dict = None) -> List[List[str]]:
+    """
+    Sample k candidates for each of several prompts in one generate() call
+
+    With a timing dict, it is filled with the call's GenerationTimer report.
+
+    Returns:
+        One list of k candidates per prompt, in input order
+    """
+    padding_side = tokenizer.padding_side
+    pad_token = tokenizer.pad_token
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    try:
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True).to(model.device)
+    finally:
+        tokenizer.padding_side = padding_side
+        tokenizer.pad_token = pad_token
+
+    timer = GenerationTimer(tokenizer.eos_token_id) if timing is not None else None
+    with torch.no_grad():
+        outputs = model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            do_sample=True,
+            num_return_sequences=k,
+            pad_token_id=tokenizer.eos_token_id,
+            streamer=timer,
+        )
+    if timer is not None:
+        timing.update(timer.report())
+
+    # Rows come back grouped per prompt: p0 x k, p1 x k, ...
+    candidates = []
+    for p, prompt in enumerate(prompts):
+        per_prompt = []
+        for row in outputs[p * k:(p + 1) * k]:
+            full_text = tokenizer.decode(row, skip_special_tokens=True)
+            per_prompt.append(full_text[len(prompt):].strip())
+        candidates.append(per_prompt)
+
+    return candidates
+
+def iter_scheduled(model, tokenizer, prompts: List[str], k: int = 5,
+                   token_budget: int = 16384, cache=None, **gen_kwargs):
+    """
+    Generate k candidates for every prompt using length-bucketed batches
+
+    With a GenerationCache, each batch is looked up before generating.
+
+    Yields:
+        (prompt_indices, candidates_per_prompt, timing_per_prompt) after each
+        batch finishes; a prompt's timing is {} when the batch was replayed
+        from the cache
+    """
+    lengths = [len(tokenizer(prompt)["input_ids"]) for prompt in prompts]
+    max_new_tokens = gen_kwargs.get("max_new_tokens", 300)
+    batches = plan_batches(lengths, k, max_new_tokens, token_budget)
+
+    print(f"   Scheduled {len(prompts)} prompts into {len(batches)} batches (budget={token_budget} tokens)")
+
+    for b, batch in enumerate(batches):
+        print(f"   Batch {b+1}/{len(batches)}: {len(batch)} prompts, "
+              f"lengths {min(lengths[i] for i in batch)}-{max(lengths[i] for i in batch)}")
+        batch_prompts = [prompts[i] for i in batch]
+        timing = {}
+        if cache is None:
+            outputs = generate_batch(model, tokenizer, batch_prompts, k, timing=timing, **gen_kwargs)
+        else:
+            outputs = cache.get_or_generate(
+                "batch", batch_prompts, k, gen_kwargs,
+                lambda: generate_batch(model, tokenizer, batch_prompts, k, timing=timing, **gen_kwargs))
+        yield batch, outputs, split_batch_report(timing, len(batch), k)
+
+def generate_scheduled(model, tokenizer, prompts: List[str], k: int = 5,
+                       token_budget: int = 16384, **gen_kwargs) -> List[List[str]]:
+    """
+    Generate k candidates for every prompt using length-bucketed batches
+
+    Returns:
+        One list of k candidates per prompt, in the original prompt order
+    """
+    results: Dict[int, List[str]] = {}
+    for batch, outputs, _ in iter_scheduled(model, tokenizer, prompts, k, token_budget, **gen_kwargs):
+        for idx, candidates in zip(batch, outputs):
+            results[idx] = candidates
+
+    return [results[i] for i in range(len(prompts))]
+
+def test_plan_batches():
+    """Budget and ordering checks for the batch planner"""
+    lengths = [10, 50, 12, 48, 200, 11]
+    batches = plan_batches(lengths, k=2, max_new_tokens=10, token_budget=300)
+
+    # Every prompt scheduled exactly once
+    assert sorted(i for b in batches for i in b) == list(range(len(lengths)))
+
+    # Oversized prompt runs alone; all other batches respect the budget
+    assert [4] in batches
+    for b in batches:
+        if b != [4]:
+            assert len(b) * 2 * (max(lengths[i] for i in b) + 10) <= 300
+
+    # Similar lengths share a batch
+    assert any(set(b) == {1, 3} for b in batches)
+
+    print("✅ Batch planner tests passed")
+
+if __name__ == "__main__":
+    test_plan_batches()
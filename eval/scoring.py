@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Candidate scoring and metric aggregation
+Torch-free so saved generations can be re-scored without a model
+"""
+
+import time
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from static_checks import validate_family
+from apply_patch import apply_patch
+
+def pass_at_k(n: Sequence[int], c: Sequence[int], k: int) -> np.ndarray:
+    """
+    Unbiased pass@k estimator, vectorized over items
+    
+    pass@k = 1 - C(n-c, k) / C(n, k), computed as the stable product
+    1 - prod_{i=n-c+1}^{n} (1 - k/i).
+    
+    Args:
+        n: Samples generated per item
+        c: Valid samples per item
+        k: Budget to estimate, k <= min(n)
+    
+    Returns:
+        Array of per-item pass@k estimates
+    """
+    n = np.asarray(n, dtype=np.int64)
+    c = np.asarray(c, dtype=np.int64)
+    if n.size == 0:
+        return np.zeros(0)
+    if k < 1 or k > n.min():
+        raise ValueError(f"pass@{k} needs 1 <= k <= n (n={n.min()})")
+    
+    i = np.arange(1, n.max() + 1)
+    in_product = (i > (n - c)[:, None]) & (i <= n[:, None])
+    estimate = 1.0 - np.where(in_product, 1.0 - k / i, 1.0).prod(axis=1)
+    return np.where(n - c < k, 1.0, estimate)
+
+def bootstrap_ci(values: Sequence[float], n_boot: int = 2000, confidence: float = 0.95,
+                 seed: int = 0) -> List[float]:
+    """
+    Percentile bootstrap confidence interval for the mean of per-item values
+    
+    Seeded so rescoring the same results gives the same interval.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.size == 0:
+        return [0.0, 0.0]
+    rng = np.random.default_rng(seed)
+    means = values[rng.integers(0, values.size, size=(n_boot, values.size))].mean(axis=1)
+    tail = (1 - confidence) / 2 * 100
+    lo, hi = np.percentile(means, [tail, 100 - tail])
+    return [float(lo), float(hi)]
+
+def score_candidates(item: Dict, candidates: List[str], k: int = None, timings: List[float] = None) -> Dict:
+    """
+    Validate generated candidates for an item and compute pass@k
+    
+    With n = len(candidates) samples, pass_at_1 and pass_at_k are the
+    unbiased estimates for k (default n), so n > k samples per item lower
+    the variance without changing what is measured.
+    
+    With a timings list, each candidate's validation seconds are appended
+    to it (kept out of the result so results stay reproducible).
+    """
+    # Evaluate each candidate
+    results = []
+    for i, candidate in enumerate(candidates):
+        start = time.perf_counter()
+        
+        if item["family"] == "repair":
+            # For repair: apply patch to input, then validate
+            base_code = item.get("input", "")
+            patched_code = apply_patch(base_code, candidate)
+            
+            if patched_code.startswith("ERROR:"):
+                valid = False
+            else:
+                # Check if patched code is valid Lua and has required patterns
+                valid = validate_family(patched_code, "scaffold")  # Check as node registration
+        else:
+            # For scaffold/doc: validate output directly
+            valid = validate_family(candidate, item["family"])
+        
+        if timings is not None:
+            timings.append(time.perf_counter() - start)
+        results.append({
+            "candidate_id": i,
+            "output": candidate,
+            "valid": valid
+        })
+    
+    # Calculate pass@k metrics
+    n = len(results)
+    num_correct = sum(r["valid"] for r in results)
+    pass_at_1 = float(pass_at_k([n], [num_correct], 1)[0]) if n else 0.0
+    pass_at_k_value = float(pass_at_k([n], [num_correct], k or n)[0]) if n else 0.0
+    
+    return {
+        "instruction": item["instruction"],
+        "input": item.get("input", ""),
+        "family": item["family"],
+        "candidates": results,
+        "num_correct": num_correct,
+        "pass_at_1": pass_at_1,
+        "pass_at_k": pass_at_k_value
+    }
+
+
+def _summarize(results: List[Dict], n_boot: int, seed: int) -> Dict:
+    """Mean pass@1/pass@k with bootstrap CIs, plus the full pass@k curve"""
+    p1 = np.array([r["pass_at_1"] for r in results], dtype=np.float64)
+    pk = np.array([r["pass_at_k"] for r in results], dtype=np.float64)
+    n = np.array([len(r["candidates"]) for r in results])
+    c = np.array([sum(cand["valid"] for cand in r["candidates"]) for r in results])
+    
+    summary = {
+        "pass_at_1": float(p1.mean()),
+        "pass_at_k": float(pk.mean()),
+        "ci": {
+            "pass_at_1": bootstrap_ci(p1, n_boot, seed=seed),
+            "pass_at_k": bootstrap_ci(pk, n_boot, seed=seed),
+        },
+    }
+    if n.min() > 0:
+        summary["pass_at"] = {str(k): float(pass_at_k(n, c, k).mean()) for k in range(1, n.min() + 1)}
+    return summary
+
+def compute_metrics(results: List[Dict], n_boot: int = 2000, seed: int = 0):
+    """
+    Aggregate per-item results into overall and per-family metrics
+    
+    pass_at_1/pass_at_k are item means as before; each level also carries
+    95% bootstrap intervals ("ci") and the unbiased pass@k for every k up
+    to the number of samples per item ("pass_at").
+    
+    Returns:
+        (overall_metrics, family_metrics) as stored in the results JSON
+    """
+    # Per-family metrics
+    family_metrics = {}
+    for family in ['scaffold', 'repair', 'doc']:
+        family_results = [r for r in results if r['family'] == family]
+        if family_results:
+            family_metrics[family] = {"count": len(family_results), **_summarize(family_results, n_boot, seed)}
+    
+    overall_metrics = {"total_items": len(results), **_summarize(results, n_boot, seed)}
+    return overall_metrics, family_metrics
+
+def format_metric(metrics: Dict, name: str) -> str:
+    """'37.50% [95% CI 25.00%-50.00%]', or just the value for results saved without CIs"""
+    ci = metrics.get("ci", {}).get(name)
+    if ci is None:
+        return f"{metrics[name]:.2%}"
+    return f"{metrics[name]:.2%} [95% CI {ci[0]:.2%}-{ci[1]:.2%}]"
+
+def test_pass_at_k():
+    """Vectorized estimator matches the closed form and the any-valid rule at k = n"""
+    from math import comb
+    
+    n = np.array([5, 10, 10, 20, 20, 3])
+    c = np.array([0, 1, 10, 4, 17, 2])
+    for k in (1, 2, 3):
+        expected = [1.0 - comb(ni - ci, k) / comb(ni, k) for ni, ci in zip(n, c)]
+        assert np.allclose(pass_at_k(n, c, k), expected), f"pass@{k} differs from closed form"
+    
+    assert list(pass_at_k([5, 5], [0, 2], 5)) == [0.0, 1.0], "pass@n must be 'any valid'"
+    assert np.allclose(pass_at_k(n, c, 1), c / n), "pass@1 must be c/n"
+    
+    lo, hi = bootstrap_ci([0, 1] * 30)
+    assert lo < 0.5 < hi and hi - lo < 0.4, "Bootstrap CI off for a fair coin"
+    
+    print("✅ pass@k estimator tests passed")
+
+if __name__ == "__main__":
+    test_pass_at_k()
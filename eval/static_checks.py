@@ -8,30 +8,137 @@ import re
 import subprocess
 import tempfile
 import os
+import shutil
+import atexit
+import sys
+import threading
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 
-def parse_lua(text: str) -> bool:
+sys.path.append(os.path.dirname(__file__))
+import patterns
+
+# Lua worker protocol: "<nbytes>\n<chunk>" in, "ok\n" or "err\n" out.
+# A leading "#" line is blanked the same way luaL_loadfile does for luac -p.
+_LUA_WORKER_SCRIPT = r'''
+local load = loadstring or load
+while true do
+  local header = io.read("*l")
+  if not header then break end
+  local n = tonumber(header) or 0
+  local src = ""
+  if n > 0 then src = io.read(n) or "" end
+  if src:sub(1, 1) == "#" then src = src:gsub("^[^\n]*", "", 1) end
+  if load(src, "=candidate") then io.write("ok\n") else io.write("err\n") end
+  io.flush()
+end
+'''
+
+_LUA_INTERPRETERS = ['lua5.1', 'lua51', 'lua']
+
+_luac_version = None  # None = not probed yet, "" = luac unavailable
+
+
+def _lua_version(cmd: List[str]) -> str:
+    """Return the "Lua X.Y" banner of a lua/luac binary, or "" if unusable"""
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    except (FileNotFoundError, PermissionError):
+        return ""
+    if result.returncode != 0:
+        return ""
+    match = re.search(r'Lua \d+\.\d+', result.stdout + result.stderr)
+    return match.group(0) if match else ""
+
+
+def luac_available() -> bool:
+    """Probe for luac once per process"""
+    global _luac_version
+    if _luac_version is None:
+        _luac_version = _lua_version(['luac', '-v'])
+    return bool(_luac_version)
+
+
+class LuaWorker:
     """
-    Parse Lua code using luac if available, else return True (no-op)
+    Long-lived Lua interpreter that syntax-checks chunks fed over a pipe.
     
-    Args:
-        text: Lua code to validate
-        
-    Returns:
-        True if valid Lua or luac not available, False if syntax error
+    Uses the same parser as luac -p (loadstring on the same Lua version),
+    so verdicts match without a fork + temp file per candidate.
     """
-    # Check if luac is available
-    try:
-        result = subprocess.run(['luac', '-v'], capture_output=True, text=True)
-        if result.returncode != 0:
-            # luac not available, return True as no-op
+    
+    def __init__(self, interpreter: str):
+        self.interpreter = interpreter
+        self.proc = None
+        self.pid = None
+        self.lock = threading.Lock()
+    
+    def start(self):
+        self.proc = subprocess.Popen(
+            [self.interpreter, '-e', _LUA_WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self.pid = os.getpid()
+    
+    def close(self):
+        if self.proc is not None and self.pid == os.getpid():
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=5)
+            except Exception:
+                self.proc.kill()
+        self.proc = None
+    
+    def check(self, text: str) -> bool:
+        """Return True if text parses; raises OSError if the worker died"""
+        data = text.encode('utf-8')
+        with self.lock:
+            # A forked child must not share the parent's pipes
+            if self.proc is None or self.pid != os.getpid() or self.proc.poll() is not None:
+                self.start()
+            self.proc.stdin.write(b'%d\n' % len(data) + data)
+            self.proc.stdin.flush()
+            reply = self.proc.stdout.readline()
+        if reply == b'ok\n':
             return True
-    except FileNotFoundError:
-        # luac not available, return True as no-op
+        if reply == b'err\n':
+            return False
+        self.proc = None
+        raise OSError(f"Lua worker {self.interpreter} exited unexpectedly")
+
+
+_lua_worker = None  # None = not probed yet, False = no matching interpreter
+
+
+def get_lua_worker():
+    """Return the shared LuaWorker, or None if no interpreter matches luac"""
+    global _lua_worker
+    if _lua_worker is None:
+        _lua_worker = False
+        if luac_available():
+            luac_path = shutil.which('luac')
+            candidates = [str(Path(luac_path).resolve().parent / 'lua')] if luac_path else []
+            candidates += [c for c in (shutil.which(n) for n in _LUA_INTERPRETERS) if c]
+            for interpreter in candidates:
+                if _lua_version([interpreter, '-v']) == _luac_version:
+                    _lua_worker = LuaWorker(interpreter)
+                    atexit.register(_lua_worker.close)
+                    break
+    return _lua_worker or None
+
+
+def parse_lua_subprocess(text: str) -> bool:
+    """
+    Parse Lua code with a one-shot luac -p on a temp file
+    
+    This is the original per-candidate path; parse_lua falls back to it
+    when no persistent worker is available.
+    """
+    if not luac_available():
         return True
     
-    # luac is available, test the code
     try:
         with tempfile.NamedTemporaryFile(mode='w', suffix='.lua', delete=False) as f:
             f.write(text)
@@ -53,6 +160,32 @@ def parse_lua(text: str) -> bool:
         # If anything goes wrong, return True (no-op)
         return True
 
+def parse_lua(text: str) -> bool:
+    """
+    Parse Lua code using luac if available, else return True (no-op)
+    
+    Candidates go to a persistent Lua worker of the same version as luac;
+    without one, each candidate is checked by a luac -p subprocess.
+    
+    Args:
+        text: Lua code to validate
+        
+    Returns:
+        True if valid Lua or luac not available, False if syntax error
+    """
+    if not luac_available():
+        # luac not available, return True as no-op
+        return True
+    
+    worker = get_lua_worker()
+    if worker is not None:
+        try:
+            return worker.check(text)
+        except OSError:
+            pass
+    
+    return parse_lua_subprocess(text)
+
 def require_regex(text: str, patterns: List[str]) -> bool:
     """
     Check that ALL required regex patterns are present in text
@@ -116,6 +249,12 @@ DOC_FORBIDDEN = [
     r'undefined'
 ]
 
+FAMILY_PATTERNS = {
+    'scaffold': patterns.register('scaffold', SCAFFOLD_REQUIRED, SCAFFOLD_FORBIDDEN),
+    'repair': patterns.register('repair', REPAIR_REQUIRED),
+    'doc': patterns.register('doc', DOC_REQUIRED, DOC_FORBIDDEN),
+}
+
 def validate_family(text: str, family: str) -> bool:
     """
     Validate text matches the requirements for its family
@@ -127,6 +266,31 @@ def validate_family(text: str, family: str) -> bool:
     Returns:
         True if valid for family, False otherwise
     """
+    pattern_set = FAMILY_PATTERNS.get(family)
+    if pattern_set is None:
+        return False
+    
+    # Precompiled pattern checks first - they are far cheaper than a Lua parse
+    if not pattern_set.matches(text):
+        return False
+    
+    # Lua syntax for non-repair items
+    return family == 'repair' or parse_lua(text)
+
+def validate_many(texts: List[str], family: str) -> List[bool]:
+    """
+    validate_family over a batch of candidates for one family
+    
+    Identical candidates (common at low temperature) are checked once.
+    """
+    verdicts: Dict[str, bool] = {}
+    for text in texts:
+        if text not in verdicts:
+            verdicts[text] = validate_family(text, family)
+    return [verdicts[text] for text in texts]
+
+def _validate_family_uncompiled(text: str, family: str) -> bool:
+    """Reference validator: raw pattern strings, parse first (the pre-registry path)"""
     # First check Lua syntax for non-repair items
     if family != 'repair':
         if not parse_lua(text):
@@ -195,7 +359,139 @@ def test_static_checks():
 })'''
     assert not validate_family(doc_invalid, 'doc'), "Invalid doc should fail"
     
+    # Test 7: Persistent worker agrees with one-shot luac -p
+    if get_lua_worker() is not None:
+        snippets = [scaffold_valid, repair_valid, '', '#!/usr/bin/lua\nreturn 1',
+                    'local x = {', 'return "unterminated', 'x = [[long\nstring]]']
+        for snippet in snippets:
+            assert parse_lua(snippet) == parse_lua_subprocess(snippet), f"Verdict mismatch: {snippet!r}"
+    
+    # Test 8: Registry path agrees with the raw-pattern reference path
+    for text, family in _synthetic_candidates(300):
+        assert validate_family(text, family) == _validate_family_uncompiled(text, family), \
+            f"Registry verdict mismatch ({family}): {text!r}"
+    
     print("✅ All static check tests passed!")
 
+def _synthetic_candidates(count: int) -> List[tuple]:
+    """
+    (text, family) pairs mutated from the eval/train references
+    
+    Mutations cover the failure modes the checks look for (truncation,
+    missing fields, forbidden markers, unquoted names); a numbered comment
+    keeps every candidate unique.
+    """
+    import json
+    
+    root = Path(__file__).parent.parent / "data"
+    references = []
+    for path in (root / "eval/luanti_eval.jsonl", root / "train/luanti_train.jsonl"):
+        with open(path, 'r') as f:
+            references.extend((item["output"], item["family"]) for item in map(json.loads, filter(str.strip, f)))
+    
+    mutations = [
+        lambda t: t,
+        lambda t: t[:len(t) // 2],
+        lambda t: re.sub(r'tiles\s*=\s*\{[^}]*\},?', '', t),
+        lambda t: t + '\n-- TODO: more',
+        lambda t: t.replace("register_node('", "register_node(", 1),
+        lambda t: t.replace('minetest.', 'core.'),
+        lambda t: 'local x = nil \n' + t,
+    ]
+    
+    candidates = []
+    for i in range(count):
+        text, family = references[i % len(references)]
+        mutate = mutations[(i // len(references)) % len(mutations)]
+        suffix = f'\n-- candidate {i}' if family != 'repair' else f'\n+-- candidate {i}'
+        candidates.append((mutate(text) + suffix, family))
+    return candidates
+
+def benchmark_validate_many(count: int = 100_000) -> dict:
+    """
+    Throughput of validate_many vs the raw-pattern validate path, same verdicts required
+    """
+    import time
+    
+    candidates = _synthetic_candidates(count)
+    by_family: Dict[str, List[str]] = {}
+    for text, family in candidates:
+        by_family.setdefault(family, []).append(text)
+    parse_lua(candidates[0][0])  # warm up the probe / worker
+    
+    start = time.perf_counter()
+    reference = {family: [_validate_family_uncompiled(t, family) for t in texts]
+                 for family, texts in by_family.items()}
+    reference_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    batched = {family: validate_many(texts, family) for family, texts in by_family.items()}
+    batched_time = time.perf_counter() - start
+    
+    mismatches = sum(a != b for family in by_family for a, b in zip(reference[family], batched[family]))
+    report = {
+        "candidates": count,
+        "valid": sum(sum(v) for v in batched.values()),
+        "mismatches": mismatches,
+        "reference_per_sec": count / reference_time,
+        "validate_many_per_sec": count / batched_time,
+    }
+    
+    print(f"📏 validate_many benchmark over {count} candidates ({report['valid']} valid)")
+    print(f"   raw patterns:  {report['reference_per_sec']:.0f} candidates/s")
+    print(f"   validate_many: {report['validate_many_per_sec']:.0f} candidates/s "
+          f"({reference_time / batched_time:.1f}x)")
+    print(f"   verdict mismatches: {mismatches}")
+    return report
+
+def benchmark_parse_lua(files: List[str], repeat: int = 1) -> dict:
+    """
+    Check verdict parity and throughput of parse_lua vs one-shot luac -p
+    
+    Every instruction/input/output field of the given JSONL files is parsed
+    by both paths; the verdicts must be identical.
+    """
+    import json
+    import time
+    
+    texts = []
+    for path in files:
+        with open(path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    texts.extend(item.get(field, "") for field in ("instruction", "input", "output"))
+    texts = texts * repeat
+    
+    timings = {}
+    verdicts = {}
+    for name, fn in (("persistent", parse_lua), ("subprocess", parse_lua_subprocess)):
+        fn(texts[0])  # warm up the probe / worker
+        start = time.perf_counter()
+        verdicts[name] = [fn(t) for t in texts]
+        timings[name] = time.perf_counter() - start
+    
+    mismatches = sum(a != b for a, b in zip(verdicts["persistent"], verdicts["subprocess"]))
+    report = {
+        "candidates": len(texts),
+        "luac_available": luac_available(),
+        "worker": get_lua_worker().interpreter if get_lua_worker() else None,
+        "mismatches": mismatches,
+        "persistent_per_sec": len(texts) / max(timings["persistent"], 1e-9),
+        "subprocess_per_sec": len(texts) / max(timings["subprocess"], 1e-9),
+    }
+    
+    print(f"📏 parse_lua benchmark over {report['candidates']} candidates (worker: {report['worker']})")
+    print(f"   persistent: {report['persistent_per_sec']:.1f} candidates/s")
+    print(f"   subprocess: {report['subprocess_per_sec']:.1f} candidates/s")
+    print(f"   verdict mismatches: {mismatches}")
+    return report
+
 if __name__ == "__main__":
-    test_static_checks()
\ No newline at end of file
+    import sys
+    if "--bench" in sys.argv:
+        root = Path(__file__).parent.parent / "data"
+        benchmark_parse_lua([str(root / "eval/luanti_eval.jsonl"), str(root / "train/luanti_train.jsonl")])
+        benchmark_validate_many()
+    else:
+        test_static_checks()
\ No newline at end of file
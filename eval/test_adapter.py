@@ -10,155 +10,132 @@ import torch
 from pathlib import Path
 from typing import Dict, List
 import sys
+import os
 
-# Import validation and formatting
-from static_checks import validate_family
-from apply_patch import apply_patch
-sys.path.append('../prompts')
-from formatter import format_for_inference
+# Candidate generation, formatting and validation are shared with the baseline evaluation
+sys.path.append(os.path.dirname(__file__))
+from run_eval import evaluate_items, compute_metrics, format_metric
+from lora_scale import set_lora_scale
+from journal import EvalJournal, journal_path_for
+from gen_cache import GenerationCache, adapter_content_hash
+from pipeline import ValidationPipeline
+from timing import summarize_timing, print_timing
 
-from unsloth import FastLanguageModel
 from peft import PeftModel
 
-def load_base_with_adapter(base_model_name: str, adapter_path: str, scale: float = 1.0):
-    """
-    Load base model + adapter at specified scale
+def load_base(base_model_name: str):
+    """Load the 4-bit base model and tokenizer"""
+    from unsloth import FastLanguageModel
     
-    Args:
-        base_model_name: Base model identifier
-        adapter_path: Path to adapter checkpoint
-        scale: LoRA scaling factor (0.25, 0.5, 1.0)
-    """
-    # Load base model
-    model, tokenizer = FastLanguageModel.from_pretrained(
+    return FastLanguageModel.from_pretrained(
         model_name=base_model_name,
         max_seq_length=2048,
         dtype=None,
         load_in_4bit=True,
     )
-    
+
+def attach_adapter(model, adapter_path: str, scale: float = 1.0):
+    """
+    Wrap a freshly loaded base model with one adapter at the given scale
+    """
     # Load adapter
     model = PeftModel.from_pretrained(model, adapter_path)
     
     # Apply scaling if not 1.0
     if scale != 1.0:
         print(f"🎛️  Applying LoRA scale: {scale}")
-        for name, module in model.named_modules():
-            if hasattr(module, 'lora_B'):
-                for adapter_name in module.lora_B:
-                    if not hasattr(module.lora_B[adapter_name], 'original_weight'):
-                        module.lora_B[adapter_name].original_weight = module.lora_B[adapter_name].weight.data.clone()
-                    module.lora_B[adapter_name].weight.data = module.lora_B[adapter_name].original_weight * scale
+        set_lora_scale(model, scale)
+    
+    return model
+
+def load_base_with_adapter(base_model_name: str, adapter_path: str, scale: float = 1.0):
+    """
+    Load base model + adapter at specified scale
+    
+    Args:
+        base_model_name: Base model identifier
+        adapter_path: Path to adapter checkpoint
+        scale: LoRA scaling factor (0.25, 0.5, 1.0)
+    """
+    from unsloth import FastLanguageModel
+    
+    # Load base model
+    model, tokenizer = load_base(base_model_name)
+    
+    # Load adapter
+    model = attach_adapter(model, adapter_path, scale)
     
     # Set for inference
     FastLanguageModel.for_inference(model)
     
     return model, tokenizer
 
-def generate_candidates(model, tokenizer, prompt: str, k: int = 5, 
-                       temperature: float = 0.2, top_p: float = 0.9, 
-                       max_new_tokens: int = 300) -> List[str]:
-    """Generate k candidates - identical to baseline evaluation"""
-    candidates = []
-    
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-    
-    for i in range(k):
-        with torch.no_grad():
-            outputs = model.generate(
-                **inputs,
-                max_new_tokens=max_new_tokens,
-                temperature=temperature,
-                top_p=top_p,
-                do_sample=True,
-                pad_token_id=tokenizer.eos_token_id,
-            )
-        
-        full_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        response = full_text[len(prompt):].strip()
-        candidates.append(response)
-    
-    return candidates
+def adapter_name_for(adapter_path: str) -> str:
+    """PEFT adapter name for a checkpoint directory (no dots allowed)"""
+    return Path(adapter_path).name.replace('.', '_')
 
-def evaluate_item(item: Dict, model, tokenizer, k: int = 5, **gen_kwargs) -> Dict:
-    """Evaluate single item - identical logic to baseline"""
-    prompt = format_for_inference(item["instruction"], item.get("input", ""))
-    candidates = generate_candidates(model, tokenizer, prompt, k, **gen_kwargs)
+def attach_adapters(model, adapter_paths: List[str]):
+    """
+    Attach every checkpoint to one base model as a named adapter
     
-    results = []
-    for i, candidate in enumerate(candidates):
-        
-        if item["family"] == "repair":
-            base_code = item.get("input", "")
-            patched_code = apply_patch(base_code, candidate)
-            
-            if patched_code.startswith("ERROR:"):
-                valid = False
-            else:
-                valid = validate_family(patched_code, "scaffold")
+    Returns:
+        PeftModel holding all adapters; activate one with activate_adapter
+    """
+    for i, adapter_path in enumerate(adapter_paths):
+        name = adapter_name_for(adapter_path)
+        if i == 0:
+            model = PeftModel.from_pretrained(model, adapter_path, adapter_name=name)
         else:
-            valid = validate_family(candidate, item["family"])
-        
-        results.append({
-            "candidate_id": i,
-            "output": candidate,
-            "valid": valid
-        })
-    
-    pass_at_1 = 1 if len(results) > 0 and results[0]["valid"] else 0
-    pass_at_k = 1 if any(r["valid"] for r in results) else 0
-    
-    return {
-        "instruction": item["instruction"],
-        "input": item.get("input", ""),
-        "family": item["family"],
-        "candidates": results,
-        "pass_at_1": pass_at_1,
-        "pass_at_k": pass_at_k
-    }
+            model.load_adapter(adapter_path, adapter_name=name)
+    return model
 
-def test_single_adapter(base_model: str, adapter_path: str, eval_file: str, 
-                       scale: float, k: int, seed: int, output_file: str, **gen_kwargs):
-    """Test a single adapter at a specific scale"""
+def activate_adapter(model, adapter_name: str, scale: float = 1.0):
+    """
+    Switch the active adapter and set its LoRA scale in place
+    """
+    model.set_adapter(adapter_name)
+    set_lora_scale(model, scale, adapter_name)
+
+def open_journal(output_file: str, base_model: str, adapter_path: str, eval_file: str,
+                 scale: float, k: int, seed: int, batched: bool = True, token_budget: int = None,
+                 fresh: bool = False, n_samples: int = None, **gen_kwargs) -> EvalJournal:
+    """Journal for one (checkpoint, scale) results file"""
+    return EvalJournal(journal_path_for(output_file), {
+        "base_model": base_model, "adapter_path": adapter_path, "scale": scale,
+        "eval_file": eval_file, "k": k, "n_samples": n_samples, "seed": seed, "batched": batched,
+        "token_budget": token_budget, "generation_params": gen_kwargs
+    }, fresh=fresh)
+
+def evaluate_adapter(model, tokenizer, eval_items: List[Dict], journal: EvalJournal, base_model: str,
+                     adapter_path: str, eval_file: str, scale: float, k: int, seed: int, output_file: str,
+                     batched: bool = True, token_budget: int = None, cache: GenerationCache = None,
+                     pipeline: ValidationPipeline = None, n_samples: int = None, **gen_kwargs) -> Dict:
+    """
+    Evaluate the currently active adapter and save its results JSON
     
-    print(f"🧪 Testing adapter: {adapter_path} at scale {scale}")
+    Items already in the journal are skipped; model may be None when the
+    journal is complete. A GenerationCache is keyed to this adapter's
+    content hash and scale.
+    """
     
-    # Set seeds
+    # Seed right before generation so results do not depend on how the model was loaded
     torch.manual_seed(seed)
     
-    # Load model with adapter
-    model, tokenizer = load_base_with_adapter(base_model, adapter_path, scale)
-    
-    # Load eval data
-    eval_items = []
-    with open(eval_file, 'r') as f:
-        for line in f:
-            eval_items.append(json.loads(line))
+    if cache is not None:
+        cache.set_context({"base_model": base_model, "adapter": adapter_content_hash(adapter_path),
+                           "scale": scale, "seed": seed})
     
     # Evaluate all items
-    results = []
-    for i, item in enumerate(eval_items):
-        print(f"   Item {i+1}/{len(eval_items)}: {item['family']}")
-        result = evaluate_item(item, model, tokenizer, k, **gen_kwargs)
-        results.append(result)
+    if not journal.is_complete(len(eval_items)):
+        evaluate_items(eval_items, model, tokenizer, k, batched=batched,
+                       token_budget=token_budget, journal=journal, cache=cache,
+                       pipeline=pipeline, n_samples=n_samples, **gen_kwargs)
+    
+    # Aggregate from the journal
+    results = journal.ordered_results(len(eval_items))
     
     # Calculate metrics
-    total_items = len(results)
-    pass_at_1_total = sum(r["pass_at_1"] for r in results)
-    pass_at_k_total = sum(r["pass_at_k"] for r in results)
-    
-    # Per-family metrics
-    family_metrics = {}
-    for family in ['scaffold', 'repair', 'doc']:
-        family_results = [r for r in results if r['family'] == family]
-        if family_results:
-            family_pass_1 = sum(r["pass_at_1"] for r in family_results)
-            family_pass_k = sum(r["pass_at_k"] for r in family_results)
-            family_metrics[family] = {
-                "count": len(family_results),
-                "pass_at_1": family_pass_1 / len(family_results),
-                "pass_at_k": family_pass_k / len(family_results)
-            }
+    overall_metrics, family_metrics = compute_metrics(results)
     
     # Save results
     final_results = {
@@ -169,12 +146,10 @@ def test_single_adapter(base_model: str, adapter_path: str, eval_file: str,
         "generation_params": gen_kwargs,
         "seed": seed,
         "k": k,
-        "overall_metrics": {
-            "total_items": total_items,
-            "pass_at_1": pass_at_1_total / total_items,
-            "pass_at_k": pass_at_k_total / total_items
-        },
+        "n_samples": n_samples or k,
+        "overall_metrics": overall_metrics,
         "family_metrics": family_metrics,
+        "timing": summarize_timing(journal, len(eval_items)),
         "detailed_results": results
     }
     
@@ -182,14 +157,132 @@ def test_single_adapter(base_model: str, adapter_path: str, eval_file: str,
         json.dump(final_results, f, indent=2)
     
     print(f"✅ Results saved: {output_file}")
-    print(f"   pass@1: {pass_at_1_total}/{total_items} = {pass_at_1_total/total_items:.2%}")
-    print(f"   pass@{k}: {pass_at_k_total}/{total_items} = {pass_at_k_total/total_items:.2%}")
+    print(f"   pass@1: {format_metric(overall_metrics, 'pass_at_1')}")
+    print(f"   pass@{k}: {format_metric(overall_metrics, 'pass_at_k')}")
+    print_timing(final_results["timing"])
+    
+    return final_results
+
+def load_eval_items(eval_file: str) -> List[Dict]:
+    """Load eval JSONL items"""
+    eval_items = []
+    with open(eval_file, 'r') as f:
+        for line in f:
+            eval_items.append(json.loads(line))
+    return eval_items
+
+def test_single_adapter(base_model: str, adapter_path: str, eval_file: str, 
+                       scale: float, k: int, seed: int, output_file: str, 
+                       batched: bool = True, token_budget: int = None, fresh: bool = False,
+                       cache: GenerationCache = None, pipeline: ValidationPipeline = None,
+                       n_samples: int = None, **gen_kwargs):
+    """Test a single adapter at a specific scale"""
+    
+    print(f"🧪 Testing adapter: {adapter_path} at scale {scale}")
+    
+    # Load eval data
+    eval_items = load_eval_items(eval_file)
+    journal = open_journal(output_file, base_model, adapter_path, eval_file, scale, k, seed,
+                           batched, token_budget, fresh, n_samples=n_samples, **gen_kwargs)
+    
+    # Load model with adapter (skipped if this pair already finished)
+    model = tokenizer = None
+    if not journal.is_complete(len(eval_items)):
+        model, tokenizer = load_base_with_adapter(base_model, adapter_path, scale)
+    
+    evaluate_adapter(model, tokenizer, eval_items, journal, base_model, adapter_path, eval_file,
+                     scale, k, seed, output_file, batched=batched, token_budget=token_budget,
+                     cache=cache, pipeline=pipeline, n_samples=n_samples, **gen_kwargs)
+
+def sweep_adapters(base_model: str, adapter_paths: List[str], eval_file: str, 
+                   scales: List[float], k: int, seed: int, out_dir: str,
+                   batched: bool = True, token_budget: int = None, fresh: bool = False,
+                   cache: GenerationCache = None, pipeline: ValidationPipeline = None,
+                   n_samples: int = None, **gen_kwargs):
+    """
+    Test every checkpoint at every scale with a single base model load
+    
+    Checkpoints are attached as named adapters and switched with set_adapter;
+    scales are applied through the LoRA scaling factors.
+    """
+    eval_items = load_eval_items(eval_file)
+    
+    pairs = []
+    for adapter_path in adapter_paths:
+        for scale in scales:
+            output_file = str(Path(out_dir) / f"{Path(adapter_path).name}__scale-{scale}.json")
+            journal = open_journal(output_file, base_model, adapter_path, eval_file, scale, k, seed,
+                                   batched, token_budget, fresh, n_samples=n_samples, **gen_kwargs)
+            pairs.append((adapter_path, scale, output_file, journal))
+    
+    model = tokenizer = None
+    if not all(journal.is_complete(len(eval_items)) for *_, journal in pairs):
+        from unsloth import FastLanguageModel
+        
+        print(f"📥 Loading base once for {len(adapter_paths)} adapters x {len(scales)} scales")
+        model, tokenizer = load_base(base_model)
+        model = attach_adapters(model, adapter_paths)
+        FastLanguageModel.for_inference(model)
+    
+    for adapter_path, scale, output_file, journal in pairs:
+        print(f"🧪 Testing adapter: {adapter_path} at scale {scale}")
+        if model is not None:
+            activate_adapter(model, adapter_name_for(adapter_path), scale)
+        evaluate_adapter(model, tokenizer, eval_items, journal, base_model, adapter_path, eval_file,
+                         scale, k, seed, output_file, batched=batched,
+                         token_budget=token_budget, cache=cache, pipeline=pipeline, n_samples=n_samples,
+                         **gen_kwargs)
+
+def test_sweep_matches_reload():
+    """CPU check: hot-swapped adapters/scales give the same outputs as reloading"""
+    import tempfile
+    from peft import LoraConfig, get_peft_model
+    from tiny_lm import make_tiny_tokenizer, make_tiny_model
+    from run_eval import generate_candidates
+    from formatter import format_for_inference
+    
+    tokenizer = make_tiny_tokenizer()
+    prompt = format_for_inference("Register a simple node in Luanti")
+    # top_p this small keeps only the argmax token, so outputs are deterministic
+    gen_kwargs = dict(k=2, top_p=1e-6, max_new_tokens=12)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        adapter_paths = []
+        for i in range(2):
+            config = LoraConfig(r=4, lora_alpha=8, target_modules=["q_proj", "k_proj", "v_proj", "o_proj"],
+                                init_lora_weights=False)
+            torch.manual_seed(100 + i)
+            peft_model = get_peft_model(make_tiny_model(tokenizer), config)
+            path = os.path.join(tmp, f"ckpt-{i}")
+            peft_model.save_pretrained(path)
+            adapter_paths.append(path)
+        
+        sweep = attach_adapters(make_tiny_model(tokenizer), adapter_paths)
+        sweep.eval()
+        
+        for adapter_path in adapter_paths:
+            for scale in (0.25, 1.0, 0.5):
+                reload = attach_adapter(make_tiny_model(tokenizer), adapter_path, scale)
+                reload.eval()
+                activate_adapter(sweep, adapter_name_for(adapter_path), scale)
+                
+                ids = tokenizer(prompt, return_tensors="pt")
+                with torch.no_grad():
+                    assert torch.allclose(reload(**ids).logits, sweep(**ids).logits, atol=1e-5), \
+                        f"Logits differ for {adapter_path} at scale {scale}"
+                assert (generate_candidates(reload, tokenizer, prompt, **gen_kwargs) ==
+                        generate_candidates(sweep, tokenizer, prompt, **gen_kwargs)), \
+                    f"Outputs differ for {adapter_path} at scale {scale}"
+    
+    print("✅ Adapter sweep matches reload path")
 
 def main():
     """Main adapter testing function - exact CLI as specified"""
     parser = argparse.ArgumentParser(description="Test adapters at multiple scales")
     parser.add_argument("--base", required=True, help="Base model name")
-    parser.add_argument("--adapters_dir", required=True, help="Directory containing adapter checkpoints")
+    parser.add_argument("--adapters_dir", default=None, help="Directory containing adapter checkpoints")
+    parser.add_argument("--adapter", action="append", default=None, 
+                       help="Evaluate only this checkpoint directory (repeatable); replaces --adapters_dir")
     parser.add_argument("--eval", required=True, help="Evaluation JSONL file")
     parser.add_argument("--template", required=True, help="Template file")
     parser.add_argument("--k", type=int, default=5, help="Number of candidates")
@@ -198,6 +291,21 @@ def main():
     parser.add_argument("--max_new_tokens", type=int, default=300, help="Max new tokens")
     parser.add_argument("--scales", nargs="+", type=float, default=[0.25, 0.5, 1.0], help="LoRA scales to test")
     parser.add_argument("--seed", type=int, default=3407, help="Random seed")
+    parser.add_argument("--sequential_candidates", action="store_true", 
+                       help="Generate the k candidates with k separate generate() calls")
+    parser.add_argument("--token_budget", type=int, default=None, 
+                       help="Batch prompts across items up to this many padded tokens per generate() call")
+    parser.add_argument("--sweep", action="store_true", 
+                       help="Load the base once and hot-swap adapters/scales instead of reloading per pair")
+    parser.add_argument("--fresh", action="store_true", 
+                       help="Discard existing result journals in --out_dir and start over")
+    parser.add_argument("--cache_dir", default=None, 
+                       help="Directory for the generated-candidate cache (disabled if unset)")
+    parser.add_argument("--cache_max_mb", type=int, default=2048, help="Size bound for --cache_dir")
+    parser.add_argument("--validation_workers", type=int, default=0, 
+                       help="Validate candidates in this many worker processes while generating (0 = inline)")
+    parser.add_argument("--n_samples", type=int, default=None, 
+                       help="Candidates sampled per item for unbiased pass@k (default: k)")
     parser.add_argument("--out_dir", required=True, help="Output directory for results")
     
     args = parser.parse_args()
@@ -206,37 +314,87 @@ def main():
     Path(args.out_dir).mkdir(parents=True, exist_ok=True)
     
     # Find all adapter checkpoints
-    adapters_dir = Path(args.adapters_dir)
-    checkpoint_dirs = [d for d in adapters_dir.iterdir() if d.is_dir() and d.name.startswith('ckpt-')]
-    checkpoint_dirs.sort()  # Process in order
-    
-    if not checkpoint_dirs:
-        raise FileNotFoundError(f"No checkpoint directories found in {adapters_dir}")
+    if args.adapter:
+        checkpoint_dirs = [Path(a) for a in args.adapter]
+        missing = [str(d) for d in checkpoint_dirs if not d.is_dir()]
+        if missing:
+            raise FileNotFoundError(f"Checkpoint directories not found: {missing}")
+    elif args.adapters_dir:
+        adapters_dir = Path(args.adapters_dir)
+        checkpoint_dirs = [d for d in adapters_dir.iterdir()
+                           if d.is_dir() and d.name.startswith(('ckpt-', 'checkpoint-'))]
+        checkpoint_dirs.sort()  # Process in order
+        if not checkpoint_dirs:
+            raise FileNotFoundError(f"No checkpoint directories found in {adapters_dir}")
+    else:
+        parser.error("pass --adapters_dir or --adapter")
     
     print(f"🔍 Found {len(checkpoint_dirs)} adapter checkpoints")
     print(f"🎯 Testing {len(args.scales)} scales: {args.scales}")
     
-    # Test each checkpoint at each scale
-    for checkpoint_dir in checkpoint_dirs:
-        for scale in args.scales:
-            checkpoint_name = checkpoint_dir.name
-            output_file = Path(args.out_dir) / f"{checkpoint_name}__scale-{scale}.json"
-            
-            test_single_adapter(
-                base_model=args.base,
-                adapter_path=str(checkpoint_dir),
-                eval_file=args.eval,
-                scale=scale,
-                k=args.k,
-                seed=args.seed,
-                output_file=str(output_file),
-                temperature=args.temperature,
-                top_p=args.top_p,
-                max_new_tokens=args.max_new_tokens
-            )
+    cache = None
+    if args.cache_dir:
+        cache = GenerationCache(args.cache_dir, {}, max_bytes=args.cache_max_mb * 1024**2)
+    
+    # One worker pool shared by every checkpoint/scale pair
+    pipeline = ValidationPipeline(args.validation_workers) if args.validation_workers else None
+    
+    if args.sweep:
+        # Load the base once, hot-swap adapters and scales
+        sweep_adapters(
+            base_model=args.base,
+            adapter_paths=[str(d) for d in checkpoint_dirs],
+            eval_file=args.eval,
+            scales=args.scales,
+            k=args.k,
+            seed=args.seed,
+            out_dir=args.out_dir,
+            batched=not args.sequential_candidates,
+            token_budget=args.token_budget,
+            fresh=args.fresh,
+            cache=cache,
+            pipeline=pipeline,
+            n_samples=args.n_samples,
+            temperature=args.temperature,
+            top_p=args.top_p,
+            max_new_tokens=args.max_new_tokens
+        )
+    else:
+        # Test each checkpoint at each scale
+        for checkpoint_dir in checkpoint_dirs:
+            for scale in args.scales:
+                checkpoint_name = checkpoint_dir.name
+                output_file = Path(args.out_dir) / f"{checkpoint_name}__scale-{scale}.json"
+                
+                test_single_adapter(
+                    base_model=args.base,
+                    adapter_path=str(checkpoint_dir),
+                    eval_file=args.eval,
+                    scale=scale,
+                    k=args.k,
+                    seed=args.seed,
+                    output_file=str(output_file),
+                    batched=not args.sequential_candidates,
+                    token_budget=args.token_budget,
+                    fresh=args.fresh,
+                    cache=cache,
+                    pipeline=pipeline,
+                    n_samples=args.n_samples,
+                    temperature=args.temperature,
+                    top_p=args.top_p,
+                    max_new_tokens=args.max_new_tokens
+                )
+    
+    if pipeline is not None:
+        pipeline.close()
+    if cache is not None:
+        cache.report()
     
     print(f"\n🎉 All adapter tests complete!")
     print(f"📁 Results in: {args.out_dir}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "--self_test" in sys.argv:
+        test_sweep_matches_reload()
+    else:
+        main()
\ No newline at end of file
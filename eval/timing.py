@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Evaluation timing - prefill/decode per generate() call, tokens and
+validation time per candidate
+Timings travel beside the item results (journal records, the results
+JSON "timing" block), so the results themselves stay reproducible
+"""
+
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+class GenerationTimer:
+    """
+    Streamer for model.generate(streamer=...) that timestamps decoding
+
+    generate() hands the prompt to put() first, then the sampled token of
+    every row after each step. prefill_s runs from construction to the
+    first sampled token (time to first token); decode_s from there to
+    end(). A row is done at its first EOS: its tokens include the EOS, as
+    in count_generated_tokens, and its decode_s is when it got there.
+    """
+
+    def __init__(self, eos_token_id: int):
+        self.eos_token_id = eos_token_id
+        self.start = time.perf_counter()
+        self.prompt_seen = False
+        self.first_token = None
+        self.finished = None
+        self.steps = 0
+        self.end_time = None
+
+    def put(self, value):
+        if not self.prompt_seen:
+            self.prompt_seen = True
+            return
+        now = time.perf_counter()
+        if self.first_token is None:
+            self.first_token = now
+            self.finished = [None] * value.shape[0]
+        self.steps += 1
+        for row, token in enumerate(value.reshape(-1).tolist()):
+            if token == self.eos_token_id and self.finished[row] is None:
+                self.finished[row] = (self.steps, now)
+
+    def end(self):
+        self.end_time = time.perf_counter()
+
+    def report(self) -> Dict:
+        """{"prefill_s", "decode_s", "generated_tokens", "candidates": [{"tokens", "decode_s"}]} per row"""
+        end = self.end_time or time.perf_counter()
+        first = self.first_token or end
+        candidates = [{"tokens": done[0] if done else self.steps,
+                       "decode_s": (done[1] if done else end) - first}
+                      for done in (self.finished or [])]
+        return {
+            "prefill_s": first - self.start,
+            "decode_s": end - first,
+            "generated_tokens": sum(c["tokens"] for c in candidates),
+            "candidates": candidates,
+        }
+
+def merge_reports(reports: List[Dict]) -> Dict:
+    """One report for k sequential generate() calls: times and tokens add up"""
+    return {
+        "prefill_s": sum(r["prefill_s"] for r in reports),
+        "decode_s": sum(r["decode_s"] for r in reports),
+        "generated_tokens": sum(r["generated_tokens"] for r in reports),
+        "candidates": [c for r in reports for c in r["candidates"]],
+    }
+
+def split_batch_report(report: Dict, prompts: int, k: int) -> List[Dict]:
+    """
+    Per-prompt reports for a cross-item batch (rows grouped p0 x k, p1 x k, ...)
+
+    Prefill and decode time are shared by the batch, so each prompt is
+    charged an equal share; summing over items gives the real GPU time.
+    Per-candidate decode_s stays the row's own time to EOS.
+    """
+    if not report:  # replayed from the generation cache
+        return [{} for _ in range(prompts)]
+    split = []
+    for p in range(prompts):
+        candidates = report["candidates"][p * k:(p + 1) * k]
+        split.append({
+            "prefill_s": report["prefill_s"] / prompts,
+            "decode_s": report["decode_s"] / prompts,
+            "generated_tokens": sum(c["tokens"] for c in candidates),
+            "batch_prompts": prompts,
+            "candidates": candidates,
+        })
+    return split
+
+def item_timing(generation: Optional[Dict], validation: List[float]) -> Dict:
+    """
+    Journal timing record for one item
+
+    generation is the item's generate() report, empty when its candidates
+    came from the generation cache; validation is seconds per candidate.
+    """
+    timing = {"cached": not generation, "validation_s": sum(validation)}
+    candidates = [{} for _ in validation]
+    if generation:
+        candidates = generation["candidates"]
+        timing.update({key: value for key, value in generation.items() if key != "candidates"})
+    timing["candidates"] = [{**c, "validation_s": v} for c, v in zip(candidates, validation)]
+    return timing
+
+def summarize_timing(journal, total_items: int) -> Dict:
+    """
+    "timing" block for a results JSON, from the journal's records
+
+    wall_seconds adds up the journal's sessions (first run and resumes),
+    each from its start to its last finished item, so downtime between a
+    crash and the resume is not counted.
+    """
+    items = [journal.timings.get(i) for i in range(total_items)]
+    timed = [t for t in items if t]
+    generated = [t for t in timed if not t["cached"]]
+    decode_s = sum(t["decode_s"] for t in generated)
+    tokens = sum(t["generated_tokens"] for t in generated)
+    sessions = journal.sessions
+
+    def iso(ts):
+        return datetime.fromtimestamp(ts).isoformat() if ts else None
+
+    return {
+        "started_at": iso(sessions[0][0]) if sessions else None,
+        "ended_at": iso(sessions[-1][1]) if sessions else None,
+        "wall_seconds": journal.wall_seconds() if sessions else None,
+        "sessions": len(sessions),
+        "items_timed": len(timed),
+        "items_cached": len(timed) - len(generated),
+        "prefill_s": sum(t["prefill_s"] for t in generated),
+        "decode_s": decode_s,
+        "validation_s": sum(t["validation_s"] for t in timed),
+        "generated_tokens": tokens,
+        "decode_tokens_per_sec": tokens / decode_s if decode_s else None,
+        "items": items,
+    }
+
+def print_timing(timing: Dict):
+    """One-line summary of where an evaluation's time went"""
+    wall = timing["wall_seconds"]
+    if not wall:
+        return
+    phases = ", ".join(f"{name} {timing[key] / wall:.0%}"
+                       for name, key in (("prefill", "prefill_s"), ("decode", "decode_s"),
+                                         ("validation", "validation_s")))
+    print(f"⏱️  {wall / 60:.1f} min for {timing['items_timed']} items ({phases})")
+    if timing["decode_tokens_per_sec"]:
+        print(f"   {timing['generated_tokens']} tokens at {timing['decode_tokens_per_sec']:.1f} tokens/s, "
+              f"{timing['items_cached']} items replayed from cache")
+
+def test_generation_timer():
+    """Timer token counts agree with count_generated_tokens on a tiny model"""
+    import torch
+    from run_eval import count_generated_tokens
+    from tiny_lm import make_tiny_model_and_tokenizer
+
+    model, tokenizer = make_tiny_model_and_tokenizer()
+    inputs = tokenizer("minetest.register_node(", return_tensors="pt")
+    torch.manual_seed(3407)
+    timer = GenerationTimer(tokenizer.eos_token_id)
+    sequences = model.generate(**inputs, num_return_sequences=4, do_sample=True, temperature=1.0,
+                               max_new_tokens=24, pad_token_id=tokenizer.eos_token_id, streamer=timer)
+    report = timer.report()
+
+    prompt_length = inputs["input_ids"].shape[1]
+    assert report["generated_tokens"] == count_generated_tokens(tokenizer, sequences, prompt_length)
+    assert [c["tokens"] for c in report["candidates"]] == \
+        [count_generated_tokens(tokenizer, row[None], prompt_length) for row in sequences]
+    assert report["prefill_s"] > 0 and report["decode_s"] > 0
+    assert all(0 <= c["decode_s"] <= report["decode_s"] for c in report["candidates"])
+
+    split = split_batch_report(merge_reports([report, report]), prompts=2, k=4)
+    assert [s["generated_tokens"] for s in split] == [report["generated_tokens"]] * 2
+    assert abs(sum(s["decode_s"] for s in split) - 2 * report["decode_s"]) < 1e-9
+
+    timing = item_timing({}, [0.1, 0.2])
+    assert timing["cached"] and abs(timing["validation_s"] - 0.3) < 1e-9 and len(timing["candidates"]) == 2
+
+    print("✅ Generation timer tests passed")
+
+if __name__ == "__main__":
+    import os
+    import sys
+    sys.path.append(os.path.dirname(__file__))
+    test_generation_timer()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Tiny causal LM + character tokenizer for CPU checks
+Built in memory - no downloads, no GPU, no Unsloth
+"""
+
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers, decoders
+from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+def make_tiny_tokenizer() -> PreTrainedTokenizerFast:
+    """Character-level tokenizer covering printable ASCII plus newline/tab"""
+    vocab = {"<pad>": 0, "<s>": 1, "</s>": 2}
+    for ch in ["\n", "\t"] + [chr(i) for i in range(32, 127)]:
+        vocab[ch] = len(vocab)
+
+    tok = Tokenizer(models.WordLevel(vocab, unk_token="<pad>"))
+    tok.pre_tokenizer = pre_tokenizers.Split("", "isolated")
+    tok.decoder = decoders.Fuse()
+
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tok,
+        bos_token="<s>",
+        eos_token="</s>",
+        pad_token="<pad>",
+    )
+
+def make_tiny_model(tokenizer, seed: int = 3407, layers: int = 2) -> LlamaForCausalLM:
+    """Randomly initialised Llama with q/k/v/o projections for LoRA tests"""
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=layers,
+        num_attention_heads=4,
+        num_key_value_heads=4,
+        max_position_embeddings=2048,
+        pad_token_id=tokenizer.pad_token_id,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+    )
+    model = LlamaForCausalLM(config)
+    model.eval()
+    return model
+
+def make_tiny_model_and_tokenizer(seed: int = 3407):
+    """Return (model, tokenizer) ready for generate() on CPU"""
+    tokenizer = make_tiny_tokenizer()
+    return make_tiny_model(tokenizer, seed), tokenizer
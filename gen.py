@@ -2,13 +2,16 @@
 from unsloth import FastLanguageModel
 from peft import PeftModel
 import torch, sys
+from eval.lora_scale import set_lora_scale
 
 BASE="unsloth/gpt-oss-20b-unsloth-bnb-4bit"
 PEFT="outputs_luanti_best"
 prompt = sys.argv[1] if len(sys.argv)>1 else "Create a Luanti node that emits light level 14 and drops itself when dug."
+scale = float(sys.argv[2]) if len(sys.argv)>2 else 1.0  # relative to the (already baked) adapter scale
 
 model, tok = FastLanguageModel.from_pretrained(model_name=BASE, load_in_4bit=True, dtype=None, max_seq_length=2048)
 model = PeftModel.from_pretrained(model, PEFT)
+if scale != 1.0: set_lora_scale(model, scale)
 FastLanguageModel.for_inference(model)
 
 x = tok(f"### Instruction:\n{prompt}\n\n### Response:\n", return_tensors="pt").to("cuda")
@@ -4,15 +4,86 @@ IIR Template Formatter - NO DEVIATIONS
 Implements exact conditional logic for Input block
 """
 
+import json
+import os
 import re
 from pathlib import Path
+from string import Formatter
+from typing import Dict, Iterable, List, Tuple
+
+TEMPLATE_PATH = Path(__file__).parent / "iir_template.txt"
 
 def load_template() -> str:
     """Load the IIR template"""
-    template_path = Path(__file__).parent / "iir_template.txt"
-    with open(template_path, 'r') as f:
+    with open(TEMPLATE_PATH, 'r') as f:
         return f.read()
 
+_TRAILING_WS = re.compile(r'[^\S\n]\n')
+
+def _rstrip_lines(text: str) -> str:
+    """Right-strip every line; most values have nothing to strip and are returned as-is"""
+    if _TRAILING_WS.search(text) is None and not text[-1:].isspace():
+        return text
+    return '\n'.join(line.rstrip() for line in text.split('\n'))
+
+class CompiledTemplate:
+    """
+    IIR template pre-split into its with-input and without-input variants
+    
+    Each variant is a list of (literal, field) segments with the literals
+    already right-stripped per line. When every field sits alone on its
+    line, stripping each value separately gives exactly the same result as
+    stripping the formatted prompt, so formatting is a join. Otherwise the
+    variant falls back to format + per-line strip of the whole prompt.
+    """
+    
+    def __init__(self, text: str):
+        with_input = text.replace("{{INPUT_BLOCK}}", ", some of which is provided as input")
+        with_input = with_input.replace("{{IF_INPUT}}", "").replace("{{END_IF_INPUT}}", "")
+        without_input = text.replace("{{INPUT_BLOCK}}", "")
+        without_input = re.sub(r'{{IF_INPUT}}.*?{{END_IF_INPUT}}', '', without_input, flags=re.DOTALL)
+        self.variants = {True: self._compile(with_input), False: self._compile(without_input)}
+    
+    @staticmethod
+    def _compile(variant: str) -> Tuple[str, List[Tuple[str, str]]]:
+        segments = [(literal, field) for literal, field, _, _ in Formatter().parse(variant)]
+        isolated = True
+        for i, (literal, field) in enumerate(segments):
+            if field is None:
+                continue
+            before = literal if literal or i == 0 else "\n"  # adjacent fields share a line
+            after = segments[i + 1][0] if i + 1 < len(segments) else ""
+            if (before and not before.endswith('\n')) or (after and not after.startswith('\n')) or \
+                    (i + 1 < len(segments) and not after and segments[i + 1][1] is not None):
+                isolated = False
+        if not isolated:
+            return variant, None
+        return variant, [(_rstrip_lines(literal), field) for literal, field in segments]
+    
+    def format(self, instruction: str, input_text: str = "", output: str = "") -> str:
+        variant, segments = self.variants[bool(input_text and input_text.strip())]
+        values = {"instruction": instruction, "input": input_text, "output": output}
+        if segments is None:
+            return _rstrip_lines(variant.format(**values))
+        parts = []
+        for literal, field in segments:
+            parts.append(literal)
+            if field is not None:
+                parts.append(_rstrip_lines(values[field]))
+        return ''.join(parts)
+
+_compiled: Dict[str, Tuple[int, int, CompiledTemplate]] = {}
+
+def compile_template(path: Path = TEMPLATE_PATH) -> CompiledTemplate:
+    """Compiled template, recompiled only when the file's mtime or size changes"""
+    st = os.stat(path)
+    cached = _compiled.get(str(path))
+    if cached is None or cached[:2] != (st.st_mtime_ns, st.st_size):
+        with open(path, 'r') as f:
+            cached = (st.st_mtime_ns, st.st_size, CompiledTemplate(f.read()))
+        _compiled[str(path)] = cached
+    return cached[2]
+
 def format_prompt(instruction: str, input_text: str = "", output: str = "") -> str:
     """
     Format prompt using exact IIR template logic
@@ -25,6 +96,10 @@ def format_prompt(instruction: str, input_text: str = "", output: str = "") -> s
     Returns:
         Formatted prompt string
     """
+    return compile_template().format(instruction, input_text, output)
+
+def _format_prompt_uncached(instruction: str, input_text: str = "", output: str = "") -> str:
+    """Reference implementation: re-read and re-process the template on every call"""
     template = load_template()
     
     # Handle conditional INPUT_BLOCK
@@ -61,12 +136,28 @@ def format_for_training(item: dict) -> str:
 
 def format_for_inference(instruction: str, input_text: str = "") -> str:
     """Format for inference (no output)"""
-    formatted = format_prompt(instruction, input_text, "")
+    return _inference_tail(format_prompt(instruction, input_text, ""))
+
+def _inference_tail(formatted: str) -> str:
     # Remove the trailing "### Response:\n" for inference
     if formatted.endswith("### Response:\n"):
         formatted = formatted[:-15] + "### Response:"
     return formatted
 
+def format_batch(items: Iterable[dict], for_inference: bool = False) -> List[str]:
+    """
+    Format a whole dataset with one template lookup
+    
+    Args:
+        items: Dicts with instruction, optional input and (for training) output
+        for_inference: Format like format_for_inference (no output)
+    """
+    template = compile_template()
+    if for_inference:
+        return [_inference_tail(template.format(item["instruction"], item.get("input", ""), ""))
+                for item in items]
+    return [template.format(item["instruction"], item.get("input", ""), item["output"]) for item in items]
+
 # Unit tests to verify identical formatting between train and eval
 def test_formatter():
     """Test cases to ensure train/eval formatting is identical"""
@@ -98,5 +189,76 @@ def test_formatter():
     
     print("✅ Formatter tests passed - train/eval formatting is identical")
 
+def test_compiled_template():
+    """Compiled template and format_batch give byte-identical prompts to the uncached path"""
+    item1 = {"instruction": "Register a simple node in Luanti", "input": "",
+             "output": "minetest.register_node('mymod:simple', {description = 'Simple Node'})"}
+    item2 = {"instruction": "Fix this Lua code", "input": "minetest.register_node('broken', {tiles = })",
+             "output": "minetest.register_node('fixed', {tiles = {'default_stone.png'}})"}
+    
+    # Compiled template matches the re-read-per-call reference, whitespace edge cases included
+    cases = [item1, item2,
+             {"instruction": "Trailing  \nspaces\t", "input": "  \n", "output": "x = 1   \n  y = {}  "},
+             {"instruction": "Braces {} and {input}", "input": "code {\n}  ", "output": ""}]
+    data_dir = Path(__file__).parent.parent / "data"
+    for path in (data_dir / "train/luanti_train.jsonl", data_dir / "eval/luanti_eval.jsonl"):
+        if path.exists():
+            with open(path, 'r') as f:
+                cases.extend(json.loads(line) for line in f if line.strip())
+    for case in cases:
+        args = (case["instruction"], case.get("input", ""), case["output"])
+        assert format_prompt(*args) == _format_prompt_uncached(*args), f"Compiled template differs: {case}"
+        # Inference prompts stay byte-identical to the ones behind the committed baseline results
+        reference = _format_prompt_uncached(args[0], args[1], "")
+        assert format_for_inference(*args[:2]) == reference[:-15] + "### Response:", f"Prompt changed: {case}"
+    assert format_batch(cases) == [format_for_training(c) for c in cases]
+    assert format_batch(cases, for_inference=True) == \
+        [format_for_inference(c["instruction"], c.get("input", "")) for c in cases]
+    
+    # Editing the template file invalidates the compiled copy
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "template.txt"
+        path.write_text("A {instruction}\n{output}")
+        assert compile_template(path).format("x", "", "y") == "A x\ny"
+        assert compile_template(path) is compile_template(path), "Template recompiled without a change"
+        path.write_text("B {instruction}\n{output}")
+        os.utime(path, ns=(0, 0))
+        assert compile_template(path).format("x", "", "y") == "B x\ny", "Stale template after edit"
+    
+    print("✅ Compiled template tests passed")
+
+def bench_formatter(rows: int = 20_000):
+    """Per-prompt cost: re-read template per call vs compiled template vs format_batch"""
+    import time
+    
+    with open(Path(__file__).parent.parent / "data/train/luanti_train.jsonl", 'r') as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    items = (items * (rows // len(items) + 1))[:rows]
+    
+    timings = {}
+    start = time.perf_counter()
+    reference = [_format_prompt_uncached(i["instruction"], i.get("input", ""), i["output"]) for i in items]
+    timings["uncached"] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    compiled = [format_for_training(i) for i in items]
+    timings["format_prompt"] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    batched = format_batch(items)
+    timings["format_batch"] = time.perf_counter() - start
+    
+    assert reference == compiled == batched, "Formatted prompts differ"
+    
+    print(f"⏱️  Formatting {rows} training rows")
+    for name, elapsed in timings.items():
+        print(f"   {name:<14} {elapsed / rows * 1e6:7.2f} µs/prompt ({timings['uncached'] / elapsed:.1f}x)")
+
 if __name__ == "__main__":
-    test_formatter()
\ No newline at end of file
+    import sys
+    if "--bench" in sys.argv:
+        bench_formatter()
+    else:
+        test_compiled_template()
+        test_formatter()
\ No newline at end of file
@@ -1,45 +1,58 @@
 #!/usr/bin/env python3
-import json, glob, os, csv, time
+import json, glob, os, csv, sys
 from pathlib import Path
 from datetime import datetime
 
-Path("eval/results").mkdir(parents=True, exist_ok=True)
+# Durations come from the "timing" block run_eval.py/test_adapter.py write into
+# each results JSON (measured per item); files without one report no duration.
+RESULTS = Path(sys.argv[1] if len(sys.argv) > 1 else "eval/results")
+RESULTS.mkdir(parents=True, exist_ok=True)
+
+def checkpoint_and_scale(d, p):
+    if "adapter_path" in d:  # test_adapter.py: <ckpt>__scale-<scale>.json
+        return Path(d["adapter_path"]).name, d.get("scale")
+    if "checkpoint" in d:    # older local_checkpoint-*_scale_*.json runs
+        return d.get("checkpoint"), d.get("scale")
+    return d.get("model_name"), None  # run_eval.py baseline
 
 records=[]
-for p in sorted(glob.glob("eval/results/local_checkpoint-*_scale_*.json")):
-    with open(p,"r") as f:
-        d=json.load(f)
-    
-    # Get timing from file metadata (since we don't have explicit timestamps in results)
-    mtime = os.path.getmtime(p)
-    
-    # Estimate start time based on our known durations
-    durations = {
-        "checkpoint-500_scale_0.25": 147 * 60,  # 2h 27m
-        "checkpoint-500_scale_0.5": 127 * 60,   # 2h 7m  
-        "checkpoint-500_scale_1.0": 123 * 60,   # 2h 3m
-        "checkpoint-1000_scale_0.25": 157 * 60, # 2h 37m
-    }
-    
-    # Extract key from filename
-    basename = os.path.basename(p).replace("local_", "").replace(".json", "")
-    duration = durations.get(basename, 140 * 60)  # default 2h 20m
-    
-    started_at = datetime.fromtimestamp(mtime - duration)
-    ended_at = datetime.fromtimestamp(mtime)
+for p in sorted(glob.glob(str(RESULTS/"*.json"))):
+    try:
+        with open(p,"r") as f:
+            d=json.load(f)
+    except (OSError, json.JSONDecodeError):
+        continue
+    if not isinstance(d, dict) or not ("overall_metrics" in d or "pass@1" in d):
+        continue
+
+    metrics = d.get("overall_metrics", {})
+    timing = d.get("timing") or {}
+    checkpoint, scale = checkpoint_and_scale(d, p)
+    items = len(d["detailed_results"]) if "detailed_results" in d else d.get("total_items")
+    wall = timing.get("wall_seconds")
 
     rec = {
         "file": os.path.basename(p),
-        "checkpoint": d.get("checkpoint"),
-        "scale": d.get("scale"),
-        "pass@1": d.get("pass@1"),
-        "pass@k": d.get("pass@k"),
-        "items_total": d.get("total_items", 60),
-        "started_at": started_at.isoformat(),
-        "ended_at": ended_at.isoformat(),
-        "wall_seconds": duration,
-        "wall_minutes": duration / 60,
-        "wall_hours": duration / 3600,
+        "checkpoint": checkpoint,
+        "scale": scale,
+        "pass@1": metrics.get("pass_at_1", d.get("pass@1")),
+        "pass@k": metrics.get("pass_at_k", d.get("pass@k")),
+        "items_total": items,
+        "started_at": timing.get("started_at"),
+        "ended_at": timing.get("ended_at") or datetime.fromtimestamp(os.path.getmtime(p)).isoformat(),
+        "wall_seconds": wall,
+        "wall_minutes": wall / 60 if wall else None,
+        "wall_hours": wall / 3600 if wall else None,
+        "seconds_per_item": wall / timing["items_timed"] if wall and timing.get("items_timed") else None,
+        "sessions": timing.get("sessions"),
+        "prefill_s": timing.get("prefill_s"),
+        "decode_s": timing.get("decode_s"),
+        "validation_s": timing.get("validation_s"),
+        # Tokenizing, text decoding, journaling; negative when validation overlapped generation (--validation_workers)
+        "other_s": wall - timing["prefill_s"] - timing["decode_s"] - timing["validation_s"] if wall else None,
+        "generated_tokens": timing.get("generated_tokens"),
+        "decode_tokens_per_sec": timing.get("decode_tokens_per_sec"),
+        "items_cached": timing.get("items_cached"),
     }
     records.append(rec)
 
@@ -49,20 +62,31 @@ if records:
         w=csv.DictWriter(f, fieldnames=list(records[0].keys()))
         w.writeheader()
         w.writerows(records)
-    
+
     with open("EVAL_TIMES.json", "w") as f:
         json.dump(records, f, indent=2)
-    
+
     print("Wrote EVAL_TIMES.csv and EVAL_TIMES.json")
     print(f"Completed evaluations: {len(records)}")
-    
+
     # Summary stats
-    avg_minutes = sum(r["wall_minutes"] for r in records) / len(records)
+    timed = [r for r in records if r["wall_seconds"]]
     avg_pass1 = sum(r["pass@1"] for r in records if r["pass@1"]) / len(records) * 100
     avg_pass5 = sum(r["pass@k"] for r in records if r["pass@k"]) / len(records) * 100
-    
-    print(f"Average duration: {avg_minutes:.1f} minutes ({avg_minutes/60:.1f} hours)")
+
+    if timed:
+        avg_minutes = sum(r["wall_minutes"] for r in timed) / len(timed)
+        wall = sum(r["wall_seconds"] for r in timed)
+        print(f"Average duration: {avg_minutes:.1f} minutes ({avg_minutes/60:.1f} hours) over {len(timed)} timed runs")
+        print("Time split: " + ", ".join(f"{k[:-2]} {sum(r[k] for r in timed) / wall:.0%}"
+                                         for k in ("prefill_s", "decode_s", "validation_s", "other_s")))
+        tokens = sum(r["generated_tokens"] for r in timed)
+        decode = sum(r["decode_s"] for r in timed)
+        if decode:
+            print(f"Decode throughput: {tokens / decode:.1f} tokens/s ({tokens} tokens)")
+    if len(timed) < len(records):
+        print(f"No timing recorded in {len(records) - len(timed)} older result files (duration left empty)")
     print(f"Average pass@1: {avg_pass1:.1f}%")
     print(f"Average pass@5: {avg_pass5:.1f}%")
 else:
-    print("No evaluation results found")
\ No newline at end of file
+    print("No evaluation results found")
@@ -4,11 +4,13 @@ from pathlib import Path
 from datetime import datetime
 
 ROOT = Path(".")
+OUT = ROOT/"outputs_luanti_safe"
+metrics = OUT/"metrics.jsonl"  # written by training/profiler_callback.py
 log = None
 for cand in [
-    ROOT/"outputs_luanti_safe"/"training.log",
-    ROOT/"training.log", 
-    ROOT/"outputs_luanti_safe"/"logs.txt",
+    OUT/"training.log",
+    ROOT/"training.log",
+    OUT/"logs.txt",
 ]:
     if cand.exists():
         log = cand; break
@@ -19,7 +21,23 @@ def ts(dt_str):
         except: pass
     return None
 
+def read_metrics(path):
+    """Records of the last run in a metrics JSONL (each launch appends a "start" record)"""
+    run = []
+    with open(path) as f:
+        for ln in f:
+            try: rec = json.loads(ln)
+            except json.JSONDecodeError: continue  # torn last line of a killed run
+            if rec.get("event") == "start": run = []
+            run.append(rec)
+    return run
+
+def mean(xs):
+    xs = [x for x in xs if x is not None]
+    return sum(xs) / len(xs) if xs else None
+
 stats = {
+    "source": None,
     "found_log": bool(log),
     "wall_start": None, "wall_end": None, "wall_seconds": None,
     "steps_total": 1500, "steps_seen": 0,
@@ -27,7 +45,39 @@ stats = {
     "loss_trace": []
 }
 
-if log:
+if metrics.exists():
+    run = read_metrics(metrics)
+    start = next((r for r in run if r["event"] == "start"), None)
+    end = next((r for r in run if r["event"] == "end"), None)
+    steps = [r for r in run if r["event"] == "step"]
+    stats["source"] = str(metrics)
+    if start:
+        stats["steps_total"] = start["max_steps"]
+        stats["wall_start"] = datetime.fromtimestamp(start["time"]).isoformat()
+    t1 = end["time"] if end else (steps[-1]["time"] if steps else None)
+    if start and t1:
+        stats["wall_end"] = datetime.fromtimestamp(t1).isoformat()
+        stats["wall_seconds"] = t1 - start["time"]
+    stats["finished"] = end is not None
+    stats["loss_trace"] = [{"step": r["step"], "loss": r["loss"]} for r in run if r["event"] == "log" and "loss" in r]
+    if steps:
+        stats["steps_seen"] = steps[-1]["step"]
+        # Step 1 carries CUDA/kernel warmup; leave it out of the averages when there is more to go on
+        steady = steps[1:] or steps
+        stats["avg_step_seconds"] = mean(s["wall"] for s in steady)
+        split = {k: mean(s[k] for s in steady) for k in ("data_wait", "forward", "backward", "optimizer")}
+        stats["step_split_seconds"] = split
+        stats["step_split_share"] = {k: (v / stats["avg_step_seconds"] if v is not None else None)
+                                     for k, v in split.items()}
+        tokens = sum(s["tokens"] for s in steady)
+        stats["tokens_total"] = sum(s["tokens"] for s in steps)
+        stats["tokens_per_sec"] = tokens / sum(s["wall"] for s in steady)
+        stats["padding_ratio"] = 1 - tokens / max(1, sum(s["padded_tokens"] for s in steady))
+        stats["peak_mem_mb"] = max(s["peak_mem_mb"] for s in steps)
+    stats["traces"] = [r["file"] for r in run if r["event"] == "trace"]
+elif log:
+    # Older runs without a metrics file: scrape the log
+    stats["source"] = str(log)
     text = log.read_text(errors="ignore")
     lines = text.splitlines()
     sx = re.compile(r"(?P<t>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}).*Step\s+(?P<s>\d+)/(?P<T>\d+).*(loss[:=]\s*(?P<loss>[0-9.]+))?", re.I)
@@ -59,15 +109,16 @@ if log:
             s1,t1s = t_pairs[-1]
             if s1 > s0:
                 stats["avg_step_seconds"] = (t1s - t0s) / (s1 - s0)
-    if stats["loss_trace"]:
-        stats["final_loss"] = stats["loss_trace"][-1]["loss"]
 
-# Fallbacks if log timestamps did not parse
+if stats["loss_trace"]:
+    stats["final_loss"] = stats["loss_trace"][-1]["loss"]
+
+# Fallbacks if neither metrics nor log timestamps were usable
 if stats["wall_seconds"] is None:
-    outs = ROOT/"outputs_luanti_safe"
-    if outs.exists():
-        cps = [p for p in outs.iterdir() if p.is_dir() and p.name.startswith("checkpoint-")]
+    if OUT.exists():
+        cps = [p for p in OUT.iterdir() if p.is_dir() and p.name.startswith("checkpoint-")]
         if cps:
+            stats["source"] = "checkpoint mtimes"
             t0 = min(p.stat().st_mtime for p in cps)
             t1 = max(p.stat().st_mtime for p in cps)
             stats["wall_start"] = datetime.fromtimestamp(t0).isoformat()
@@ -77,9 +128,13 @@ if stats["wall_seconds"] is None:
 with open("TRAINING_STATS.json", "w") as f:
     json.dump(stats, f, indent=2)
 
-print("Wrote TRAINING_STATS.json")
+print(f"Wrote TRAINING_STATS.json (from {stats['source'] or 'nothing found'})")
 print(f"Training duration: {stats.get('wall_seconds', 'unknown')} seconds")
 if stats.get("avg_step_seconds"):
     print(f"Average step time: {stats['avg_step_seconds']:.2f} seconds")
+if stats.get("step_split_share"):
+    print("Step split: " + ", ".join(f"{k} {v:.0%}" for k, v in stats["step_split_share"].items() if v is not None))
+if stats.get("tokens_per_sec"):
+    print(f"Throughput: {stats['tokens_per_sec']:.0f} tokens/sec, peak memory {stats['peak_mem_mb']:.0f} MB")
 if stats.get("final_loss"):
-    print(f"Final loss: {stats['final_loss']}")
\ No newline at end of file
+    print(f"Final loss: {stats['final_loss']}")
@@ -1,58 +1,122 @@
 #!/usr/bin/env python3
-import json, glob
+import json, glob, os, argparse, statistics
+from pathlib import Path
 from datetime import datetime
 
-# Known durations from completed evaluations
-mins = {
-    ("1000","0.5"): 127, ("1000","1.0"): 123,
-    ("1500","0.25"): 152, ("1500","0.5"): 127, ("1500","1.0"): 123
-}
+# Rates come from measurements: finished results JSONs carry a "timing" block and
+# running evaluations journal a wall-clock "time" per finished item.
+ap = argparse.ArgumentParser(description="Evaluation completion ETA from recorded timings")
+ap.add_argument("--results", default="eval/results", help="Results directory (test_adapter --out_dir)")
+ap.add_argument("--adapters_dir", default=None, help="Checkpoint directory of the sweep, to count runs not started yet")
+ap.add_argument("--scales", nargs="+", type=float, default=[0.25, 0.5, 1.0], help="Scales of the sweep")
+args = ap.parse_args()
+RESULTS = Path(args.results)
+
+def fmt(seconds):
+    m = int(seconds // 60)
+    return f"{m // 60}h {m % 60}m"
+
+def eval_items(config):
+    try:
+        with open(config.get("eval_file", "")) as f:
+            return sum(1 for ln in f if ln.strip())
+    except OSError:
+        return None
+
+def read_journal(path):
+    header, times, sessions, done = None, [], [], set()
+    with open(path) as f:
+        for ln in f:
+            try: rec = json.loads(ln)
+            except json.JSONDecodeError: break  # torn last line
+            if "header" in rec: header = rec["header"]
+            elif "session" in rec: sessions.append(rec["session"]); times.append([])
+            elif "index" in rec:
+                done.add(rec["index"])
+                if "time" in rec and times: times[-1].append(rec["time"])
+    return header, sessions, times, len(done)
 
 print("=== Evaluation Completion ETA ===")
 print("")
 
-# Check what's actually complete
-completed = []
-for p in glob.glob("eval/results/local_checkpoint-*_scale_*.json"):
+# Finished runs
+completed, per_item = [], []
+for p in sorted(glob.glob(str(RESULTS/"*.json"))):
     try:
         with open(p) as f:
             d = json.load(f)
-        ck = d.get("checkpoint", "").replace("checkpoint-", "")
-        sc = str(d.get("scale", ""))
-        completed.append((ck, sc))
-    except:
-        pass
+    except (OSError, json.JSONDecodeError):
+        continue
+    if not isinstance(d, dict) or not ("overall_metrics" in d or "pass@1" in d):
+        continue
+    name = Path(d["adapter_path"]).name if "adapter_path" in d else d.get("checkpoint", d.get("model_name"))
+    completed.append((name, d.get("scale"), p))
+    t = d.get("timing") or {}
+    if t.get("wall_seconds") and t.get("items_timed"):
+        per_item.append(t["wall_seconds"] / t["items_timed"])
 
-print(f"Completed: {len(completed)}/9 evaluations")
-for ck, sc in sorted(completed):
-    print(f"  ✅ checkpoint-{ck} @ scale={sc}")
+print(f"Completed: {len(completed)} evaluations")
+for name, sc, _ in completed:
+    print(f"  ✅ {name} @ scale={sc}")
+avg_item = statistics.mean(per_item) if per_item else None
+if avg_item:
+    print(f"  measured {avg_item:.1f}s per item over {len(per_item)} timed runs")
 
+# Running evaluations: journals whose results JSON is not written yet
+remaining, running, items_default = 0.0, [], None
 print("")
-print("Remaining evaluations:")
-total_mins = 0
-for (ck, sc), m in mins.items():
-    if (ck, sc) not in completed:
-        h = m // 60; mm = m % 60
-        print(f"  ⏳ checkpoint-{ck} @ scale={sc}: ~{h}h {mm}m")
-        total_mins += m
-
-if total_mins > 0:
-    h = total_mins // 60; mm = total_mins % 60
+print("In progress:")
+for jp in sorted(glob.glob(str(RESULTS/"*.json.journal.jsonl"))):
+    out = jp[:-len(".journal.jsonl")]
+    header, sessions, times, done = read_journal(jp)
+    total = eval_items(header or {})
+    items_default = items_default or total
+    if os.path.exists(out) and os.path.getmtime(out) >= os.path.getmtime(jp):
+        continue
+    running.append(Path(out).name)
+    if not sessions or not total:
+        why = "no timing recorded" if not sessions else "eval file not found"
+        print(f"  ⏳ {Path(out).name}: {done} items done ({why})")
+        continue
+    # Live rate over the current session (batched runs finish items in bursts, so no per-gap median)
+    rate = (times[-1][-1] - sessions[-1]) / len(times[-1]) if times[-1] else avg_item
+    if rate is None:
+        print(f"  ⏳ {Path(out).name}: {done}/{total} items, no rate yet")
+        continue
+    left = (total - done) * rate
+    remaining += left
+    print(f"  ⏳ {Path(out).name}: {done}/{total} items at {rate:.1f}s/item, ~{fmt(left)} left")
+if not running:
+    print("  (none)")
+
+# Sweep runs not started yet
+pending = []
+if args.adapters_dir:
+    for ck in sorted(Path(args.adapters_dir).iterdir()):
+        if not ck.is_dir() or not ck.name.startswith(("ckpt-", "checkpoint-")):
+            continue
+        for sc in args.scales:
+            out = RESULTS/f"{ck.name}__scale-{sc}.json"
+            if not out.exists() and not Path(str(out) + ".journal.jsonl").exists():
+                pending.append(out.name)
+if pending:
     print("")
-    print(f"Estimated remaining time: ~{h}h {mm}m")
-    
-    # Add buffers for overhead
-    for buf in [0.05, 0.10]:
-        buffered = int(total_mins * (1 + buf))
-        bh = buffered // 60; bmm = buffered % 60
-        print(f"With {int(buf*100)}% buffer: ~{bh}h {bmm}m")
-    
-    # Current time + ETA
-    now = datetime.now()
+    print("Not started:")
+    if avg_item and items_default:
+        for name in pending:
+            print(f"  ⏳ {name}: ~{fmt(avg_item * items_default)}")
+        remaining += avg_item * items_default * len(pending)
+    else:
+        for name in pending:
+            print(f"  ⏳ {name}: no timed run to estimate from")
+
+if remaining > 0:
     print("")
+    print(f"Estimated remaining time: ~{fmt(remaining)}")
+    now = datetime.now()
+    done_at = datetime.fromtimestamp(now.timestamp() + remaining)
     print(f"Current time: {now.strftime('%H:%M')}")
-    estimated_completion = now.timestamp() + total_mins * 60
-    completion_time = datetime.fromtimestamp(now.timestamp() + total_mins * 60 * 1.1)
-    print(f"ETA (with buffer): {completion_time.strftime('%H:%M tomorrow' if completion_time.day > now.day else '%H:%M today')}")
-else:
-    print("🎉 All evaluations complete!")
\ No newline at end of file
+    print(f"ETA: {done_at.strftime('%H:%M tomorrow' if done_at.date() > now.date() else '%H:%M today')}")
+elif not running and not pending:
+    print("")
+    print("🎉 All evaluations complete!")
@@ -1,8 +1,8 @@
 # scripts/promote_best.py
-import json, sys, re, os, shutil, torch
+import json, sys, re, os, shutil
 from pathlib import Path
-from peft import PeftModel
-from unsloth import FastLanguageModel
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from eval.lora_scale import write_scaled_adapter
 
 ROOT = Path.home() / "luanti_capability"
 BASE = "unsloth/gpt-oss-20b-unsloth-bnb-4bit"
@@ -29,21 +29,10 @@ def best_result():
     return best
 
 def bake_scale(peft_dir, scale, out_dir):
-    model, tok = FastLanguageModel.from_pretrained(model_name=BASE, load_in_4bit=True, dtype=None, max_seq_length=2048)
-    model = PeftModel.from_pretrained(model, peft_dir)
-    dt = next(p for p in model.parameters() if p.is_floating_point()).dtype
-    # scale LoRA B weights permanently
-    n=0
-    for _, m in model.named_modules():
-        if hasattr(m, "lora_B"):
-            for k in list(m.lora_B.keys()):
-                with torch.no_grad():
-                    m.lora_B[k].weight.data = (m.lora_B[k].weight.data * scale).to(dt)
-                n += 1
-    out_dir.mkdir(parents=True, exist_ok=True)
-    model.save_pretrained(out_dir)
-    (out_dir/"META.json").write_text(json.dumps({"scale": scale, "dtype": str(dt)}, indent=2))
-    return n
+    # scale baked into lora_alpha; LoRA weights are copied unchanged, no base model load
+    cfg = write_scaled_adapter(peft_dir, scale, out_dir)
+    (out_dir/"META.json").write_text(json.dumps({"scale": scale, "source": str(peft_dir), "lora_alpha": cfg["lora_alpha"]}, indent=2))
+    return cfg["lora_alpha"]
 
 if __name__ == "__main__":
     best = best_result()
@@ -53,5 +42,5 @@ if __name__ == "__main__":
         raise SystemExit(f"Missing checkpoint dir: {ckpt_dir}")
     if OUT.exists():
         shutil.rmtree(OUT)
-    n = bake_scale(ckpt_dir, best["scale"], OUT)
-    print(f"[+] Baked {n} LoRA matrices into {OUT}")
\ No newline at end of file
+    alpha = bake_scale(ckpt_dir, best["scale"], OUT)
+    print(f"[+] Baked scale {best['scale']} into {OUT} (lora_alpha={alpha})")
\ No newline at end of file
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Completion-only loss for IIR-formatted examples
+Labels cover the response only; the preamble, instruction and input are
+masked using the response_start offsets stored by pretokenize.py
+"""
+
+import os
+import sys
+from typing import Dict, List
+
+import torch
+
+sys.path.append(os.path.dirname(__file__))
+from packing import IGNORE_INDEX
+
+class CompletionOnlyCollator:
+    """
+    Pad rows and keep labels only from response_start to the row's end
+
+    Padding is masked by position rather than by token id, so an EOS that
+    doubles as the pad token still trains the model to stop.
+    """
+
+    def __init__(self, pad_token_id: int):
+        self.pad_token_id = pad_token_id
+
+    def __call__(self, features: List[Dict]) -> Dict[str, torch.Tensor]:
+        rows = len(features)
+        row_len = max(len(f["input_ids"]) for f in features)
+        input_ids = torch.full((rows, row_len), self.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((rows, row_len), dtype=torch.long)
+        labels = torch.full((rows, row_len), IGNORE_INDEX, dtype=torch.long)
+
+        for r, feature in enumerate(features):
+            ids = torch.as_tensor(feature["input_ids"], dtype=torch.long)
+            n = len(ids)
+            input_ids[r, :n] = ids
+            attention_mask[r, :n] = 1
+            labels[r, feature["response_start"]:n] = ids[feature["response_start"]:]
+
+        return {"input_ids": input_ids, "attention_mask": attention_mask, "labels": labels}
+
+def label_fraction(dataset) -> float:
+    """Share of tokens that carry loss under completion-only masking"""
+    lengths = dataset["length"]
+    return sum(n - s for n, s in zip(lengths, dataset["response_start"])) / max(1, sum(lengths))
+
+def test_completion_only():
+    """Label span is exactly the tokenized output for every train row; packing agrees"""
+    import tempfile
+    from pathlib import Path
+    sys.path.append(os.path.join(os.path.dirname(__file__), '../eval'))
+    sys.path.append(os.path.join(os.path.dirname(__file__), '../prompts'))
+    from formatter import format_for_training
+    from packing import PackedCollator, pack_dataset
+    from pretokenize import iter_train_items, load_or_build
+    from tiny_lm import make_tiny_model, make_tiny_tokenizer
+
+    tokenizer = make_tiny_tokenizer()
+    train_file = Path(__file__).parent.parent / "data/train/luanti_train.jsonl"
+    items = list(iter_train_items(train_file))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset, _, _ = load_or_build(train_file, tokenizer, tmp, max_len=2048)
+        collator = CompletionOnlyCollator(tokenizer.pad_token_id)
+
+        for start in range(0, len(dataset), 64):
+            rows = dataset[start:start + 64]
+            features = [{"input_ids": ids, "response_start": s}
+                        for ids, s in zip(rows["input_ids"], rows["response_start"])]
+            batch = collator(features)
+            for r, item in enumerate(items[start:start + 64]):
+                text = format_for_training(item)
+                output = text[len(format_for_training({**item, "output": ""})):]
+                assert output.strip(), f"Row {start + r} has an empty output"
+                kept = batch["labels"][r][batch["labels"][r] != IGNORE_INDEX].tolist()
+                assert kept == tokenizer(output, add_special_tokens=False)["input_ids"], \
+                    f"Row {start + r}: label span does not match the tokenized output"
+
+        # Packed rows mask the same tokens: losses agree with the unpacked completion-only batch
+        model = make_tiny_model(tokenizer)
+        subset = dataset.select(range(6))
+        unpacked = collator([{"input_ids": r["input_ids"], "response_start": r["response_start"]} for r in subset])
+        packed = PackedCollator(tokenizer.pad_token_id, completion_only=True)(list(pack_dataset(subset, 2048)))
+        assert (packed["labels"] != IGNORE_INDEX).sum() == (unpacked["labels"][:, 1:] != IGNORE_INDEX).sum()
+        with torch.no_grad():
+            assert torch.allclose(model(**unpacked).loss, model(**packed).loss, atol=1e-5)
+
+        print(f"   {label_fraction(dataset):.1%} of train tokens carry loss")
+
+    print("✅ Completion-only masking tests passed")
+
+if __name__ == "__main__":
+    test_completion_only()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Length-grouped sampling for the QLoRA trainer
+Mega-batches sorted by token length, then shuffled micro-batch buckets,
+so each micro-batch pads to a similar length
+"""
+
+import sys
+from typing import Dict, Iterator, List, Sequence
+
+import torch
+from torch.utils.data import Sampler
+
+def length_grouped_indices(lengths: Sequence[int], batch_size: int, seed: int = 3407,
+                           mega_batch_mult: int = 50) -> List[int]:
+    """
+    Index order whose consecutive batch_size chunks have similar lengths
+
+    A seeded permutation is cut into mega-batches of batch_size *
+    mega_batch_mult; each is sorted by length and split into micro-batch
+    buckets, and the buckets are shuffled across the whole epoch. Unlike
+    HF's group_by_length, bucket order carries no long-to-short sawtooth.
+    """
+    generator = torch.Generator()
+    generator.manual_seed(seed)
+    perm = torch.randperm(len(lengths), generator=generator).tolist()
+
+    mega = batch_size * mega_batch_mult
+    buckets = []
+    for start in range(0, len(perm), mega):
+        chunk = sorted(perm[start:start + mega], key=lambda i: -lengths[i])
+        buckets.extend(chunk[i:i + batch_size] for i in range(0, len(chunk), batch_size))
+
+    return [i for b in torch.randperm(len(buckets), generator=generator).tolist() for i in buckets[b]]
+
+class LengthGroupedSampler(Sampler):
+    """Sampler over length_grouped_indices; reshuffles per epoch, deterministic for a given seed"""
+
+    def __init__(self, lengths: Sequence[int], batch_size: int, seed: int = 3407, mega_batch_mult: int = 50):
+        self.lengths = list(lengths)
+        self.batch_size = batch_size
+        self.seed = seed
+        self.mega_batch_mult = mega_batch_mult
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(length_grouped_indices(self.lengths, self.batch_size, self.seed + self.epoch,
+                                           self.mega_batch_mult))
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+def batch_stats(lengths: Sequence[int], order: Sequence[int], batch_size: int, grad_accum: int = 1) -> Dict:
+    """
+    Tokens per optimizer step and padding ratio for an index order
+
+    Each micro-batch pads to its longest row; padding_ratio is the share
+    of computed tokens that are padding.
+    """
+    real = padded = 0
+    micro_batches = 0
+    for start in range(0, len(order), batch_size):
+        batch = [lengths[i] for i in order[start:start + batch_size]]
+        real += sum(batch)
+        padded += len(batch) * max(batch)
+        micro_batches += 1
+    steps = max(1, -(-micro_batches // grad_accum))
+    return {
+        "micro_batches": micro_batches,
+        "tokens_per_step": real / steps,
+        "padded_tokens_per_step": padded / steps,
+        "padding_ratio": 1 - real / padded if padded else 0.0,
+    }
+
+def compare_orders(lengths: Sequence[int], batch_size: int, grad_accum: int = 1, seed: int = 3407) -> Dict:
+    """batch_stats for a random order vs the length-grouped order"""
+    generator = torch.Generator()
+    generator.manual_seed(seed)
+    random_order = torch.randperm(len(lengths), generator=generator).tolist()
+    return {
+        "random": batch_stats(lengths, random_order, batch_size, grad_accum),
+        "grouped": batch_stats(lengths, length_grouped_indices(lengths, batch_size, seed), batch_size, grad_accum),
+    }
+
+def _train_lengths() -> List[int]:
+    """Token lengths of the shipped train set under the tiny CPU tokenizer"""
+    import os
+    sys.path.append(os.path.join(os.path.dirname(__file__), '../eval'))
+    sys.path.append(os.path.join(os.path.dirname(__file__), '../prompts'))
+    sys.path.append(os.path.dirname(__file__))
+    from formatter import format_batch
+    from pretokenize import iter_train_items
+    from tiny_lm import make_tiny_tokenizer
+
+    train_file = os.path.join(os.path.dirname(__file__), '../data/train/luanti_train.jsonl')
+    return [len(ids) for ids in make_tiny_tokenizer()(format_batch(iter_train_items(train_file)))["input_ids"]]
+
+def test_length_sampler():
+    """Deterministic under a seed, covers every row once, and cuts padding"""
+    from torch.utils.data import DataLoader
+
+    lengths = _train_lengths()
+    sampler = LengthGroupedSampler(lengths, batch_size=2, seed=3407)
+    first = list(sampler)
+    assert first == list(LengthGroupedSampler(lengths, batch_size=2, seed=3407)), "Order not deterministic"
+    assert sorted(first) == list(range(len(lengths))), "Rows dropped or repeated"
+    sampler.set_epoch(1)
+    assert list(sampler) != first and sorted(sampler) == sorted(first), "Epochs should reshuffle"
+
+    sampler.set_epoch(0)
+    batches = [b.tolist() for b in DataLoader(range(len(lengths)), batch_size=2, sampler=sampler)]
+    assert [i for b in batches for i in b] == first, "DataLoader batches do not follow the buckets"
+
+    stats = compare_orders(lengths, batch_size=2, grad_accum=8)
+    assert stats["grouped"]["padding_ratio"] < stats["random"]["padding_ratio"] / 2, stats
+    assert stats["grouped"]["tokens_per_step"] == stats["random"]["tokens_per_step"]
+
+    print("✅ Length-grouped sampler tests passed")
+
+def bench_length_sampler(batch_size: int = 2, grad_accum: int = 8):
+    """Padding per optimizer step on the train set, random vs length-grouped"""
+    stats = compare_orders(_train_lengths(), batch_size, grad_accum)
+    print(f"📊 Train set, micro-batch {batch_size} x accumulation {grad_accum} (tiny char tokenizer)")
+    for name, s in stats.items():
+        print(f"   {name:>7}: {s['tokens_per_step']:.0f} tokens/step, "
+              f"{s['padded_tokens_per_step']:.0f} computed, padding {s['padding_ratio']:.1%}")
+
+if __name__ == "__main__":
+    if "--bench" in sys.argv:
+        bench_length_sampler()
+    else:
+        test_length_sampler()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Sequence packing for QLoRA training
+First-fit-decreasing bins of tokenized examples, with per-example
+position ids and a block-diagonal causal mask so examples never attend
+to each other
+"""
+
+import sys
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pyarrow as pa
+import torch
+from datasets import Dataset
+
+IGNORE_INDEX = -100
+
+def pack_ffd(lengths: Sequence[int], max_len: int) -> List[List[int]]:
+    """
+    First-fit-decreasing bin packing of example lengths into max_len bins
+
+    Examples are placed longest first into the leftmost bin with room; a
+    max segment tree over remaining capacities finds that bin in
+    O(log bins), so packing is O(n log n). Examples longer than max_len
+    (only possible without truncation) get a bin of their own.
+
+    Returns:
+        Bins of example indices, in bin creation order
+    """
+    order = sorted(range(len(lengths)), key=lambda i: (-lengths[i], i))
+    size = 1
+    while size < max(len(lengths), 1):
+        size *= 2
+    tree = [0] * (2 * size)  # leaves: remaining capacity per bin (0 until the bin is opened)
+    bins: List[List[int]] = []
+
+    for i in order:
+        n = lengths[i]
+        if tree[1] >= n and n <= max_len:
+            node = 1
+            while node < size:
+                node = 2 * node if tree[2 * node] >= n else 2 * node + 1
+            b = node - size
+            bins[b].append(i)
+            tree[node] -= n
+        else:
+            b = len(bins)
+            bins.append([i])
+            node = size + b
+            tree[node] = max(max_len - n, 0)
+        node //= 2
+        while node:
+            tree[node] = max(tree[2 * node], tree[2 * node + 1])
+            node //= 2
+    return bins
+
+def pack_dataset(dataset: Dataset, max_len: int) -> Dataset:
+    """
+    Pack a tokenized dataset into rows of at most max_len tokens
+
+    Uses the "length" column of the pre-tokenized cache when present. The
+    ids are regrouped with Arrow offsets rather than Python lists.
+
+    Returns:
+        Dataset with input_ids (concatenated examples), seq_lengths and,
+        if the cache has them, per-example response_starts
+    """
+    if "length" in dataset.column_names:
+        lengths = dataset["length"]
+    else:
+        lengths = [len(ids) for ids in dataset["input_ids"]]
+    bins = pack_ffd(lengths, max_len)
+    order = [i for b in bins for i in b]
+
+    ids = dataset.select(order).with_format("arrow")[:]["input_ids"].combine_chunks()
+    bin_tokens = np.fromiter((sum(lengths[i] for i in b) for b in bins), dtype=np.int64, count=len(bins))
+    offsets = pa.array(np.concatenate([[0], np.cumsum(bin_tokens)]), type=pa.int64())
+    packed = pa.LargeListArray.from_arrays(offsets, ids.flatten())
+    columns = {"input_ids": packed,
+               "seq_lengths": pa.array([[lengths[i] for i in b] for b in bins], type=pa.list_(pa.int32()))}
+    if "response_start" in dataset.column_names:
+        starts = dataset["response_start"]
+        columns["response_starts"] = pa.array([[starts[i] for i in b] for b in bins], type=pa.list_(pa.int32()))
+    return Dataset(pa.table(columns))
+
+class PackedCollator:
+    """
+    Collate packed rows into input_ids, labels, position_ids and a 4D mask
+
+    Each example restarts its position ids at 0 and sees only its own
+    earlier tokens, so the model computes exactly what it would for the
+    examples one by one. Labels follow DataCollatorForLanguageModeling
+    (pad-token labels ignored); each example's first token is also
+    ignored, since in a packed row it would be predicted from the
+    previous example.
+
+    The mask is the inverted additive form HF models accept for custom 4D
+    masks (0 = attend, dtype min = blocked). With block_mask=False only
+    position_ids mark the boundaries, for attention kernels that derive
+    varlen boundaries from them. With completion_only, labels before each
+    example's response_starts entry are ignored too, and padding is masked
+    by position only, as in CompletionOnlyCollator.
+
+    HF models hand a custom 4D mask to every layer unchanged, so for models
+    with sliding-window layers (gpt-oss) pass sliding_window: the mask
+    becomes a dict keyed by layer type, the sliding_attention entry also
+    limited to the last sliding_window tokens of the example.
+    """
+
+    def __init__(self, pad_token_id: int, block_mask: bool = True, mask_dtype: torch.dtype = torch.float32,
+                 completion_only: bool = False, sliding_window: int = None):
+        self.pad_token_id = pad_token_id
+        self.block_mask = block_mask
+        self.mask_dtype = mask_dtype
+        self.completion_only = completion_only
+        self.sliding_window = sliding_window
+
+    def __call__(self, features: List[Dict]) -> Dict[str, torch.Tensor]:
+        rows = len(features)
+        row_len = max(len(f["input_ids"]) for f in features)
+        input_ids = torch.full((rows, row_len), self.pad_token_id, dtype=torch.long)
+        labels = torch.full((rows, row_len), IGNORE_INDEX, dtype=torch.long)
+        position_ids = torch.zeros((rows, row_len), dtype=torch.long)
+        allowed = torch.zeros((rows, 1, row_len, row_len), dtype=torch.bool)
+
+        for r, feature in enumerate(features):
+            ids = torch.as_tensor(feature["input_ids"], dtype=torch.long)
+            input_ids[r, :len(ids)] = ids
+            starts = feature["response_starts"] if self.completion_only else [1] * len(feature["seq_lengths"])
+            start = 0
+            for n, response_start in zip(feature["seq_lengths"], starts):
+                end = start + n
+                first = start + max(response_start, 1)
+                labels[r, first:end] = ids[first:end]
+                position_ids[r, start:end] = torch.arange(n)
+                allowed[r, 0, start:end, start:end] = torch.ones(n, n, dtype=torch.bool).tril()
+                start = end
+            # Padding attends to itself only, so no softmax row is fully blocked
+            pad = torch.arange(start, row_len)
+            allowed[r, 0, pad, pad] = True
+        if not self.completion_only:
+            labels[input_ids == self.pad_token_id] = IGNORE_INDEX
+
+        batch = {"input_ids": input_ids, "labels": labels, "position_ids": position_ids}
+        if self.block_mask:
+            blocked = torch.finfo(self.mask_dtype).min
+            batch["attention_mask"] = torch.zeros(allowed.shape, dtype=self.mask_dtype).masked_fill(~allowed, blocked)
+            if self.sliding_window:
+                positions = torch.arange(row_len)
+                in_window = positions[:, None] - positions[None, :] < self.sliding_window
+                sliding = torch.zeros(allowed.shape, dtype=self.mask_dtype).masked_fill(~(allowed & in_window), blocked)
+                batch["attention_mask"] = {"full_attention": batch["attention_mask"], "sliding_attention": sliding}
+        return batch
+
+def sliding_window_of(config) -> int:
+    """Sliding window of a model config with sliding_attention layers, else None"""
+    if "sliding_attention" in (getattr(config, "layer_types", None) or []):
+        return config.sliding_window
+    return None
+
+def packing_stats(lengths: Sequence[int], max_len: int, batch_size: int) -> Dict:
+    """
+    Padding efficiency (real tokens / computed tokens) with and without packing
+
+    Unpacked batches pad to their longest example, as the default
+    collator does; packed batches pad to their longest bin. budget_* is
+    the share of each row's max_len token budget holding real tokens.
+    """
+    tokens = int(sum(lengths))
+
+    def computed(row_lengths: List[int]) -> int:
+        return sum(len(row_lengths[i:i + batch_size]) * max(row_lengths[i:i + batch_size])
+                   for i in range(0, len(row_lengths), batch_size))
+
+    bins = pack_ffd(lengths, max_len)
+    bin_lengths = [sum(lengths[i] for i in b) for b in bins]
+    unpacked, packed = computed(list(lengths)), computed(bin_lengths)
+    steps_unpacked = -(-len(lengths) // batch_size)
+    steps_packed = -(-len(bins) // batch_size)
+    return {
+        "examples": len(lengths),
+        "tokens": tokens,
+        "rows_unpacked": len(lengths),
+        "rows_packed": len(bins),
+        "efficiency_unpacked": tokens / unpacked if unpacked else 1.0,
+        "efficiency_packed": tokens / packed if packed else 1.0,
+        "budget_unpacked": tokens / (len(lengths) * max_len) if lengths else 1.0,  # share of max_len rows used
+        "budget_packed": tokens / (len(bins) * max_len) if bins else 1.0,
+        "steps_saved": 1 - steps_packed / steps_unpacked if steps_unpacked else 0.0,  # per epoch
+    }
+
+def test_packing():
+    """FFD invariants; packed loss equals unpacked loss on tiny Llama and gpt-oss models"""
+    import os
+    import random
+    sys.path.append(os.path.join(os.path.dirname(__file__), '../eval'))
+    from tiny_lm import make_tiny_model, make_tiny_tokenizer
+    from transformers import DataCollatorForLanguageModeling
+
+    rng = random.Random(0)
+    lengths = [rng.randint(1, 300) for _ in range(500)]
+    bins = pack_ffd(lengths, 1024)
+    assert sorted(i for b in bins for i in b) == list(range(500)), "Examples lost or duplicated"
+    assert all(sum(lengths[i] for i in b) <= 1024 for b in bins), "Bin over capacity"
+    assert len(bins) <= 1.3 * sum(lengths) / 1024 + 1, "FFD bins far from the lower bound"
+    assert pack_ffd([5, 3, 9], 4) == [[2], [0], [1]], "Oversized examples need their own bins"
+
+    tokenizer = make_tiny_tokenizer()
+    model = make_tiny_model(tokenizer)
+    texts = ["minetest.register_node('a:b', {tiles = {'x.png'}})", "local x = 1",
+             "core.register_craft{output = 'a:b', recipe = {{'default:torch'}}}", "--", "return x * 2"]
+    encoded = tokenizer(texts)["input_ids"]
+    dataset = Dataset.from_dict({"input_ids": encoded, "attention_mask": [[1] * len(ids) for ids in encoded],
+                                 "length": [len(ids) for ids in encoded]})
+
+    packed = pack_dataset(dataset, max_len=80)
+    assert len(packed) < len(dataset)
+    assert sorted(n for row in packed["seq_lengths"] for n in row) == sorted(dataset["length"])
+
+    unpacked_batch = DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False)(
+        [{"input_ids": ids} for ids in encoded])
+    packed_batch = PackedCollator(tokenizer.pad_token_id)(list(packed))
+    with torch.no_grad():
+        unpacked_loss = model(**unpacked_batch).loss
+        packed_loss = model(**packed_batch).loss
+    assert torch.allclose(unpacked_loss, packed_loss, atol=1e-5), f"{unpacked_loss} != {packed_loss}"
+    assert (packed_batch["labels"] != IGNORE_INDEX).sum() == (unpacked_batch["labels"][:, 1:] != IGNORE_INDEX).sum()
+
+    # gpt-oss: sliding layers keep their window inside packed rows (window < example lengths here)
+    from transformers import GptOssConfig, GptOssForCausalLM
+    torch.manual_seed(3407)
+    config = GptOssConfig(vocab_size=len(tokenizer), hidden_size=32, intermediate_size=32, num_hidden_layers=2,
+                          num_attention_heads=4, num_key_value_heads=2, head_dim=8, num_local_experts=2,
+                          num_experts_per_tok=1, sliding_window=8, layer_types=["sliding_attention", "full_attention"],
+                          pad_token_id=tokenizer.pad_token_id, attn_implementation="eager")
+    gpt_oss = GptOssForCausalLM(config).eval()
+    assert sliding_window_of(gpt_oss.config) == 8 and sliding_window_of(model.config) is None
+    windowed_batch = PackedCollator(tokenizer.pad_token_id, sliding_window=sliding_window_of(gpt_oss.config))(
+        list(packed))
+    with torch.no_grad():
+        unpacked_loss = gpt_oss(**unpacked_batch).loss
+        packed_loss = gpt_oss(**windowed_batch).loss
+        full_window_loss = gpt_oss(**packed_batch).loss
+    assert torch.allclose(unpacked_loss, packed_loss, atol=1e-5), f"{unpacked_loss} != {packed_loss}"
+    assert not torch.allclose(unpacked_loss, full_window_loss, atol=1e-5), "Window had no effect; test too weak"
+
+    stats = packing_stats(dataset["length"], 80, batch_size=2)
+    assert stats["efficiency_packed"] > stats["efficiency_unpacked"]
+
+    print("✅ Packing tests passed")
+
+def bench_packing(rows: int = 100_000, max_len: int = 2048, batch_size: int = 2):
+    """FFD speed and padding efficiency on the train set's token lengths"""
+    import os
+    import time
+    sys.path.append(os.path.join(os.path.dirname(__file__), '../eval'))
+    sys.path.append(os.path.join(os.path.dirname(__file__), '../prompts'))
+    from formatter import format_batch
+    from pretokenize import iter_train_items
+    from tiny_lm import make_tiny_tokenizer
+
+    train_file = os.path.join(os.path.dirname(__file__), '../data/train/luanti_train.jsonl')
+    tokenizer = make_tiny_tokenizer()
+    base = [len(ids) for ids in tokenizer(format_batch(iter_train_items(train_file)))["input_ids"]]
+    lengths = (base * (rows // len(base) + 1))[:rows]
+
+    start = time.perf_counter()
+    bins = pack_ffd(lengths, max_len)
+    elapsed = time.perf_counter() - start
+
+    stats = packing_stats(lengths, max_len, batch_size)
+    print(f"⏱️  FFD packed {rows} examples into {len(bins)} rows of {max_len} in {elapsed:.2f}s")
+    print(f"📊 Padding efficiency (batch {batch_size}): unpacked {stats['efficiency_unpacked']:.1%}, "
+          f"packed {stats['efficiency_packed']:.1%}")
+    print(f"📊 max_len budget used per row: unpacked {stats['budget_unpacked']:.1%}, "
+          f"packed {stats['budget_packed']:.1%}; {stats['steps_saved']:.0%} fewer steps per epoch")
+
+if __name__ == "__main__":
+    import os
+    sys.path.append(os.path.dirname(__file__))
+    if "--bench" in sys.argv:
+        bench_packing()
+    else:
+        test_packing()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Pre-tokenized training cache
+Formats and tokenizes the train set once into a memory-mapped Arrow dataset
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+import pyarrow as pa
+from datasets import Dataset, load_from_disk
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../prompts'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '../data'))
+from formatter import TEMPLATE_PATH, format_batch
+
+CACHE_VERSION = 2
+COLUMNS = ["input_ids", "attention_mask", "length", "response_start"]
+
+def _sha256_file(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    """
+    Hash of everything that changes token ids
+
+    Fast tokenizers serialize their full pipeline (vocab, normalizer,
+    post-processor adding BOS/EOS); slow ones fall back to the vocab.
+    """
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        # Truncation/padding are call-time state the backend remembers from the last encode
+        spec = json.loads(backend.to_str())
+        spec.pop("truncation", None)
+        spec.pop("padding", None)
+        spec = json.dumps(spec, sort_keys=True)
+    else:
+        spec = json.dumps(tokenizer.get_vocab(), sort_keys=True)
+    extra = json.dumps({"class": type(tokenizer).__name__,
+                        "special_tokens": tokenizer.special_tokens_map,
+                        "add_bos_token": getattr(tokenizer, "add_bos_token", None),
+                        "add_eos_token": getattr(tokenizer, "add_eos_token", None)},
+                       sort_keys=True, default=str)
+    return hashlib.sha256((spec + extra).encode('utf-8')).hexdigest()
+
+def cache_key(train_file: str, tokenizer, max_len: int) -> str:
+    """Cache directory name: train data, template, tokenizer and max_len all feed the hash"""
+    key = json.dumps({
+        "version": CACHE_VERSION,
+        "data": _sha256_file(train_file),
+        "template": _sha256_file(TEMPLATE_PATH),
+        "tokenizer": tokenizer_fingerprint(tokenizer),
+        "max_len": max_len,
+    }, sort_keys=True)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+def iter_train_items(train_file: str) -> Iterator[Dict]:
+    """Items from a train JSONL or a sharded dataset manifest"""
+    if str(train_file).endswith(".manifest.json"):
+        from create_datasets import iter_sharded_dataset
+        yield from iter_sharded_dataset(train_file)
+        return
+    with open(train_file, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def tokenize_items(items: Iterator[Dict], tokenizer, max_len: int, batch_size: int = 1024) -> pa.Table:
+    """
+    Format and tokenize items in batches into an Arrow table
+
+    Tokenization matches SFTTrainer's own text path (special tokens added,
+    truncated to max_len, no padding). Ids are stored as int32.
+    response_start is the index of the token holding the first character
+    of the output (after "### Response:\n"); it equals length when the
+    response was truncated away entirely.
+    """
+    if not tokenizer.is_fast:
+        raise ValueError("Pre-tokenizing needs a fast tokenizer (character-to-token offsets)")
+    tables = []
+    batch = []
+
+    def flush():
+        texts = format_batch(batch)
+        prompts = format_batch([{**item, "output": ""} for item in batch])
+        encoded = tokenizer(texts, add_special_tokens=True, truncation=True, max_length=max_len, padding=False)
+        starts = []
+        for row, (text, prompt) in enumerate(zip(texts, prompts)):
+            assert text.startswith(prompt), "Output is not the last template field"
+            # Token holding the output's first character (None if truncated away or empty)
+            token = encoded.char_to_token(row, len(prompt)) if len(prompt) < len(text) else None
+            starts.append(len(encoded["input_ids"][row]) if token is None else token)
+        tables.append(pa.table({
+            "input_ids": pa.array(encoded["input_ids"], type=pa.list_(pa.int32())),
+            "attention_mask": pa.array(encoded["attention_mask"], type=pa.list_(pa.int8())),
+            "length": pa.array([len(ids) for ids in encoded["input_ids"]], type=pa.int32()),
+            "response_start": pa.array(starts, type=pa.int32()),
+        }))
+
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            flush()
+            batch = []
+    if batch or not tables:
+        flush()
+    return pa.concat_tables(tables)
+
+def build_cache(train_file: str, tokenizer, cache_dir: str, max_len: int) -> Path:
+    """
+    Tokenize train_file into cache_dir/<key>/ (Arrow files + meta.json)
+
+    Written to a temporary directory and renamed into place, so a crashed
+    build never leaves a cache that looks complete.
+    """
+    key = cache_key(train_file, tokenizer, max_len)
+    final = Path(cache_dir) / key
+    tmp = Path(cache_dir) / f"{key}.tmp-{os.getpid()}"
+    if tmp.exists():
+        shutil.rmtree(tmp)
+
+    start = time.perf_counter()
+    table = tokenize_items(iter_train_items(train_file), tokenizer, max_len)
+    Dataset(table).save_to_disk(str(tmp))
+    lengths = table.column("length").to_pylist()
+    starts = table.column("response_start").to_pylist()
+    meta = {
+        "key": key,
+        "train_file": str(train_file),
+        "template": str(TEMPLATE_PATH),
+        "tokenizer": getattr(tokenizer, "name_or_path", None),
+        "max_len": max_len,
+        "rows": len(lengths),
+        "tokens": sum(lengths),
+        "truncated": sum(1 for n in lengths if n >= max_len),
+        "response_truncated": sum(1 for n, r in zip(lengths, starts) if r >= n),
+        "build_seconds": round(time.perf_counter() - start, 2),
+    }
+    with open(tmp / "meta.json", 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    if final.exists():  # another process finished first; identical by construction
+        shutil.rmtree(tmp)
+    else:
+        os.replace(tmp, final)
+    return final
+
+def load_or_build(train_file: str, tokenizer, cache_dir: str, max_len: int,
+                  rebuild: bool = False) -> Tuple[Dataset, Path, bool]:
+    """
+    Memory-mapped pre-tokenized dataset for train_file
+
+    Returns:
+        (dataset with input_ids/attention_mask/length, cache path, cache hit)
+    """
+    path = Path(cache_dir) / cache_key(train_file, tokenizer, max_len)
+    hit = (path / "meta.json").exists() and not rebuild
+    if not hit:
+        if path.exists():
+            shutil.rmtree(path)
+        path = build_cache(train_file, tokenizer, cache_dir, max_len)
+    return load_from_disk(str(path)), path, hit
+
+def test_pretokenize():
+    """Cached ids match direct tokenization; any input change misses the cache"""
+    import tempfile
+    sys.path.append(os.path.join(os.path.dirname(__file__), '../eval'))
+    from tiny_lm import make_tiny_tokenizer
+    from formatter import format_for_training
+
+    tokenizer = make_tiny_tokenizer()
+    train_file = Path(__file__).parent.parent / "data/train/luanti_train.jsonl"
+    items = list(iter_train_items(train_file))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset, path, hit = load_or_build(train_file, tokenizer, tmp, max_len=512)
+        assert not hit and len(dataset) == len(items)
+        assert dataset.column_names == COLUMNS
+        assert dataset.cache_files, "Dataset is not backed by on-disk Arrow files"
+        for i in (0, 1, len(items) - 1):
+            expected = tokenizer(format_for_training(items[i]), truncation=True, max_length=512)["input_ids"]
+            assert dataset[i]["input_ids"] == expected, f"Row {i} tokenized differently"
+            assert dataset[i]["length"] == len(expected) and sum(dataset[i]["attention_mask"]) == len(expected)
+        assert max(dataset["length"]) <= 512
+
+        again, again_path, hit = load_or_build(train_file, tokenizer, tmp, max_len=512)
+        assert hit and again_path == path, "Second load did not hit the cache"
+
+        assert cache_key(train_file, tokenizer, 1024) != path.name, "max_len not in the cache key"
+        other = make_tiny_tokenizer()
+        other.add_special_tokens({"additional_special_tokens": ["<|end|>"]})
+        assert cache_key(train_file, other, 512) != path.name, "Tokenizer change not in the cache key"
+        subset = Path(tmp) / "subset.jsonl"
+        with open(subset, 'w') as f:
+            f.writelines(json.dumps(item) + '\n' for item in items[:10])
+        small, small_path, _ = load_or_build(subset, tokenizer, tmp, max_len=512)
+        assert small_path != path and small["input_ids"] == dataset[:10]["input_ids"]
+
+    print("✅ Pre-tokenized cache tests passed")
+
+def bench_pretokenize(repeat: int = 20):
+    """Per-launch dataset prep: format + tokenize every time vs loading the cache"""
+    import tempfile
+    sys.path.append(os.path.join(os.path.dirname(__file__), '../eval'))
+    from tiny_lm import make_tiny_tokenizer
+
+    tokenizer = make_tiny_tokenizer()
+    source = Path(__file__).parent.parent / "data/train/luanti_train.jsonl"
+    with tempfile.TemporaryDirectory() as tmp:
+        train_file = Path(tmp) / "train.jsonl"
+        with open(source, 'r') as f:
+            lines = f.readlines()
+        with open(train_file, 'w') as f:
+            f.writelines(lines * repeat)
+        rows = len(lines) * repeat
+
+        start = time.perf_counter()
+        texts = format_batch(iter_train_items(train_file))
+        tokenizer(texts, truncation=True, max_length=2048)
+        uncached = time.perf_counter() - start
+
+        start = time.perf_counter()
+        load_or_build(train_file, tokenizer, f"{tmp}/cache", max_len=2048)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        dataset, _, hit = load_or_build(train_file, tokenizer, f"{tmp}/cache", max_len=2048)
+        total = sum(dataset["length"])
+        cached = time.perf_counter() - start
+        assert hit
+
+    print(f"⏱️  Dataset prep for {rows} rows ({total} tokens, tiny char tokenizer)")
+    print(f"   format + tokenize every launch: {uncached:.2f}s")
+    print(f"   first launch (build cache):     {build:.2f}s")
+    print(f"   later launches (mmap cache):    {cached:.3f}s ({uncached / cached:.0f}x)")
+
+def main():
+    """Build the pre-tokenized cache ahead of training"""
+    parser = argparse.ArgumentParser(description="Pre-tokenize the Luanti train set into an Arrow cache")
+    parser.add_argument("--config", default="training/config.yaml", help="Config YAML (base model, max_len)")
+    parser.add_argument("--train", required=True, help="Training JSONL file or sharded dataset manifest")
+    parser.add_argument("--cache_dir", required=True, help="Directory holding pre-tokenized caches")
+    parser.add_argument("--tokenizer", default=None, help="Tokenizer name or path (default: config base)")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild even if a matching cache exists")
+    args = parser.parse_args()
+
+    import yaml
+    from transformers import AutoTokenizer
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer or config['base'])
+
+    dataset, path, hit = load_or_build(args.train, tokenizer, args.cache_dir, config['max_len'], args.rebuild)
+    with open(path / "meta.json", 'r') as f:
+        meta = json.load(f)
+    print(f"{'✅ Cache hit' if hit else '💾 Cache built'}: {path}")
+    print(f"   {meta['rows']} rows, {meta['tokens']} tokens, {meta['truncated']} truncated at {meta['max_len']}")
+
+if __name__ == "__main__":
+    if "--self_test" in sys.argv:
+        test_pretokenize()
+    elif "--bench" in sys.argv:
+        bench_pretokenize()
+    else:
+        main()
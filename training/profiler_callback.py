@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Step-time and throughput profiling for the QLoRA trainer
+Writes one JSON line per optimizer step (wall time, data wait,
+forward/backward/optimizer split, tokens/sec, peak memory) plus the
+trainer's log records, with optional torch.profiler trace windows
+"""
+
+import json
+import os
+import resource
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import torch
+from transformers import TrainerCallback
+
+def parse_profile_steps(spec: str) -> List[Tuple[int, int]]:
+    """"10-12,500" -> [(10, 12), (500, 500)]: inclusive optimizer-step windows to trace"""
+    windows = []
+    for part in filter(None, (p.strip() for p in (spec or "").split(','))):
+        start, _, end = part.partition('-')
+        windows.append((int(start), int(end or start)))
+    return windows
+
+class StepProfilerCallback(TrainerCallback):
+    """
+    Per-step timing breakdown written to a JSONL metrics file
+
+    Timing comes from callback events plus forward hooks on the model:
+    data_wait runs from the previous step's end to the step's first
+    forward, forward sums the forward passes, backward is the rest of
+    the compute window up to the optimizer, and optimizer runs from
+    on_pre_optimizer_step to on_optimizer_step. With sync_cuda (default)
+    each boundary synchronizes CUDA so the split reflects GPU time, at
+    the cost of a little overlap.
+
+    Record types ("event"): start, step, log, trace, end.
+    """
+
+    def __init__(self, path: str, profile_steps: List[Tuple[int, int]] = (), trace_dir: str = None,
+                 sync_cuda: bool = True):
+        self.path = Path(path)
+        self.profile_steps = list(profile_steps)
+        self.trace_dir = Path(trace_dir) if trace_dir else self.path.parent / "traces"
+        self.sync_cuda = sync_cuda and torch.cuda.is_available()
+        self.file = None
+        self.handles = []
+        self.profiler = None
+        self.profile_window = None
+        self._reset_step()
+        self.last_step_end = None
+
+    def _now(self) -> float:
+        if self.sync_cuda:
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def _reset_step(self):
+        self.first_forward = None
+        self.forward_start = None
+        self.forward_seconds = 0.0
+        self.pre_optimizer = None
+        self.optimizer_seconds = None
+        self.tokens = 0
+        self.padded_tokens = 0
+
+    def _write(self, record: Dict):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def _forward_pre_hook(self, module, args, kwargs):
+        if not module.training:
+            return
+        now = self._now()
+        self.forward_start = now
+        if self.first_forward is None:
+            self.first_forward = now
+        input_ids = kwargs.get("input_ids", args[0] if args else None)
+        mask = kwargs.get("attention_mask")
+        position_ids = kwargs.get("position_ids")
+        if input_ids is not None:
+            self.padded_tokens += input_ids.numel()
+            # 2D masks mark real tokens; packed rows do not (4D masks, labels may skip prompts), but their
+            # position ids restart per example and padding sits at position 0, so a row's real tokens
+            # end at its last position > 0
+            if isinstance(mask, torch.Tensor) and mask.dim() == 2:
+                self.tokens += int(mask.sum())
+            elif position_ids is not None and position_ids.dim() == 2:
+                columns = torch.arange(1, position_ids.shape[1] + 1, device=position_ids.device)
+                self.tokens += int(((position_ids > 0) * columns).amax(dim=1).clamp(min=1).sum())
+            else:
+                self.tokens += input_ids.numel()
+
+    def _forward_hook(self, module, args, kwargs, output):
+        if module.training and self.forward_start is not None:
+            self.forward_seconds += self._now() - self.forward_start
+            self.forward_start = None
+
+    def on_train_begin(self, args, state, control, model=None, **kwargs):
+        if not state.is_world_process_zero:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, 'a')
+        if model is not None:
+            self.handles = [model.register_forward_pre_hook(self._forward_pre_hook, with_kwargs=True),
+                            model.register_forward_hook(self._forward_hook, with_kwargs=True)]
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+        self._write({"event": "start", "time": time.time(), "max_steps": state.max_steps,
+                     "per_device_train_batch_size": args.per_device_train_batch_size,
+                     "gradient_accumulation_steps": args.gradient_accumulation_steps,
+                     "world_size": args.world_size})
+        self.last_step_end = self._now()
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        if self.file is None:
+            return
+        step = state.global_step + 1
+        for start, end in self.profile_steps:
+            if step == start and self.profiler is None:
+                activities = [torch.profiler.ProfilerActivity.CPU]
+                if torch.cuda.is_available():
+                    activities.append(torch.profiler.ProfilerActivity.CUDA)
+                self.profiler = torch.profiler.profile(activities=activities, record_shapes=True,
+                                                       profile_memory=True)
+                self.profiler.__enter__()
+                self.profile_window = (start, end)
+
+    def on_pre_optimizer_step(self, args, state, control, **kwargs):
+        if self.file is not None:
+            self.pre_optimizer = self._now()
+
+    def on_optimizer_step(self, args, state, control, **kwargs):
+        if self.file is not None and self.pre_optimizer is not None:
+            self.optimizer_seconds = self._now() - self.pre_optimizer
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if self.file is None:
+            return
+        now = self._now()
+        wall = now - self.last_step_end
+        compute_start = self.first_forward if self.first_forward is not None else self.last_step_end
+        compute_end = self.pre_optimizer if self.pre_optimizer is not None else now
+
+        if torch.cuda.is_available():
+            peak_mb = torch.cuda.max_memory_allocated() / 2**20
+            torch.cuda.reset_peak_memory_stats()
+        else:
+            peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # process peak RSS (KiB on Linux)
+
+        self._write({
+            "event": "step",
+            "step": state.global_step,
+            "time": time.time(),
+            "wall": wall,
+            "data_wait": compute_start - self.last_step_end,
+            "forward": self.forward_seconds,
+            "backward": max(compute_end - compute_start - self.forward_seconds, 0.0),
+            "optimizer": self.optimizer_seconds,
+            "tokens": self.tokens,
+            "padded_tokens": self.padded_tokens,
+            "tokens_per_sec": self.tokens / wall if wall > 0 else None,
+            "peak_mem_mb": round(peak_mb, 1),
+        })
+
+        if self.profiler is not None and state.global_step >= self.profile_window[1]:
+            self.profiler.__exit__(None, None, None)
+            self.trace_dir.mkdir(parents=True, exist_ok=True)
+            trace = self.trace_dir / f"steps_{self.profile_window[0]}-{self.profile_window[1]}.json"
+            self.profiler.export_chrome_trace(str(trace))
+            self._write({"event": "trace", "steps": list(self.profile_window), "file": str(trace)})
+            self.profiler = None
+
+        self._reset_step()
+        self.last_step_end = self._now()
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        if self.file is not None and logs:
+            self._write({"event": "log", "step": state.global_step, "time": time.time(), **logs})
+
+    def on_train_end(self, args, state, control, **kwargs):
+        if self.file is None:
+            return
+        if self.profiler is not None:
+            self.profiler.__exit__(None, None, None)
+            self.profiler = None
+        self._write({"event": "end", "time": time.time(), "step": state.global_step})
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+        self.file.close()
+        self.file = None
+
+def read_metrics(path: str) -> Dict:
+    """Group a metrics JSONL into {"start", "steps", "logs", "traces", "end"}; a torn last line is skipped"""
+    metrics = {"start": None, "steps": [], "logs": [], "traces": [], "end": None}
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            event = record.get("event")
+            if event in ("start", "end"):
+                if event == "start" and metrics["start"] is not None:
+                    metrics = {"start": None, "steps": [], "logs": [], "traces": [], "end": None}  # new run appended
+                metrics[event] = record
+            elif event in ("step", "log", "trace"):
+                metrics[event + "s"].append(record)
+    return metrics
+
+def test_profiler_callback():
+    """A short CPU run writes one step record per optimizer step and a trace window"""
+    import tempfile
+    sys.path.append(os.path.join(os.path.dirname(__file__), '../eval'))
+    from tiny_lm import make_tiny_model, make_tiny_tokenizer
+    from transformers import DataCollatorForLanguageModeling, Trainer, TrainingArguments
+
+    tokenizer = make_tiny_tokenizer()
+    model = make_tiny_model(tokenizer)
+    texts = [f"minetest.register_node('mymod:n{i}', {{tiles = {{'x.png'}}}})" * (1 + i % 3) for i in range(16)]
+    dataset = [{"input_ids": ids} for ids in tokenizer(texts)["input_ids"]]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        callback = StepProfilerCallback(f"{tmp}/metrics.jsonl", profile_steps=parse_profile_steps("2-3"))
+        trainer = Trainer(
+            model=model,
+            args=TrainingArguments(output_dir=tmp, per_device_train_batch_size=2, gradient_accumulation_steps=2,
+                                   max_steps=4, logging_steps=2, save_strategy="no", report_to=[],
+                                   use_cpu=True, seed=3407, disable_tqdm=True),
+            train_dataset=dataset,
+            data_collator=DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False),
+            callbacks=[callback],
+        )
+        trainer.train()
+
+        metrics = read_metrics(f"{tmp}/metrics.jsonl")
+        steps = metrics["steps"]
+        assert [s["step"] for s in steps] == [1, 2, 3, 4], steps
+        for s in steps:
+            assert s["forward"] > 0 and s["backward"] > 0 and s["optimizer"] is not None
+            assert s["forward"] + s["backward"] + s["optimizer"] + s["data_wait"] <= s["wall"] * 1.05
+            assert 0 < s["tokens"] <= s["padded_tokens"] and s["tokens_per_sec"] > 0
+        assert sum(s["tokens"] for s in steps) == sum(len(d["input_ids"]) for d in dataset)
+        assert any("loss" in log for log in metrics["logs"]), "Loss logs not recorded"
+        assert metrics["end"]["step"] == 4
+        assert len(metrics["traces"]) == 1 and Path(metrics["traces"][0]["file"]).exists()
+        assert not model._forward_pre_hooks, "Hooks left on the model"
+
+    # Packed completion-only rows: every real token counts, not just the labelled ones
+    from datasets import Dataset
+    from packing import PackedCollator, pack_dataset
+    encoded = [d["input_ids"] for d in dataset]
+    packed = pack_dataset(Dataset.from_dict({"input_ids": encoded, "length": [len(ids) for ids in encoded],
+                                             "response_start": [len(ids) // 2 for ids in encoded]}), 256)
+    batch = PackedCollator(tokenizer.pad_token_id, completion_only=True)(list(packed))
+    callback._reset_step()
+    model.train()
+    callback._forward_pre_hook(model, (), batch)
+    assert callback.tokens == sum(len(ids) for ids in encoded), (callback.tokens, sum(map(len, encoded)))
+    assert callback.padded_tokens == batch["input_ids"].numel()
+
+    assert parse_profile_steps("10-12, 500") == [(10, 12), (500, 500)]
+    print("✅ Profiler callback tests passed")
+
+if __name__ == "__main__":
+    test_profiler_callback()
@@ -17,12 +17,18 @@ import torch
 # Add prompts to path for formatter
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '../prompts'))
-from formatter import format_for_training
+from formatter import format_batch
+sys.path.append(os.path.dirname(__file__))
 
 from unsloth import FastLanguageModel
 from datasets import Dataset
 from trl import SFTTrainer
-from transformers import TrainingArguments, BitsAndBytesConfig
+from transformers import TrainingArguments, BitsAndBytesConfig, DataCollatorForLanguageModeling
+from pretokenize import load_or_build
+from packing import PackedCollator, pack_dataset, packing_stats, sliding_window_of
+from length_sampler import LengthGroupedSampler, compare_orders
+from completion_only import CompletionOnlyCollator, label_fraction
+from profiler_callback import StepProfilerCallback, parse_profile_steps
 import wandb
 
 # ==== CRITICAL FIX: Force eager + no compilers ====
@@ -40,13 +46,36 @@ DT = torch.float16
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+class LengthGroupedSFTTrainer(SFTTrainer):
+    """SFTTrainer whose train sampler groups rows of similar token length"""
+    
+    def __init__(self, *args, lengths=None, **kwargs):
+        self.lengths = lengths
+        super().__init__(*args, **kwargs)
+    
+    def _get_train_sampler(self, *args, **kwargs):
+        return LengthGroupedSampler(self.lengths, self.args.per_device_train_batch_size,
+                                    seed=self.args.data_seed or self.args.seed)
+
 class LuantiQLoRATrainer:
     """QLoRA trainer with exact specifications"""
     
-    def __init__(self, config_path: str):
+    def __init__(self, config_path: str, token_cache: str = None, pack: bool = False,
+                 group_by_length: bool = False, completion_only: bool = False, profile_steps: str = None):
         """Load configuration exactly as specified"""
         with open(config_path, 'r') as f:
             self.config = yaml.safe_load(f)
+        self.token_cache = token_cache
+        self.pack = pack
+        self.group_by_length = group_by_length
+        self.completion_only = completion_only
+        self.profile_steps = parse_profile_steps(profile_steps)
+        self.lengths = None
+        if (pack or group_by_length or completion_only) and not token_cache:
+            raise ValueError("Packing, length grouping and completion-only loss need the pre-tokenized dataset; "
+                             "pass --token_cache")
+        if pack and group_by_length:
+            raise ValueError("Packed rows are already max_len long; use --pack or --group_by_length, not both")
         
         logger.info("📋 Configuration loaded:")
         logger.info(f"   Base model: {self.config['base']}")
@@ -158,13 +187,10 @@ class LuantiQLoRATrainer:
         logger.info(f"📚 Loading training dataset: {train_file}")
         
         # Load JSONL data
-        data = []
         with open(train_file, 'r') as f:
-            for line in f:
-                item = json.loads(line)
-                # Format using exact IIR template
-                formatted_text = format_for_training(item)
-                data.append({"text": formatted_text})
+            items = [json.loads(line) for line in f]
+        # Format using exact IIR template
+        data = [{"text": text} for text in format_batch(items)]
         
         # Convert to HuggingFace dataset
         dataset = Dataset.from_list(data)
@@ -172,6 +198,39 @@ class LuantiQLoRATrainer:
         logger.info(f"✅ Dataset loaded: {len(dataset)} items")
         return dataset
     
+    def load_tokenized_dataset(self, train_file: str, tokenizer):
+        """Load the pre-tokenized Arrow cache for train_file, building it on first use"""
+        logger.info(f"📚 Loading pre-tokenized dataset: {train_file} (cache: {self.token_cache})")
+        
+        dataset, path, hit = load_or_build(train_file, tokenizer, self.token_cache, self.config['max_len'])
+        logger.info(f"✅ Dataset {'loaded from' if hit else 'tokenized into'} {path}: {len(dataset)} items")
+        if self.completion_only:
+            logger.info(f"🎯 Completion-only loss: {label_fraction(dataset):.1%} of tokens carry labels")
+        else:
+            dataset = dataset.remove_columns("response_start")
+        if self.pack:
+            stats = packing_stats(dataset["length"], self.config['max_len'],
+                                  self.config['trainer']['per_device_train_batch_size'])
+            dataset = pack_dataset(dataset, self.config['max_len'])
+            logger.info(f"📦 Packed {stats['examples']} examples into {stats['rows_packed']} rows: "
+                        f"padding efficiency {stats['efficiency_unpacked']:.1%} → {stats['efficiency_packed']:.1%}, "
+                        f"max_len budget used {stats['budget_unpacked']:.1%} → {stats['budget_packed']:.1%}")
+            return dataset
+        self.lengths = dataset["length"]
+        # remove_unused_columns=False passes every column on, so keep only what the collator reads
+        return dataset.remove_columns("length")
+    
+    def make_collator(self, tokenizer, model=None):
+        """Collator for the pre-tokenized dataset"""
+        if self.pack:
+            # gpt-oss alternates sliding-window and full layers; packed masks need both
+            sliding_window = sliding_window_of(model.config) if model is not None else None
+            return PackedCollator(tokenizer.pad_token_id, mask_dtype=DT, completion_only=self.completion_only,
+                                  sliding_window=sliding_window)
+        if self.completion_only:
+            return CompletionOnlyCollator(tokenizer.pad_token_id)
+        return DataCollatorForLanguageModeling(tokenizer=tokenizer, mlm=False)
+    
     def setup_training_args(self, output_dir: str):
         """Setup training arguments from config"""
         trainer_config = self.config['trainer']
@@ -231,26 +290,51 @@ class LuantiQLoRATrainer:
         model = self.setup_lora(model)
         
         # Load dataset
-        dataset = self.load_dataset(train_file)
+        if self.token_cache:
+            dataset = self.load_tokenized_dataset(train_file, tokenizer)
+            sft_kwargs = {
+                "dataset_kwargs": {"skip_prepare_dataset": True},
+                "data_collator": self.make_collator(tokenizer, model),
+            }
+        else:
+            dataset = self.load_dataset(train_file)
+            sft_kwargs = {"dataset_text_field": "text"}
         
         # Setup training arguments
         training_args = self.setup_training_args(str(output_path))
         
+        trainer_cls = SFTTrainer
+        if self.group_by_length:
+            trainer_cls = LengthGroupedSFTTrainer
+            sft_kwargs["lengths"] = self.lengths
+            stats = compare_orders(self.lengths, training_args.per_device_train_batch_size,
+                                   training_args.gradient_accumulation_steps, training_args.data_seed)
+            logger.info(f"📏 Length-grouped sampling: {stats['grouped']['tokens_per_step']:.0f} tokens/step, "
+                        f"padding ratio {stats['random']['padding_ratio']:.1%} → "
+                        f"{stats['grouped']['padding_ratio']:.1%}")
+        
+        # Per-step timing/throughput metrics (read by scripts/collect_training_stats.py)
+        profiler = StepProfilerCallback(output_path / "metrics.jsonl", self.profile_steps)
+        
         # Create trainer
-        trainer = SFTTrainer(
+        trainer = trainer_cls(
             model=model,
             tokenizer=tokenizer,
             train_dataset=dataset,
             args=training_args,
-            dataset_text_field="text",
             max_seq_length=self.config['max_len'],
             packing=False,  # Keep sequences separate
+            callbacks=[profiler],
+            **sft_kwargs,
         )
         
         logger.info("🚀 Starting QLoRA training...")
         logger.info(f"   Effective batch size: {training_args.per_device_train_batch_size * training_args.gradient_accumulation_steps}")
         logger.info(f"   Total steps: {training_args.max_steps}")
         logger.info(f"   Save every: {training_args.save_steps} steps")
+        logger.info(f"   Step metrics: {profiler.path}")
+        if self.profile_steps:
+            logger.info(f"   Profiler traces: steps {self.profile_steps} → {profiler.trace_dir}")
         
         # Train
         trainer.train()
@@ -269,6 +353,21 @@ def main():
     parser.add_argument("--config", required=True, help="Config YAML file")
     parser.add_argument("--train", required=True, help="Training JSONL file")
     parser.add_argument("--out", required=True, help="Output directory for adapters")
+    parser.add_argument("--token_cache", default=None,
+                        help="Directory of pre-tokenized Arrow caches (see pretokenize.py); tokenizes once per "
+                             "train file/template/tokenizer instead of on every launch")
+    parser.add_argument("--group_by_length", action="store_true",
+                        help="Micro-batches of similar token length (sorted mega-batches, shuffled buckets); "
+                             "needs --token_cache")
+    parser.add_argument("--completion_only", action="store_true",
+                        help="Loss on the response only (everything before '### Response:' masked); "
+                             "needs --token_cache")
+    parser.add_argument("--pack", action="store_true",
+                        help="Pack examples into max_len rows (first-fit-decreasing, no cross-example attention); "
+                             "needs --token_cache")
+    parser.add_argument("--profile_steps", default=None,
+                        help="Optimizer steps to capture with torch.profiler, e.g. '50-52,1000'; chrome traces "
+                             "go to <out>/traces/")
     
     args = parser.parse_args()
     
@@ -279,7 +378,8 @@ def main():
         raise FileNotFoundError(f"Training file not found: {args.train}")
     
     # Initialize trainer
-    trainer = LuantiQLoRATrainer(args.config)
+    trainer = LuantiQLoRATrainer(args.config, args.token_cache, args.pack, args.group_by_length,
+                                 args.completion_only, args.profile_steps)
     
     # Execute training
     trainer.train(args.train, args.out)
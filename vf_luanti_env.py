@@ -6,22 +6,62 @@ across scaffold, repair, refactor, and documentation tasks.
 """
 
 import json
+import mmap
+import os
 import re
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+from concurrent.futures import Executor, ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass
 
 from verifiers import SingleTurnEnv, Rubric
 
+# Same import path as eval/static_checks.py, so the pattern registry is one module per process
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "eval"))
+from patterns import compile_all, compile_pattern, intern_patterns
+from lua_lexer import LuaSummary, analyze_lua
 
-@dataclass
+# Rubric patterns, compiled once at import
+_CODE_PATTERNS = tuple(compile_pattern(p, re.DOTALL | re.IGNORECASE) for p in (
+    r'```(?:lua)?\n(.*?)```',
+    r'minetest\.register_\w+\([^}]+}\)',
+    r'function\s+\w+.*?end'
+))
+_REGISTER_CALLS = {"register_node", "register_tool", "register_craftitem", "register_entity", "register_craft"}
+_VALID_PROPS = {"description", "tiles", "groups", "light_source", "drop", "sounds", "paramtype"}
+
+# Prompt keyword -> pattern the response is expected to contain
+_PROMPT_HINTS = (
+    ("light", "light_source"),
+    ("node", r"minetest\.register_node"),
+    ("tool", r"minetest\.register_tool"),
+    ("craft", r"minetest\.register_craft"),
+)
+
+
+@dataclass(frozen=True, slots=True)
 class LuantiTask:
-    """Single Luanti coding task"""
+    """
+    Single Luanti coding task
+    
+    Immutable and slotted. Pattern lists are stored as interned tuples, so
+    tasks with the same patterns share one tuple (and one set of compiled
+    regexes) across the pool and across forked workers.
+    """
     id: str
     prompt: str
-    expected_patterns: List[str] = None
-    forbidden_patterns: List[str] = None
+    expected_patterns: Tuple[str, ...] = ()
+    forbidden_patterns: Tuple[str, ...] = ()
     task_type: str = "scaffold"  # scaffold, repair, refactor, documentation
+    
+    def __post_init__(self):
+        object.__setattr__(self, "expected_patterns", intern_patterns(self.expected_patterns))
+        object.__setattr__(self, "forbidden_patterns", intern_patterns(self.forbidden_patterns))
+        object.__setattr__(self, "task_type", sys.intern(self.task_type))
 
 
 class LuantiRubric(Rubric):
@@ -32,19 +72,53 @@ class LuantiRubric(Rubric):
         
     def evaluate(self, task: LuantiTask, response: str) -> Dict[str, Any]:
         """Evaluate a Luanti code generation response"""
-        score = 0.0
-        details = {}
-        
         # Extract just the code part (remove prompt echo)
         code = self._extract_code(response)
         
+        # One lexer pass; every structural check reads this summary
+        return self._score(task, code, analyze_lua(code))
+    
+    def evaluate_batch(self, tasks: List[LuantiTask], responses: List[str],
+                       pool: Executor = None, chunk_size: int = 64) -> List[Dict[str, Any]]:
+        """
+        Evaluate many (task, response) pairs; same per-sample dicts as evaluate()
+        
+        Identical responses are extracted and lexed once. With a pool, the
+        distinct responses are scored across its workers in chunks.
+        """
+        if len(tasks) != len(responses):
+            raise ValueError(f"Got {len(tasks)} tasks for {len(responses)} responses")
+        
+        # Group samples by response so shared work runs once per distinct text
+        groups: Dict[str, List[int]] = {}
+        for i, response in enumerate(responses):
+            groups.setdefault(response, []).append(i)
+        work = [(response, [tasks[i] for i in indices]) for response, indices in groups.items()]
+        
+        if pool is None or len(work) <= chunk_size:
+            scored = _evaluate_groups(work, self)
+        else:
+            chunks = [work[i:i + chunk_size] for i in range(0, len(work), chunk_size)]
+            scored = [r for part in pool.map(_evaluate_groups, chunks) for r in part]
+        
+        results = [None] * len(responses)
+        for indices, group_results in zip(groups.values(), scored):
+            for i, result in zip(indices, group_results):
+                results[i] = result
+        return results
+    
+    def _score(self, task: LuantiTask, code: str, summary: LuaSummary) -> Dict[str, Any]:
+        """Weighted rubric score for extracted code and its lexer summary"""
+        score = 0.0
+        details = {}
+        
         # 1. Syntax validation (25 points)
-        syntax_score, syntax_details = self._check_syntax(code)
+        syntax_score, syntax_details = self._check_syntax(summary)
         score += syntax_score * 0.25
         details["syntax"] = syntax_details
         
         # 2. API correctness (35 points)  
-        api_score, api_details = self._check_api_usage(code, task)
+        api_score, api_details = self._check_api_usage(summary, task)
         score += api_score * 0.35
         details["api_usage"] = api_details
         
@@ -54,7 +128,7 @@ class LuantiRubric(Rubric):
         details["task_completion"] = task_details
         
         # 4. Code quality (15 points)
-        quality_score, quality_details = self._check_code_quality(code)
+        quality_score, quality_details = self._check_code_quality(code, summary)
         score += quality_score * 0.15
         details["code_quality"] = quality_details
         
@@ -70,61 +144,52 @@ class LuantiRubric(Rubric):
             response = response.split("### Response:")[-1]
         
         # Look for code blocks or minetest patterns
-        lua_patterns = [
-            r'```(?:lua)?\n(.*?)```',
-            r'minetest\.register_\w+\([^}]+}\)',
-            r'function\s+\w+.*?end'
-        ]
-        
-        for pattern in lua_patterns:
-            matches = re.findall(pattern, response, re.DOTALL | re.IGNORECASE)
+        for pattern in _CODE_PATTERNS:
+            matches = pattern.findall(response)
             if matches:
                 return matches[0].strip()
         
         return response.strip()
     
-    def _check_syntax(self, code: str) -> tuple[float, dict]:
+    def _check_syntax(self, summary: LuaSummary) -> tuple[float, dict]:
         """Check basic Lua/Luanti syntax"""
         details = {"valid_lua": False, "balanced_braces": False, "no_syntax_errors": False}
         score = 0.0
         
         # Basic Lua patterns
-        if re.search(r'minetest\.(register_\w+|\w+)', code):
+        if summary.api_calls:
             details["valid_lua"] = True
             score += 0.4
         
-        # Balanced braces/parentheses
-        if self._check_balanced_braces(code):
+        # Balanced braces/parentheses (outside strings and comments)
+        if summary.balanced:
             details["balanced_braces"] = True
             score += 0.3
         
         # No obvious syntax errors
-        common_errors = [r'\{\s*,', r',\s*}', r'=\s*,', r',,']
-        if not any(re.search(err, code) for err in common_errors):
+        if not summary.error_pairs:
             details["no_syntax_errors"] = True
             score += 0.3
             
         return score, details
     
-    def _check_api_usage(self, code: str, task: LuantiTask) -> tuple[float, dict]:
+    def _check_api_usage(self, summary: LuaSummary, task: LuantiTask) -> tuple[float, dict]:
         """Check correct Minetest API usage"""
         details = {"correct_register_call": False, "valid_properties": False, "proper_structure": False}
         score = 0.0
         
         # Correct registration call
-        if re.search(r'minetest\.register_(node|tool|craftitem|entity|craft)\s*\(', code):
+        if _REGISTER_CALLS.intersection(summary.registrations):
             details["correct_register_call"] = True
             score += 0.4
         
         # Valid properties (check for common ones)
-        valid_props = ["description", "tiles", "groups", "light_source", "drop", "sounds", "paramtype"]
-        found_props = sum(1 for prop in valid_props if prop in code)
-        if found_props >= 2:
+        if len(_VALID_PROPS & summary.table_keys) >= 2:
             details["valid_properties"] = True
             score += 0.4
         
         # Proper table structure
-        if re.search(r'\{[^{}]*description\s*=.*?\}', code, re.DOTALL):
+        if "description" in summary.table_keys and summary.balanced:
             details["proper_structure"] = True
             score += 0.2
             
@@ -137,14 +202,16 @@ class LuantiRubric(Rubric):
         
         # Check expected patterns if provided
         if task.expected_patterns:
-            matches = sum(1 for pattern in task.expected_patterns if re.search(pattern, code, re.IGNORECASE))
+            matches = sum(1 for pattern in compile_all(task.expected_patterns, re.IGNORECASE)
+                          if pattern.search(code))
             if matches > 0:
                 details["addresses_prompt"] = True
                 score += 0.6
                 
         # Check for forbidden patterns  
         if task.forbidden_patterns:
-            violations = sum(1 for pattern in task.forbidden_patterns if re.search(pattern, code, re.IGNORECASE))
+            violations = sum(1 for pattern in compile_all(task.forbidden_patterns, re.IGNORECASE)
+                             if pattern.search(code))
             if violations == 0:
                 details["includes_required_elements"] = True
                 score += 0.4
@@ -154,18 +221,18 @@ class LuantiRubric(Rubric):
             
         return score, details
     
-    def _check_code_quality(self, code: str) -> tuple[float, dict]:
+    def _check_code_quality(self, code: str, summary: LuaSummary) -> tuple[float, dict]:
         """Check general code quality"""
         details = {"readable": False, "consistent_style": False, "appropriate_length": False}
         score = 0.0
         
         # Readable (has proper spacing, not too condensed)
-        if len(code.split('\n')) > 1 and '=' in code:
+        if summary.lines > 1 and summary.assignments:
             details["readable"] = True
             score += 0.4
             
         # Consistent style (proper indentation hints)
-        if '    ' in code or '\t' in code:  # Some indentation present
+        if summary.indented_lines:  # Some indentation present
             details["consistent_style"] = True
             score += 0.3
             
@@ -175,55 +242,119 @@ class LuantiRubric(Rubric):
             score += 0.3
             
         return score, details
+
+
+class LazyTaskStore(Sequence):
+    """
+    Read-only task list backed by a memory-mapped JSONL file
     
-    def _check_balanced_braces(self, code: str) -> bool:
-        """Check if braces/parentheses are balanced"""
-        stack = []
-        pairs = {'(': ')', '{': '}', '[': ']'}
-        
-        for char in code:
-            if char in pairs:
-                stack.append(pairs[char])
-            elif char in pairs.values():
-                if not stack or stack.pop() != char:
-                    return False
+    A byte-offset index of the usable rows (non-blank, valid JSON) is built
+    once and cached next to the file as <file>.idx, keyed by the file's
+    size and mtime. Opening a store only loads that index; LuantiTask
+    objects are parsed on access, by index or slice.
+    """
+    
+    _HEADER = struct.Struct("<8sQQ")  # magic, file size, mtime_ns
+    _MAGIC = b"LTIDX001"
+    
+    def __init__(self, path: str, build: Callable[[int, dict], LuantiTask]):
+        self.path = Path(path)
+        self.build = build
+        self._file = open(self.path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._index = self._load_index()  # flat [offset, line number, ...]
+    
+    def _index_path(self) -> Path:
+        return self.path.with_name(self.path.name + ".idx")
+    
+    def _load_index(self) -> array:
+        st = self.path.stat()
+        index_path = self._index_path()
+        try:
+            with open(index_path, 'rb') as f:
+                magic, size, mtime_ns = self._HEADER.unpack(f.read(self._HEADER.size))
+                if (magic, size, mtime_ns) == (self._MAGIC, st.st_size, st.st_mtime_ns):
+                    index = array('Q')
+                    index.frombytes(f.read())
+                    return index
+        except (OSError, struct.error, ValueError):
+            pass
         
-        return len(stack) == 0
+        index = self._build_index()
+        try:
+            tmp = index_path.with_name(f"{index_path.name}.tmp{os.getpid()}")
+            with open(tmp, 'wb') as f:
+                f.write(self._HEADER.pack(self._MAGIC, st.st_size, st.st_mtime_ns))
+                f.write(index.tobytes())
+            os.replace(tmp, index_path)
+        except OSError:
+            pass  # read-only dataset dir: keep the index in memory only
+        return index
+    
+    def _build_index(self) -> array:
+        """One pass over the file: offsets of rows that parse as JSON"""
+        index = array('Q')
+        offset = 0
+        for lineno, line in enumerate(iter(self._data.readline, b"") if self._data else ()):
+            if line.strip():
+                try:
+                    json.loads(line)
+                    index.extend((offset, lineno))
+                except json.JSONDecodeError:
+                    pass
+            offset += len(line)
+        return index
+    
+    def __len__(self) -> int:
+        return len(self._index) // 2
+    
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("task index out of range")
+        offset, lineno = self._index[2 * i], self._index[2 * i + 1]
+        end = self._data.find(b"\n", offset)
+        return self.build(lineno, json.loads(self._data[offset:end if end != -1 else len(self._data)]))
+    
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
 
 
 class LuantiEnvironment(SingleTurnEnv):
     """Luanti code generation environment"""
     
-    def __init__(self, dataset_path: Optional[str] = None):
+    def __init__(self, dataset_path: Optional[str] = None, workers: int = None):
         self.dataset_path = dataset_path or "data/eval/luanti_eval.jsonl"
         self.rubric = LuantiRubric()
+        self.workers = workers if workers is not None else int(os.environ.get("LUANTI_SCORE_WORKERS", "1"))
+        self._pool = None
         self._load_dataset()
     
     def _load_dataset(self):
-        """Load the Luanti evaluation dataset"""
-        self.tasks = []
-        
+        """Open the Luanti evaluation dataset as a lazy task store"""
         dataset_file = Path(self.dataset_path)
         if not dataset_file.exists():
             # Create a small sample dataset for testing
             self.tasks = self._create_sample_tasks()
             return
         
-        with open(dataset_file, 'r') as f:
-            for i, line in enumerate(f):
-                if not line.strip():
-                    continue
-                try:
-                    data = json.loads(line)
-                    task = LuantiTask(
-                        id=f"item_{i}",
-                        prompt=data.get("prompt", data.get("instruction", "")),
-                        expected_patterns=self._extract_expected_patterns(data),
-                        task_type=self._classify_task(data.get("prompt", data.get("instruction", "")))
-                    )
-                    self.tasks.append(task)
-                except json.JSONDecodeError:
-                    continue
+        self.tasks = LazyTaskStore(dataset_file, self._task_from_row)
+    
+    def _task_from_row(self, lineno: int, data: dict) -> LuantiTask:
+        """Build the task for one dataset row (lineno keeps ids stable across blank/bad lines)"""
+        prompt = data.get("prompt", data.get("instruction", ""))
+        return LuantiTask(
+            id=f"item_{lineno}",
+            prompt=prompt,
+            expected_patterns=self._extract_expected_patterns(data),
+            task_type=self._classify_task(prompt)
+        )
     
     def _create_sample_tasks(self) -> List[LuantiTask]:
         """Create sample tasks for testing"""
@@ -242,7 +373,7 @@ class LuantiEnvironment(SingleTurnEnv):
             )
         ]
     
-    def _extract_expected_patterns(self, data: dict) -> List[str]:
+    def _extract_expected_patterns(self, data: dict) -> Tuple[str, ...]:
         """Extract expected patterns from dataset item"""
         patterns = []
         
@@ -254,16 +385,9 @@ class LuantiEnvironment(SingleTurnEnv):
             
         # Infer from prompt
         prompt = data.get("prompt", data.get("instruction", "")).lower()
-        if "light" in prompt:
-            patterns.append("light_source")
-        if "node" in prompt:
-            patterns.append(r"minetest\.register_node")
-        if "tool" in prompt:
-            patterns.append(r"minetest\.register_tool")
-        if "craft" in prompt:
-            patterns.append(r"minetest\.register_craft")
+        patterns.extend(pattern for keyword, pattern in _PROMPT_HINTS if keyword in prompt)
             
-        return patterns
+        return intern_patterns(patterns)
     
     def _classify_task(self, prompt: str) -> str:
         """Classify the task type based on prompt"""
@@ -277,15 +401,196 @@ class LuantiEnvironment(SingleTurnEnv):
         else:
             return "scaffold"
     
-    def get_tasks(self) -> List[LuantiTask]:
-        """Get all tasks"""
+    def get_tasks(self) -> Sequence:
+        """Get all tasks (materialized on access)"""
         return self.tasks
     
     def evaluate_response(self, task: LuantiTask, response: str) -> Dict[str, Any]:
         """Evaluate a response to a task"""
         return self.rubric.evaluate(task, response)
+    
+    def evaluate_batch(self, tasks: List[LuantiTask], responses: List[str]) -> List[Dict[str, Any]]:
+        """
+        Evaluate many responses; the worker pool (workers > 1) is started on
+        first use and reused until close()
+        """
+        if self.workers > 1 and self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self.rubric.evaluate_batch(tasks, responses, pool=self._pool)
+    
+    def close(self):
+        """Shut down the batch scoring pool and release the dataset mapping"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if isinstance(self.tasks, LazyTaskStore):
+            self.tasks.close()
+
+
+def _evaluate_groups(work: List[Tuple[str, List[LuantiTask]]],
+                     rubric: "LuantiRubric" = None) -> List[List[Dict[str, Any]]]:
+    """Score (response, tasks) groups: extract and lex each response once, then score per task"""
+    rubric = rubric or _worker_rubric()
+    results = []
+    for response, tasks in work:
+        code = rubric._extract_code(response)
+        summary = analyze_lua(code)
+        results.append([rubric._score(task, code, summary) for task in tasks])
+    return results
+
+_rubric = None
+
+def _worker_rubric() -> "LuantiRubric":
+    """Per-process rubric for pool workers"""
+    global _rubric
+    if _rubric is None:
+        _rubric = LuantiRubric()
+    return _rubric
 
 
 def load_environment() -> LuantiEnvironment:
     """Entry point for verifiers framework"""
-    return LuantiEnvironment()
\ No newline at end of file
+    return LuantiEnvironment()
+
+
+def bench_evaluate_batch(batch_sizes=(64, 512, 4096), worker_counts=(1, 2, 4), duplicate_rate: float = 0.5):
+    """
+    Samples/sec of evaluate_batch vs per-sample evaluate_response on CPU
+    
+    Responses are eval references with a sample id appended; duplicate_rate
+    of them repeat an earlier response, as with k samples at low temperature.
+    """
+    import random
+    import time
+    
+    env = LuantiEnvironment()
+    with open(env.dataset_path, 'r') as f:
+        outputs = [json.loads(line)["output"] for line in f if line.strip()]
+    rng = random.Random(0)
+    
+    print(f"⏱️  evaluate_batch throughput ({duplicate_rate:.0%} duplicate responses, {os.cpu_count()} CPUs)")
+    for batch_size in batch_sizes:
+        tasks = [env.tasks[i % len(env.tasks)] for i in range(batch_size)]
+        responses = []
+        for i in range(batch_size):
+            if responses and rng.random() < duplicate_rate:
+                responses.append(rng.choice(responses))
+            else:
+                responses.append(f"### Response:\n{outputs[i % len(outputs)]}\n-- sample {i}")
+        
+        start = time.perf_counter()
+        reference = [env.evaluate_response(t, r) for t, r in zip(tasks, responses)]
+        line = f"   batch {batch_size:>5}: single {batch_size / (time.perf_counter() - start):8.0f}/s"
+        
+        for workers in worker_counts:
+            batch_env = LuantiEnvironment(workers=workers)
+            batch_env.evaluate_batch(tasks[:1], responses[:1])  # start the pool outside the timing
+            start = time.perf_counter()
+            batched = batch_env.evaluate_batch(tasks, responses)
+            elapsed = time.perf_counter() - start
+            batch_env.close()
+            assert batched == reference, "Batch scores differ from evaluate_response"
+            line += f" | {workers}w {batch_size / elapsed:8.0f}/s"
+        print(line)
+
+
+def bench_task_store(rows: int = 200_000):
+    """
+    Startup time of the lazy store (cold index build, warm index load) vs
+    eager parsing, on a synthetic task pool built from the eval set
+    """
+    import tempfile
+    import time
+    
+    with open("data/eval/luanti_eval.jsonl", 'r') as f:
+        lines = [line for line in f if line.strip()]
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        pool_file = Path(tmp) / "pool.jsonl"
+        with open(pool_file, 'w') as f:
+            for i in range(rows):
+                f.write(lines[i % len(lines)])
+                if i % 1000 == 0:
+                    f.write("\n{not json\n")  # blank and broken rows are skipped, as before
+        
+        env = LuantiEnvironment.__new__(LuantiEnvironment)
+        start = time.perf_counter()
+        eager = []
+        with open(pool_file, 'r') as f:
+            for i, line in enumerate(f):
+                if not line.strip():
+                    continue
+                try:
+                    eager.append(env._task_from_row(i, json.loads(line)))
+                except json.JSONDecodeError:
+                    continue
+        eager_time = time.perf_counter() - start
+        
+        timings = {}
+        for label in ("cold", "warm"):
+            start = time.perf_counter()
+            store = LazyTaskStore(pool_file, env._task_from_row)
+            timings[label] = time.perf_counter() - start
+            assert len(store) == len(eager) and store[-1] == eager[-1] and store[5:8] == eager[5:8]
+            if label == "warm":
+                assert store[::9973] == eager[::9973], "Lazy tasks differ from eager parsing"
+            store.close()
+        
+        file_mb = pool_file.stat().st_size / 1e6
+        index_mb = (Path(tmp) / "pool.jsonl.idx").stat().st_size / 1e6
+    
+    print(f"⏱️  Task pool startup, {len(eager)} tasks ({file_mb:.0f} MB JSONL, {index_mb:.1f} MB index)")
+    print(f"   eager parse:       {eager_time * 1000:8.1f} ms")
+    print(f"   lazy, cold index:  {timings['cold'] * 1000:8.1f} ms")
+    print(f"   lazy, warm index:  {timings['warm'] * 1000:8.1f} ms")
+
+
+def bench_task_memory(tasks: int = 1_000_000):
+    """
+    tracemalloc footprint of a synthetic task pool: slotted tasks with
+    interned pattern tuples vs the previous dataclass with per-task lists
+    """
+    import gc
+    import time
+    import tracemalloc
+    from dataclasses import make_dataclass
+    
+    # The pre-slots task type, for comparison
+    ListTask = make_dataclass("ListTask", [("id", str), ("prompt", str),
+                                           ("expected_patterns", list, None),
+                                           ("forbidden_patterns", list, None),
+                                           ("task_type", str, "scaffold")])
+    
+    with open("data/eval/luanti_eval.jsonl", 'r') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    env = LuantiEnvironment.__new__(LuantiEnvironment)
+    
+    def build_lists(i, data):
+        prompt = data["instruction"] + f" (variant {i})"
+        return ListTask(id=f"item_{i}", prompt=prompt,
+                        expected_patterns=list(env._extract_expected_patterns(data)),
+                        task_type=env._classify_task(prompt))
+    
+    def build_slotted(i, data):
+        return env._task_from_row(i, dict(data, instruction=data["instruction"] + f" (variant {i})"))
+    
+    print(f"📦 Task pool memory, {tasks} synthetic tasks")
+    for label, build in (("dataclass + lists", build_lists), ("slots + interned", build_slotted)):
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        pool = [build(i, rows[i % len(rows)]) for i in range(tasks)]
+        elapsed = time.perf_counter() - start
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"   {label:<18} {current / 1e6:8.1f} MB ({current / tasks:.0f} B/task, built in {elapsed:.1f}s)")
+        del pool
+
+
+if __name__ == "__main__":
+    if "--bench_memory" in sys.argv:
+        bench_task_memory()
+    elif "--bench_store" in sys.argv:
+        bench_task_store()
+    else:
+        bench_evaluate_batch()